@@ -36,14 +36,14 @@ class epsJob():
 
     # Import local functions
     from ._epsJobGen import initConnection, createJobDirTree, writeInp
-    from ._epsRun import runJobs, tidyJobs
-    from ._epsProc import getNotebookJobList, getNotebookList, setNotebookTemplate, runNotebooks, tidyNotebooks, getNotebooks
-    from ._util import getFileList, checkFiles, pushFile
+    from ._epsRun import runJobs, tidyJobs, planMoveJobs, moveJobs
+    from ._epsProc import getNotebookJobList, getNotebookList, setNotebookTemplate, setNotebookWorkers, setNotebookParams, setNotebookMap, runNotebooks, pollNotebooks, runHeadless, tidyNotebooks, slimNotebooks, getNotebooks
+    from ._util import getFileList, checkFiles, pushFile, getFiles
     from ._paths import setScripts, setPaths
     from ._repo import nbWriteHeader, nbDetailsSummary, buildUploads, updateUploads, submitUploads, publishUploads,      \
-                        buildArch, updateArch, getArchLogs, checkArchFiles,             \
+                        buildArch, getArchFormats, benchArch, updateArch, setCommonArch, getArchLogs, listArchFiles, checkArchFiles, checkArchAll,             \
                         setESFiles, cpESFiles, fileListCheck, pkgOverride,                                     \
-                        initRepo, delRepoItem, uploadRepoFiles, searchRepo, publishRepoItem, checkRepoFiles,    \
+                        getRepoClient, initRepo, delRepoItem, uploadRepoFiles, newRepoVersion, searchRepo, publishRepoItem, checkRepoFiles,    \
                         writeNBdetailsJSON, readNBdetailsJSON, writeJobJSON
     from ._web import updateWebNotebookFiles, buildSite
 
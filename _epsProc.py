@@ -4,6 +4,18 @@ ePSman post-processing functions
 
 Functions for post-processing with ePSproc, including file sorting.
 
+19/10/26    getNotebooks() local paths are now unique, notebooks with the same name in different remote dirs are pulled to relative paths, and figure store files are pulled once per name.
+
+18/10/26    Added warm-kernel notebook pool runner (proc/nbRunPool.py) as default for runNotebooks().
+            Added setNotebookWorkers() for resource-aware worker limits.
+            Added notebook result cache for pool runner.
+            Added runHeadless() for batch processing without notebooks (proc/headlessProc.py).
+            Added slimNotebooks() for moving figure outputs to external store (proc/nbSlim.py).
+            Added setNotebookMap() for explicit job to output mapping, and batched tidyNotebooks().
+            getNotebooks() now uses getFiles() for bulk pulls.
+            Added pollNotebooks() for pool run status, and tidyNotebooks(finishedOnly = True) for tidying finished notebooks during a run.
+            Figure stores for slimmed notebooks (_nbfigs) are now included in getNotebooks() and tidyNotebooks() copies, and slimNotebooks(embed = True) writes re-embedded copies for upload.
+
 12/11/19    v1, based on test notebook ePSprocman_Jake_Jupyter-runner_tests_071119.ipynb
                 http://localhost:8888/notebooks/ePS/aniline/epsman/ePSprocman_Jake_Jupyter-runner_tests_071119.ipynb
 
@@ -12,6 +24,9 @@ Functions for post-processing with ePSproc, including file sorting.
 
 # import inspect
 from pathlib import Path
+import json
+import os
+from collections import Counter
 
 # This will work in notebook...  but not sure what modeule equivalent is.
 # temp = Path(inspect.getfile(em))
@@ -148,9 +163,107 @@ def setNotebookTemplate(self, template = 'nb-tpl-JR-v4'):
             print(f"Pushed notebook {result.remote} to {result.local}")
             # print(result)
 
-def runNotebooks(self, subDirs = True, template = 'nb-tpl-JR-v4', scp = 'nb-sh-JR', multiEChunck = False):
+def setNotebookWorkers(self, nJobs, memPerNb = None, memFrac = 0.8, maxWorkers = None, verbose = True):
+    """
+    Set number of notebook workers for host, based on available cores and memory.
+
+    Host cores (nproc), available memory (/proc/meminfo MemAvailable) and measured peak notebook memory (from <template>.stats.json, written by proc/nbRunPool.py) are read in a single remote call.
+    Workers are then limited to min(nJobs, cores, memFrac*MemAvailable/memPerNb), and remaining notebooks are queued by the runner.
+
+    Parameters
+    ----------
+    nJobs : int
+        Number of notebooks to run.
+
+    memPerNb : int, optional, default = None
+        Memory per notebook (kB). If None, use measured value for template, or 2 GB if not yet measured.
+
+    memFrac : float, optional, default = 0.8
+        Fraction of available memory to use.
+
+    maxWorkers : int, optional, default = None
+        Additional upper limit on workers.
+
+    Returns
+    -------
+    proc : int
+        Number of workers.
+
+    """
+
+    statsFile = self.hostDefn[self.host]['nbTemplate'].with_suffix('.stats.json')
+    result = self.c.run(f"nproc; awk '/MemAvailable/ {{print $2}}' /proc/meminfo; cat '{statsFile.as_posix()}' 2>/dev/null", warn = True, hide = True)
+    lines = result.stdout.splitlines()
+
+    try:
+        cores = int(lines[0])
+        memAvail = int(lines[1])
+    except (IndexError, ValueError):
+        print('***Could not get host resources, setting workers = 1')
+        return 1
+
+    if memPerNb is None:
+        try:
+            memPerNb = json.loads('\n'.join(lines[2:]))['peakMemKB']
+            memSource = f"measured, {statsFile.name}"
+        except (ValueError, KeyError):
+            memPerNb = 2*1024**2
+            memSource = 'default'
+    else:
+        memSource = 'set'
+
+    memWorkers = int(memFrac*memAvail/memPerNb)
+    proc = max(1, min(nJobs, cores, memWorkers))
+    if maxWorkers is not None:
+        proc = max(1, min(proc, maxWorkers))
+
+    if verbose:
+        print(f"Host {self.host}: {cores} cores, {round(memAvail/1024**2, 2)} GB available, {round(memPerNb/1024**2, 2)} GB per notebook ({memSource}).")
+        print(f"Set {proc} workers for {nJobs} notebooks" + (f", {nJobs - proc} queued." if nJobs > proc else "."))
+
+    return proc
+
+
+def setNotebookParams(self, multiEChunck = False):
     """
-    Set up and run batch of ePSproc notebooks using Jupyter-runner.
+    Write params file for notebook runs from self.jobList, and push to host.
+
+    One line per job, DATAFILE='<file>', as used by jupyter-runner, proc/nbRunPool.py and proc/headlessProc.py.
+
+    Returns
+    -------
+    paramsFile : str
+        Params file name (in nbProcDir on host).
+
+    """
+
+    # Write params file for Jupyter Runner
+    paramsFile = self.hostDefn[self.host]['nbProcDir'].name + '_' + self.host + '_JR-params.txt'
+    self.JRParams = Path(self.hostDefn['localhost']['wrkdir'], paramsFile)
+    with open(self.JRParams, 'w') as f:
+        if multiEChunck:
+            # For multi-E case, just pass first file, plus list of chunk files (for result cache, see proc/nbRunPool.py)
+            chunkFiles = ';'.join(Path(self.hostDefn[self.host]['nbProcDir'], item).as_posix() for item in self.jobList)
+            f.write(f"DATAFILE='{Path(self.hostDefn[self.host]['nbProcDir'], self.jobList[0]).as_posix()}' CHUNKFILES='{chunkFiles}'\n")
+
+        else:
+            # For general case, pass list of files and execute one notebook/process per file.
+            for item in self.jobList:
+                f.write(f"DATAFILE='{Path(self.hostDefn[self.host]['nbProcDir'], item).as_posix()}'\n")
+
+    print(f'\nJupyter-runner params set in local file: {self.JRParams}')
+
+    # Push to host
+    # print(f'Pushing file to host: {self.host}')
+    # logResult = self.c.put(self.JRParams.as_posix(), remote = self.hostDefn[self.host]['nbProcDir'].as_posix())
+    logResult = self.pushFile(self.JRParams, self.hostDefn[self.host]['nbProcDir'])
+
+    return paramsFile
+
+
+def runNotebooks(self, subDirs = True, template = 'nb-tpl-JR-v4', scp = 'nb-sh-JR', multiEChunck = False, runner = 'pool', workers = None, cache = True, jobList = None):
+    """
+    Set up and run batch of ePSproc notebooks using a pool of warm kernels, or Jupyter-runner.
 
     - Create job list for directory.
     - Set params list for jupyter-runner
@@ -182,6 +295,22 @@ def runNotebooks(self, subDirs = True, template = 'nb-tpl-JR-v4', scp = 'nb-sh-J
         NOTE: this also requires a compatible template file.
         NOTE: no error checking here yet, should add checks rather than manual setting.
 
+    runner : str, optional, default = 'pool'
+        - 'pool' run with proc/nbRunPool.py, which keeps one warm kernel (with ePSproc etc. preloaded) per worker and reuses it across notebooks.
+        - 'JR' run with jupyter-runner via scp, one new kernel per notebook.
+        Both use the same params file and output notebook naming.
+
+    workers : int, optional, default = None
+        Maximum number of notebook workers. Number of workers is set by setNotebookWorkers() from host cores & memory, and limited to this value if set.
+
+    cache : bool, optional, default = True
+        For runner = 'pool', reuse results for jobs where the template, DATAFILE contents and ePSproc version are unchanged.
+        Cache is kept in nbProcDir/.nbCache on host.
+
+    jobList : list, optional, default = None
+        ePS output files to run notebooks for. If None, all .out files in nbProcDir are used, see getNotebookJobList().
+        Use this to render notebooks only for selected jobs, e.g. for web or repo, after processing with runHeadless().
+
     To do
     -----
     - Templates dir from module?  Should be able to get with inspect... not sure if templates included in install?
@@ -195,50 +324,212 @@ def runNotebooks(self, subDirs = True, template = 'nb-tpl-JR-v4', scp = 'nb-sh-J
     print('Using template: ', self.hostDefn[self.host]['nbTemplate'])
 
     # Get jobList, ePS output files to run  template for.
-    self.getNotebookJobList(subDirs = subDirs)
+    # If jobList is passed, render notebooks for these jobs only (e.g. after runHeadless()).
+    if jobList is None:
+        self.getNotebookJobList(subDirs = subDirs)
+    else:
+        self.jobList = jobList
 
     #*** Write to file - set for local then push to remote.
-
-    # Write params file for Jupyter Runner
-    paramsFile = self.hostDefn[self.host]['nbProcDir'].name + '_' + self.host + '_JR-params.txt'
-    self.JRParams = Path(self.hostDefn['localhost']['wrkdir'], paramsFile)
-    with open(self.JRParams, 'w') as f:
-        if multiEChunck:
-            # For multi-E case, just pass first file
-            f.write(f"DATAFILE='{Path(self.hostDefn[self.host]['nbProcDir'], self.jobList[0]).as_posix()}'\n")
-
-        else:
-            # For general case, pass list of files and execute one notebook/process per file.
-            for item in self.jobList:
-                f.write(f"DATAFILE='{Path(self.hostDefn[self.host]['nbProcDir'], item).as_posix()}'\n")
-
-    print(f'\nJupyter-runner params set in local file: {self.JRParams}')
-
-    # Push to host
-    # print(f'Pushing file to host: {self.host}')
-    # logResult = self.c.put(self.JRParams.as_posix(), remote = self.hostDefn[self.host]['nbProcDir'].as_posix())
-    logResult = self.pushFile(self.JRParams, self.hostDefn[self.host]['nbProcDir'])
+    paramsFile = self.setNotebookParams(multiEChunck = multiEChunck)
+    self.setNotebookMap(multiEChunck = multiEChunck)
 
     #*** Run post-processing with Jupyter-runner script
-    # Set number of processors == job size
-    # TODO: add error checking and upper limit here, if proc > number of physical processors.
-    proc = len(self.jobList)
+    # Set number of processors from job size and host resources, remaining jobs are queued.
+    if multiEChunck:
+        proc = 1
+    else:
+        proc = self.setNotebookWorkers(len(self.jobList), maxWorkers = workers)
 
     # With nohup wrapper script to allow job to run independently of terminal.
     # Turn warnings off, and set low timeout, to ensure hangup after jobs started (note: if too short, this will throw an error even if successful)
     # 07/03/20 - added conda wrapper.
     with self.c.prefix(f"source {self.hostDefn[self.host]['condaPath']} {self.hostDefn[self.host]['condaEnv']}"):
         print(f"Running Notebooks with conda env {self.hostDefn[self.host]['condaEnv']}")
-        print(f"CMD: {Path(self.hostDefn[self.host]['scpdir'], self.scrDefn[scp]).as_posix()} {self.hostDefn[self.host]['nbProcDir'].as_posix()} {proc} {paramsFile} {self.hostDefn[self.host]['nbTemplate'].as_posix()}")
-        result = self.c.run(Path(self.hostDefn[self.host]['scpdir'], self.scrDefn[scp]).as_posix() + f" {self.hostDefn[self.host]['nbProcDir'].as_posix()} {proc} {paramsFile} {self.hostDefn[self.host]['nbTemplate'].as_posix()}", warn = True, timeout = 40)
+
+        if runner == 'pool':
+            # Warm kernel pool, log and run status file written to nbProcDir.
+            self.nbPoolLog = Path(self.hostDefn[self.host]['nbProcDir'], Path(paramsFile).stem + '_nbPool.log')
+            self.nbStatusFile = Path(self.hostDefn[self.host]['nbProcDir'], Path(paramsFile).stem + '_nbStatus.json')
+            self.nbTidied = []
+            cmd = f"{Path(self.hostDefn[self.host]['procScpPath'], self.scpDefnProc['nbPoolNohup']).as_posix()} {Path(self.hostDefn[self.host]['procScpPath'], self.scpDefnProc['nbPool']).as_posix()} \
+                    {self.hostDefn[self.host]['nbProcDir'].as_posix()} {proc} {paramsFile} {self.hostDefn[self.host]['nbTemplate'].as_posix()} {self.nbPoolLog.as_posix()} {cache}"
+        else:
+            cmd = Path(self.hostDefn[self.host]['scpdir'], self.scrDefn[scp]).as_posix() + f" {self.hostDefn[self.host]['nbProcDir'].as_posix()} {proc} {paramsFile} {self.hostDefn[self.host]['nbTemplate'].as_posix()}"
+
+        print(f"CMD: {cmd}")
+        result = self.c.run(cmd, warn = True, timeout = 40)
+
+    if runner == 'pool':
+        print(f"Run started, check progress with pollNotebooks(), status file {self.nbStatusFile}")
+
+
+# Check notebook pool run status
+def pollNotebooks(self, statusFile = None, verbose = True):
+    """
+    Check status of notebook pool run on host (runner = 'pool' only).
+
+    Reads the run status file written by proc/nbRunPool.py, and checks the pool process is still alive, in a single remote call.
+
+    Parameters
+    ----------
+    statusFile : str or Path, optional, default = None
+        Status file on host. If None, use self.nbStatusFile, as set by runNotebooks(), or nbProcDir/<params file>_nbStatus.json.
+
+    verbose : bool, optional, default = True
+        Print summary, plus error cells for notebooks with errors.
+
+    Returns
+    -------
+    dict
+        Run status, {'pid', 'start', 'template', 'total', 'finished', 'alive', 'jobs':{n:{'DATAFILE', 'outFile', 'status', 'errors', ...}}}.
+        Also set to self.nbRunStatus, and output notebooks for finished jobs set to self.nbFinished.
+
+    """
+
+    if statusFile is None:
+        if hasattr(self, 'nbStatusFile'):
+            statusFile = self.nbStatusFile
+        else:
+            statusFile = Path(self.hostDefn[self.host]['nbProcDir'], Path(self.JRParams).stem + '_nbStatus.json')
+
+    statusFile = Path(statusFile).as_posix()
+    Result = self.c.run(f"pid=$(grep -m1 '\"pid\"' '{statusFile}' | tr -dc 0-9); cat '{statusFile}' && printf '\\nalive=%s\\n' $(kill -0 $pid 2>/dev/null && echo 1 || echo 0)",
+                        warn = True, hide = True)
+
+    if Result.failed:
+        print(f"***Status file {statusFile} not found on {self.host}.")
+        return None
+
+    lines = Result.stdout.strip().splitlines()
+    self.nbRunStatus = json.loads('\n'.join(lines[:-1]))
+    self.nbRunStatus['alive'] = (lines[-1] == 'alive=1')
+
+    # Summarise by status, failed messages grouped.
+    counts = {}
+    self.nbFinished = []
+    for n, item in self.nbRunStatus['jobs'].items():
+        status = item['status'].split(':')[0]
+        counts[status] = counts.get(status, 0) + 1
+
+        if status not in ('queued', 'running'):
+            self.nbFinished.append(item['outFile'])
+
+    if verbose:
+        print(f"*** Notebook run {self.nbRunStatus['paramsFile']} (PID {self.nbRunStatus['pid']}), started {self.nbRunStatus['start']}, updated {self.nbRunStatus['updated']}")
+        print(f"{len(self.nbFinished)}/{self.nbRunStatus['total']} finished: " + ', '.join(f"{k} {v}" for k, v in counts.items()))
+
+        for n, item in self.nbRunStatus['jobs'].items():
+            if item['status'] == 'errors' or item['status'].startswith('failed'):
+                print(f"\n{item['outFile']} ({item['DATAFILE']}): {item['status']}")
+                for cell, ename, evalue in item.get('errors', []):
+                    print(f"    Cell {cell}: {ename}: {evalue}")
+
+    if not self.nbRunStatus['finished'] and not self.nbRunStatus['alive']:
+        print(f"***Pool process {self.nbRunStatus['pid']} not running, but run is not finished - check log {Path(statusFile).parent}.")
+    elif self.nbRunStatus['finished'] and verbose:
+        print("Run finished.")
+
+    return self.nbRunStatus
+
+
+# Headless batch processing, no notebooks
+def runHeadless(self, subDirs = True, template = 'nb-tpl-JR-v4', workers = None, figFormat = 'png'):
+    """
+    Run template computation for all ePS .out files as plain Python, in a single process pool on host.
+
+    Wrapper for proc/headlessProc.py. The code cells of the notebook template are run per DATAFILE, writing the same .nc outputs as a notebook run, plus figures (<job>_fig<N>.<figFormat>) and a log file (<job>.headless.log).
+    No notebooks are written - use runNotebooks(jobList = ...) to render notebooks for selected jobs later.
+
+    Parameters
+    ----------
+    subDirs : bool, optional, default = True
+        Include subDirs in processing.
+
+    template : str, optional, default = 'nb-tpl-JR-v4'
+        Jupyter notebook template file for post-processing, see setNotebookTemplate().
+
+    workers : int, optional, default = None
+        Maximum number of worker processes, see setNotebookWorkers().
+
+    figFormat : str, optional, default = 'png'
+        Format for figures.
+
+    """
+
+    self.setNotebookTemplate(template = template)
+    print('*** Headless post-processing for ', self.hostDefn[self.host]['nbProcDir'])
+    print('Using template: ', self.hostDefn[self.host]['nbTemplate'])
+
+    self.getNotebookJobList(subDirs = subDirs)
+    paramsFile = self.setNotebookParams()
+    proc = self.setNotebookWorkers(len(self.jobList), maxWorkers = workers)
+
+    # Run with nohup wrapper, log written to nbProcDir.
+    self.headlessLog = Path(self.hostDefn[self.host]['nbProcDir'], Path(paramsFile).stem + '_headless.log')
+    with self.c.prefix(f"source {self.hostDefn[self.host]['condaPath']} {self.hostDefn[self.host]['condaEnv']}"):
+        cmd = f"{Path(self.hostDefn[self.host]['procScpPath'], self.scpDefnProc['nbPoolNohup']).as_posix()} {Path(self.hostDefn[self.host]['procScpPath'], self.scpDefnProc['headless']).as_posix()} \
+                {self.hostDefn[self.host]['nbProcDir'].as_posix()} {proc} {paramsFile} {self.hostDefn[self.host]['nbTemplate'].as_posix()} {self.headlessLog.as_posix()} {figFormat}"
+        print(f"CMD: {cmd}")
+        result = self.c.run(cmd, warn = True, timeout = 40)
+
+    print(f"Log file set: {self.headlessLog}")
+
+
+# Set job to output notebook mapping
+def setNotebookMap(self, multiEChunck = False, push = True):
+    """
+    Set explicit mapping of jobs to runner output notebooks, and final notebook names.
+
+    Runner outputs are <template>_<n>.ipynb, with n set by job order in the params file (see setNotebookParams()), for both pool and jupyter-runner cases.
+    The mapping is set at launch in self.nbJobMap, and written to nbProcDir/<params file>_nbMap.json on host, so tidyNotebooks() does not rely on the current self.jobList ordering.
+
+    Parameters
+    ----------
+    multiEChunck : bool, optional, default = False
+        Single output notebook for E-chuncked jobs, named by self.genFile.
+
+    push : bool, optional, default = True
+        Write mapping file and push to host.
+
+    """
+
+    if multiEChunck:
+        jobs = [self.genFile.stem]  # Single output
+    else:
+        jobs = self.jobList  # Notebook per job
+
+    self.nbJobMap = []
+    for n, item in enumerate(jobs):
+        # Set file name for jupyter-runner output (full path)
+        JRFile = f"{Path(self.hostDefn[self.host]['nbProcDir'], self.hostDefn[self.host]['nbTemplate'].stem)}_{n+1}.ipynb"
+        if multiEChunck:
+            newFile = f"{Path(self.hostDefn[self.host]['nbProcDir'], Path(item))}.ipynb"
+        else:
+            newFile = f"{Path(self.hostDefn[self.host]['nbProcDir'], Path(Path(item).stem).stem)}.ipynb"
+
+        self.nbJobMap.append({'job':Path(item).as_posix(), 'JRFile':JRFile, 'newFile':newFile, 'cpDir':Path(item).parent.as_posix()})
+
+    if push:
+        mapFile = Path(self.hostDefn['localhost']['wrkdir'], Path(self.JRParams).stem + '_nbMap.json')
+        with open(mapFile, 'w') as f:
+            json.dump(self.nbJobMap, f, indent=2)
+
+        self.c.put(mapFile.as_posix(), remote = Path(self.hostDefn[self.host]['nbProcDir'], mapFile.name).as_posix())
+        print(f"Notebook output map written to {Path(self.hostDefn[self.host]['nbProcDir'], mapFile.name)}")
+
+    return self.nbJobMap
 
 
 # Tidy up auto-generated notebook files on remote.
-def tidyNotebooks(self, rename = True, overrideFlag = False, cp = True, dryRun = False, multiEChunck = False):
+def tidyNotebooks(self, rename = True, overrideFlag = False, cp = True, dryRun = False, multiEChunck = False, finishedOnly = False):
     """
     Tidy up autogenerated notebooks from Jupyter-runner (from :py:func:`epsman._epsProc.py`).
 
-    Assumes numerical ordering matches current self.jobList.
+    Uses job to output mapping self.nbJobMap, as set at launch by runNotebooks() (see setNotebookMap()).
+    If not set, mapping is reconstructed assuming numerical ordering matches current self.jobList.
+
+    All file checks, renames and copies are run in a single remote script, with one result report.
 
     Parameters
     ----------
@@ -258,6 +549,10 @@ def tidyNotebooks(self, rename = True, overrideFlag = False, cp = True, dryRun =
         Set to true for consolidated handling of E-chuncked jobs. In this case, process batch of files in a single notebook.
         NOTE: no error checking here yet, should add checks rather than manual setting.
 
+    finishedOnly : bool, optional, default = False
+        Tidy only notebooks reported as finished by pollNotebooks() (pool runner), and not already tidied.
+        Use this to start tidying while the run is still in progress, and call again for the remaining notebooks.
+
     TODO
     -----
     - Add options for tidy/move/delete processing results from original dirs.
@@ -270,23 +565,40 @@ def tidyNotebooks(self, rename = True, overrideFlag = False, cp = True, dryRun =
     if dryRun:
         print("*** Dry run only")
 
-    # Currently set to move to item (job) dir.
-    self.nbFileList = []
-    self.nbFileFail = []
-
-    if multiEChunck:
-        jobs = [self.genFile.stem]  # Single output
-    else:
-        jobs = self.jobList  # Notebook per job
-
-
-    for n, item in enumerate(jobs):
-        # Set file name for jupyter-runner output (full path)
-        JRFile = f"{Path(self.hostDefn[self.host]['nbProcDir'], self.hostDefn[self.host]['nbTemplate'].stem)}_{n+1}.ipynb"
-        if multiEChunck:
-            newFile = f"{Path(self.hostDefn[self.host]['nbProcDir'], Path(item))}.ipynb"
-        else:
-            newFile = f"{Path(self.hostDefn[self.host]['nbProcDir'], Path(Path(item).stem).stem)}.ipynb"
+    if not hasattr(self, 'nbJobMap'):
+        self.setNotebookMap(multiEChunck = multiEChunck, push = False)
+
+    if not hasattr(self, 'nbTidied'):
+        self.nbTidied = []
+
+    # Restrict to finished notebooks if required
+    jobMap = self.nbJobMap
+    if finishedOnly:
+        if self.pollNotebooks(verbose = False) is None:
+            return None
+
+        jobMap = [item for item in self.nbJobMap if (item['JRFile'] in self.nbFinished) and (item['JRFile'] not in self.nbTidied)]
+        print(f"Tidying {len(jobMap)} finished notebooks ({len(self.nbTidied)} already tidied, {self.nbRunStatus['total'] - len(self.nbFinished)} still to run).")
+
+    # Build remote script - existence check, mv and cp per notebook, reported as tab separated lines.
+    script = [f"dry={int(dryRun)}; rename={int(rename)}; cp={int(cp)}",
+              'tidy() {',
+              '  if [ ! -f "$1" ]; then printf "MISSING\\t%s\\t%s\\n" "$1" "$2"; return; fi',
+              '  if [ $rename = 1 ]; then',
+              '    if [ $dry = 1 ] || mv "$1" "$2"; then printf "mv\\t%s\\t%s\\n" "$1" "$2"; else printf "mv fail\\t%s\\t%s\\n" "$1" "$2"; fi',
+              '  fi',
+              '  if [ $cp = 1 ]; then',
+              '    if [ $dry = 1 ] || cp "$2" "$3"; then printf "cp\\t%s\\t%s\\n" "$2" "$3"; else printf "cp fail\\t%s\\t%s\\n" "$2" "$3"; fi',
+              '    figs="$(dirname "$2")/_nbfigs"',  # Figure store for slimmed notebooks, see slimNotebooks()
+              '    if [ -d "$figs" ] && [ -n "$(ls -A "$figs")" ]; then',
+              '      if [ $dry = 1 ] || { mkdir -p "$3/_nbfigs" && cp -n "$figs"/* "$3/_nbfigs/"; }; then printf "cp\\t%s\\t%s\\n" "$figs" "$3"; else printf "cp fail\\t%s\\t%s\\n" "$figs" "$3"; fi',
+              '    fi',
+              '  fi',
+              '  printf "DONE\\t%s\\t%s\\n" "$1" "$2"',
+              '}']
+
+    for item in jobMap:
+        newFile = item['newFile']
 
         # Override default naming scheme if desired.
         if overrideFlag:
@@ -299,37 +611,34 @@ def tidyNotebooks(self, rename = True, overrideFlag = False, cp = True, dryRun =
                 newFile = f"{Path(self.hostDefn[self.host]['nbProcDir'], newName)}.ipynb"
                 print(f"Set filename: {newFile}")
 
+        script.append(f"tidy '{item['JRFile']}' '{newFile}' '{item['cpDir']}'")
 
+    # Push and run script (single call)
+    scriptFile = Path(self.hostDefn['localhost']['wrkdir'], self.hostDefn[self.host]['nbProcDir'].name + '_' + self.host + '_nbTidy.sh')
+    with open(scriptFile, 'w', newline = "\n") as f:
+        f.write('\n'.join(script) + '\n')
 
-# TODO: change logic here to set nbFileList in cases where files are already renamed - NOW set independently by getNotebookList()
-
-        # Check file exists
-        result = self.c.run('[ -f "' + JRFile + '" ]', warn = True, hide = True)  # Test for destination file, will return True if exists
-        destTest = result.ok
-
-        if destTest:
-            self.nbFileList.append(newFile)
-
-            if rename:
-                if not dryRun:
-                    Result = self.c.run(f"mv {JRFile} {newFile}")
-                if dryRun or Result.ok:
-                    print(f"mv {JRFile} {newFile}")
-                else:
-                    print(f"mv {JRFile} {newFile} fail")
-
-
-            if cp:
-                if not dryRun:
-                    Result = self.c.run(f"cp {newFile} {Path(item).parent}")
-                if dryRun or Result.ok:
-                    print(f"cp {newFile} {Path(item).parent}")
-                else:
-                    print(f"cp {newFile} {Path(item).parent} fail")
+    remoteScript = Path(self.hostDefn[self.host]['nbProcDir'], scriptFile.name).as_posix()
+    self.c.put(scriptFile.as_posix(), remote = remoteScript)
+    Result = self.c.run(f"bash {remoteScript}", warn = True, hide = True)
 
+    # Parse results
+    self.nbFileList = []
+    self.nbFileFail = []
+    for line in Result.stdout.splitlines():
+        parts = line.split('\t')
+        if len(parts) != 3:
+            continue
+
+        if parts[0] == 'DONE':
+            self.nbFileList.append(parts[2])
+            if not dryRun:
+                self.nbTidied.append(parts[1])
+        elif parts[0] == 'MISSING':
+            print(f"*** Missing notebook {parts[1]} -> {parts[2]}")
+            self.nbFileFail.append([parts[1], parts[2]])
         else:
-            print(f"*** Missing notebook {JRFile} -> {newFile}")
-            self.nbFileFail.append([JRFile, newFile])
+            print(f"{parts[0].replace(' fail', '')} {parts[1]} {parts[2]}" + (' fail' if parts[0].endswith('fail') else ''))
 
     print(f'\nProcessed Notebook List:')
     print(*self.nbFileList, sep='\n')
@@ -339,14 +648,104 @@ def tidyNotebooks(self, rename = True, overrideFlag = False, cp = True, dryRun =
         print(*self.nbFileFail, sep='\n')
 
 
+# Slim notebooks by moving large outputs to figure store
+def slimNotebooks(self, nbFileList = None, minSize = 10240, maxWidth = None, recompress = False, restore = False, embed = False, dryRun = False):
+    """
+    Move large figure outputs from notebooks to content-addressed image files, and replace with references.
+
+    Wrapper for proc/nbSlim.py, run on host for all notebooks in a single call.
+    Figures are written to <notebook dir>/_nbfigs/<hash>.<ext>, so identical figures are stored once per dir.
+    Note the _nbfigs dir must be kept with the notebooks. This is handled by getNotebooks(), tidyNotebooks() (cp = True) and updateWebNotebookFiles(),
+    and for repo uploads a re-embedded copy of each slimmed notebook is uploaded instead (embed = True, see _repo.updateUploads()).
+    Use restore = True to re-embed figures in place.
+
+    Parameters
+    ----------
+    nbFileList : list, optional, default = None
+        Notebooks to process, defaults to self.nbFileList.
+
+    minSize : int, optional, default = 10240
+        Minimum output size (bytes) to move.
+
+    maxWidth : int, optional, default = None
+        Downsample figures wider than maxWidth pixels (requires PIL on host).
+
+    recompress : bool, optional, default = False
+        Recompress figures (requires PIL on host).
+
+    restore : bool, optional, default = False
+        Re-embed figures from store.
+
+    embed : bool, optional, default = False
+        Write re-embedded copies to <notebook dir>/_nbembed/<notebook>, notebooks are unchanged.
+        Returns {notebook: embedded copy}, for slimmed notebooks only.
+
+    dryRun : bool, optional, default = False
+        Report only.
+
+    """
+
+    if nbFileList is None:
+        nbFileList = self.nbFileList
+
+    if restore:
+        mode = 'restore'
+    elif embed:
+        mode = 'embed'
+    elif dryRun:
+        mode = 'dryRun'
+    else:
+        mode = 'slim'
+
+    print(f"***Notebook slimming ({mode}) for {len(nbFileList)} notebooks")
+    fileArgs = ' '.join([f"'{Path(item).as_posix()}'" for item in nbFileList])
+
+    with self.c.prefix(f"source {self.hostDefn[self.host]['condaPath']} {self.hostDefn[self.host]['condaEnv']}"):
+        result = self.c.run(f"python {Path(self.hostDefn[self.host]['procScpPath'], self.scpDefnProc['nbSlim']).as_posix()} {mode} {minSize} {maxWidth} {recompress} {fileArgs}", warn = True, hide = embed)
+
+    if embed:
+        # Embedded copies as JSON on final line
+        if result.ok and result.stdout.strip():
+            return json.loads(result.stdout.strip().splitlines()[-1])
+
+        print(f"***Notebook embedding failed: {result.stderr}")
+        return {}
+
+    return result
+
+
 # Pull auto-generated notebook files from remote
-def getNotebooks(self):
-    """Get remote notebook files."""
+def getNotebooks(self, workers = 4, overwrite = True):
+    """
+    Get remote notebook files (to working dir).
+
+    Uses getFiles() for parallel, compressed and resumable pulls - unchanged local notebooks are skipped.
+    Notebooks are pulled to <working dir>/<name>, or for names found in multiple remote dirs, to the remote path relative to the common notebook dir.
+    Figure stores for slimmed notebooks (<notebook dir>/_nbfigs, see slimNotebooks()) are also pulled, to <working dir>/_nbfigs. Figure files are content-addressed, so files with the same name are only pulled once.
+
+    """
 
     print('*** Pulling notebook files from remote')
-    for item in self.nbFileList:
-        result = self.c.get(item)
-        print(f"Pulled notebook {result.remote} to {result.local}")
+    fileList = sorted(set([Path(item).as_posix() for item in self.nbFileList]))
+    names = Counter([Path(item).name for item in fileList])
+    rootDir = os.path.commonpath([Path(item).parent.as_posix() for item in fileList]) if fileList else None
+    localList = [Path(Path.cwd(), Path(item).name if names[Path(item).name] == 1 else Path(item).relative_to(rootDir)) for item in fileList]
+
+    # Figure store files (one call)
+    figDirs = sorted(set([Path(Path(item).parent, '_nbfigs').as_posix() for item in self.nbFileList]))
+    if figDirs:
+        dirArgs = ' '.join([f"'{item}'" for item in figDirs])
+        Result = self.c.run(f"for d in {dirArgs}; do [ -d \"$d\" ] && find \"$d\" -maxdepth 1 -type f; done; true", warn = True, hide = True)
+        figFiles = sorted(set(Result.stdout.split()))  # Content-addressed names, no spaces.
+        figFiles = list({Path(item).name: item for item in figFiles}.values())  # One file per name.
+
+        if figFiles:
+            print(f"Including {len(figFiles)} figure store files.")
+            fileList.extend(figFiles)
+            localList.extend([Path(Path.cwd(), '_nbfigs', Path(item).name) for item in figFiles])
+            Path(Path.cwd(), '_nbfigs').mkdir(exist_ok = True)
+
+    self.nbPullResults = self.getFiles(fileList, localList = localList, workers = workers, overwrite = overwrite)
 
 # Kill all running notebooks on remote
 def killNotebooks(self, jobName = "ZMQbg/1"):
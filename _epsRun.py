@@ -2,6 +2,9 @@
 ePSman run functions
 --------------------
 
+18/10/26    Added manifest-driven file moves for tidyJobs(), see planMoveJobs() and moveJobs().
+            Local copies in tidyJobs() now via getFiles().
+
 03/10/19    First attempt.
 
 """
@@ -9,6 +12,8 @@ ePSman run functions
 from pathlib import Path
 import numpy as np
 from itertools import compress
+import json
+import datetime
 
 # Run a set of jobs
 # Not sure if nohup will work as expected here...
@@ -46,10 +51,13 @@ def tidyJobs(self, chkFlag = True, mvFlag = True, cpFlag = False, owFlag = None,
     tol : float, optional, default = 0.05
         Tolerance (%age) for filesize tests.
 
+    Notes
+    -----
+    File moves are set by :py:func:`planMoveJobs`, only files for jobs which passed checks are moved, and a file manifest is written to jobDir.
+
     TODO
     ----
     - Lots of repetitive logic and boiler-plate here, should do better.
-    - Better logic for check & move - at the moment all files are moved, even if they fail checks.
 
     """
 
@@ -79,6 +87,7 @@ def tidyJobs(self, chkFlag = True, mvFlag = True, cpFlag = False, owFlag = None,
 
 
     #*** Check file sizes are (roughly) consistent
+    self.fAbrupt = []
     if chkFlag:
         print('\nChecking files...')
         # Query with -ll to get file sizes
@@ -120,7 +129,6 @@ def tidyJobs(self, chkFlag = True, mvFlag = True, cpFlag = False, owFlag = None,
         # tailList
 
         # Issue warning if abrupt file endings found
-        self.fAbrupt = []
         if fTest.count(False):
             print(f'*** Warning: {fTest.count(False)} files end abruptly.')
             self.fAbrupt = list(compress(self.fileList, np.logical_not(np.array(fTest))))    # Slightly ugly... could also flip with list comprehension to avoid np use here.
@@ -139,24 +147,17 @@ def tidyJobs(self, chkFlag = True, mvFlag = True, cpFlag = False, owFlag = None,
             print(*self.fTails, sep = '\n')
 
     #*** Move files to jobDir
+    # 18/10/26: now via planMoveJobs() and moveJobs(), only files for validated jobs are moved, and a manifest is written to jobDir.
     if mvFlag:
         print('\nMoving completed files on remote...')
         print('Checking destination files in ' + self.hostDefn[self.host]['jobDir'].as_posix())
 
-        # Check for existing results
-        destTest = []
-        destFileList = []
-        for f in self.fileList:
-            destFile = Path(self.hostDefn[self.host]['jobDir'], Path(f).name)
-            result = self.c.run('[ -f "' + destFile.as_posix() + '" ]', warn = True, hide = True)  # Test for destination file, will return True if exists
-            destTest.append(result.ok)
-            destFileList.append(destFile)
+        self.planMoveJobs()
 
         # Issue warning if destination file(s) exist
-        if destTest.count(True):
-            print(f'*** Warning: {destTest.count(True)} files exist in destination dir.')
-            # Print formatted list of existing items.
-            print(*list(compress(self.fileList, (np.array(destTest)))), sep = "\n")    # Slightly ugly... could also flip with list comprehension to avoid np use here.
+        if self.mvConflicts:
+            print(f'*** Warning: {len(self.mvConflicts)} files exist in destination dir.')
+            print(*self.mvConflicts, sep = "\n")
 
             # Check whether to continue moving files
             mv = input('Continue file move? (y/n) ')
@@ -167,9 +168,7 @@ def tidyJobs(self, chkFlag = True, mvFlag = True, cpFlag = False, owFlag = None,
 
     # Move files
     if mvFlag:
-        Result = self.c.run('mv ' + Path(self.hostDefn[self.host]['jobComplete'], self.genFile.stem).as_posix() + '* ' + self.hostDefn[self.host]['jobDir'].as_posix())
-        if Result.ok:
-            print(Result.command + ' returned OK')
+        self.moveJobs()
 
 
     #*** Make a local copy
@@ -190,6 +189,10 @@ def tidyJobs(self, chkFlag = True, mvFlag = True, cpFlag = False, owFlag = None,
             Result = self.c.run('[ -f "' + self.fileList[0] + '" ]', warn = True, hide = True)  # Test for destination file, will return True if exist
             if Result.ok:
                 print('Getting files from ' + self.hostDefn[self.host]['jobComplete'].as_posix())
+            else:
+                # Files already moved, set for jobDir.
+                self.fileList = [Path(self.hostDefn[self.host]['jobDir'], Path(f).name).as_posix() for f in self.fileList]
+                print('Getting files from ' + self.hostDefn[self.host]['jobDir'].as_posix())
         else:
             Result = self.c.run('ls ' + Path(self.hostDefn[self.host]['jobDir']).as_posix() + '/*.out', warn = True, hide = True)
             self.fileList = Result.stdout.split()
@@ -197,27 +200,9 @@ def tidyJobs(self, chkFlag = True, mvFlag = True, cpFlag = False, owFlag = None,
             print('Updated file list:')
             print(*self.fileList, sep = '\n')
 
-
-        for f in self.fileList:
-            # Set full local file path for writing, c.get issues dir complaint otherwise
-            # Passing a dir as destination should work http://docs.fabfile.org/en/2.5/api/transfer.html#fabric.transfer.Transfer.get
-            # ... maybe a formatting issue...?
-            localPath = Path(self.hostDefn['localhost']['jobDir'], Path(f).name)
-
-            # Check if file exists, and whether to overwrite (applies to all files)
-            if Path.is_file(localPath) and owFlag is None:
-                temp = input('*** Local files already exists, overwrite? (y/n) ')
-                if temp == 'y':
-                    owFlag = True
-                else:
-                    owFlag = False
-
-            if owFlag:
-                Result = self.c.get(f, local = localPath.as_posix())
-                # if Result.ok:
-                #     print(Result.command + ' returned OK')
-                print(f'Got file {localPath}')
-
+        # Pull files with getFiles() - parallel, compressed & resumable, skips unchanged local files.
+        # Overwrite of differing local files set by owFlag (prompt if None).
+        self.cpResults = self.getFiles(self.fileList, localDir = self.hostDefn['localhost']['jobDir'], overwrite = owFlag)
 
 
             # Result = self.c.run('ls ' + Path(self.hostDefn[self.host]['jobDir']).as_posix() + '/*.out', warn = True, hide = True)
@@ -235,3 +220,105 @@ def tidyJobs(self, chkFlag = True, mvFlag = True, cpFlag = False, owFlag = None,
 # Result = self.c.run('ls ' + Path(self.hostDefn[self.host]['jobComplete'], self.genFile.stem).as_posix() + '*.out')
 #
 # self.fileList = Result.stdout.split()
+
+
+# Plan file moves for completed jobs
+def planMoveJobs(self):
+    """
+    Build manifest of validated job files for moving from jobComplete to jobDir.
+
+    All files for the job are listed with sizes in a single remote call, and grouped by ePS input file.
+    Files for jobs in self.fAbrupt (failed checks, as set by tidyJobs()) are excluded.
+    Existing files in jobDir are then tested for in a single remote call.
+
+    Sets self.mvManifest (dict) and self.mvConflicts (list of file names already in jobDir).
+
+    """
+
+    srcDir = self.hostDefn[self.host]['jobComplete']
+    destDir = self.hostDefn[self.host]['jobDir']
+
+    # List all files for job with sizes (one call), "size name" per line.
+    Result = self.c.run(f"cd '{srcDir.as_posix()}' && stat -c '%s %n' {self.genFile.stem}*", warn = True, hide = True)
+    fileSizes = {}
+    for line in Result.stdout.splitlines():
+        if line.strip():
+            size, name = line.split(maxsplit = 1)
+            fileSizes[name] = int(size)
+
+    # Set validated jobs by .inp file name, skip any failed jobs.
+    failed = [Path(f).name[0:-4] for f in self.fAbrupt]
+    jobs = [Path(f).name[0:-4] for f in self.fileList if Path(f).name[0:-4] not in failed]
+
+    files = []
+    for name in sorted(fileSizes):
+        if any(name.startswith(job) for job in jobs):
+            files.append({'name':name, 'size':fileSizes[name]})
+
+    self.mvManifest = {'job':self.genFile.stem,
+                       'host':self.host,
+                       'date':datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
+                       'srcDir':srcDir.as_posix(),
+                       'jobDir':destDir.as_posix(),
+                       'jobs':jobs,
+                       'skipped':failed,
+                       'files':files
+                       }
+
+    # Check for existing results in destination (one call).
+    self.mvConflicts = []
+    if files:
+        fileNames = ' '.join([f"'{item['name']}'" for item in files])
+        Result = self.c.run(f"cd '{destDir.as_posix()}' && for f in {fileNames}; do [ -e \"$f\" ] && echo \"$f\"; done; true", warn = True, hide = True)
+        self.mvConflicts = Result.stdout.split()
+
+    print(f"Move planned for {len(files)} files from {len(jobs)} jobs, {len(failed)} failed jobs skipped.")
+
+    return self.mvManifest
+
+
+# Move files as per manifest
+def moveJobs(self, manifest = None):
+    """
+    Move files in manifest from jobComplete to jobDir, and write manifest to jobDir.
+
+    Files are moved with a single remote `mv` (rename if on the same filesystem).
+    The manifest is written to jobDir as `<genFile.stem>_manifest.json`, and path set in self.hostDefn[host]['jobManifest'] for later packaging.
+    The manifest lists validated jobs, skipped jobs, and file names and sizes, and is used by packaging for the job file list (see repo/pkgFiles.manifestFilesPkg()).
+
+    Parameters
+    ----------
+    manifest : dict, optional, default = None
+        Manifest to use, as set by planMoveJobs(). Defaults to self.mvManifest.
+
+    """
+
+    if manifest is None:
+        manifest = self.mvManifest
+
+    if not manifest['files']:
+        print('*** No files to move.')
+        return None
+
+    fileNames = ' '.join([f"'{item['name']}'" for item in manifest['files']])
+    Result = self.c.run(f"cd '{manifest['srcDir']}' && mv -f {fileNames} '{manifest['jobDir']}/'", warn = True, hide = True)
+
+    if Result.ok:
+        print(f"Moved {len(manifest['files'])} files to {manifest['jobDir']} OK")
+    else:
+        print(f"*** File move failed: {Result.stderr}")
+        return Result
+
+    # Write manifest locally and push to jobDir
+    manifestFile = Path(self.hostDefn['localhost']['wrkdir'], f"{manifest['job']}_manifest.json")
+    with open(manifestFile, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    for host in self.hostDefn:
+        if 'jobDir' in self.hostDefn[host].keys():
+            self.hostDefn[host]['jobManifest'] = Path(self.hostDefn[host]['jobDir'], manifestFile.name)
+
+    self.c.put(manifestFile.as_posix(), remote = self.hostDefn[self.host]['jobManifest'].as_posix())
+    print(f"Written manifest {self.hostDefn[self.host]['jobManifest']}")
+
+    return Result
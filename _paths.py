@@ -31,11 +31,20 @@ def setScripts(self):
     self.scpDefnRepo = {'nb-post-doi':'nbHeaderPost.py',
                     'pkg':'pkgFiles.py',
                     'pkgNohup':'pkgRemoteNohup.sh',
+                    'pkgBench':'pkgBench.py',
+                    'pkgList':'pkgList.py',
                     'jobJSON':'jobJSON.py',
                     'upload':'remoteUpload.py',
                     'uploadNohup':'remoteUploadNohup.sh'
                     }
 
+    # Python scripts for notebook post-processing, in /proc
+    self.scpDefnProc = {'nbPool':'nbRunPool.py',
+                    'nbPoolNohup':'nbRunPoolNohup.sh',
+                    'headless':'headlessProc.py',
+                    'nbSlim':'nbSlim.py'
+                    }
+
     # Scripts for web deploy, in /web
     self.scpDefnWeb = {'buildIndex':'buildSphinxHTML.py',
                     'buildHTML':'buildHTML.sh'
@@ -70,6 +79,9 @@ def setPaths(self):
                                                                                                                           # So far just used for access tokens and such.
     # self.hostDefn[self.host]['localSettings'] = self.hostDefn['localhost']['localSettings']
 
+    # Set path for post-processing scripts
+    self.hostDefn[self.host]['procScpPath'] = Path(self.hostDefn[self.host]['home'], 'python/epsman/proc')
+
     # Set web paths
     self.hostDefn[self.host]['webScpPath'] = Path(self.hostDefn[self.host]['home'], 'python/epsman/web')
     self.hostDefn[self.host]['webDir'] = Path(self.hostDefn[self.host]['home'], 'github/ePSdata')
@@ -26,6 +26,7 @@ For dev codes see notebooks:
 import json
 import datetime
 import os
+import hashlib
 from pathlib import Path
 import requests
 import pprint  # For dict printing
@@ -34,7 +35,9 @@ from collections import Counter
 # Local
 from ._util import parseLineDigits
 from .repo.nbHeaderPost import constructHeader
-from .repo.pkgFiles import setJobRoot
+from .repo.pkgFiles import setJobRoot, pkgFormats, getManifestFile
+from .repo.repoUpload import uploadFiles, scheduleUploads, compareFile, clearProgress
+from .repo.repoClient import RepoClient
 
 # Import from /repo
 # from repo.pkgFiles import
@@ -50,6 +53,22 @@ def initZenodo(fileIn):
     return ACCESS_TOKEN
 
 
+def getRepoClient(self, refresh = False):
+    """
+    Get client for repo API calls, with pooled session and response cache (see repo/repoClient.py).
+
+    Client is set as self.repoClient on first call, and the access token is read from local settings (zenodoSettings.dat) once only. Set refresh = True to reinit.
+
+    The deposition index (see RepoClient.updateIndex()) is saved to wrkdir/zenodoIndex.json.
+
+    """
+    if refresh or not hasattr(self, 'repoClient'):
+        self.repoClient = RepoClient(initZenodo(self.hostDefn['localhost']['localSettings']/'zenodoSettings.dat'),
+                                     indexFile = Path(self.hostDefn['localhost']['wrkdir'], 'zenodoIndex.json'))
+
+    return self.repoClient
+
+
 # Zenodo API interface
 def initRepo(self, key, manualVerify = True, dryRun = True, verbose = True, update = False):
     """
@@ -131,85 +150,43 @@ def initRepo(self, key, manualVerify = True, dryRun = True, verbose = True, upda
     if self.nbDetails[key]['repoVerify'] and self.nbDetails[key]['pkg'] and not dryRun:
 
         # Set new upload with metadata
-        ACCESS_TOKEN = initZenodo(self.hostDefn['localhost']['localSettings']/'zenodoSettings.dat')
-        # record = None
-
-        # Check record doesn't exist already
-        searchString = self.nbDetails[key]['title'].split()[0]  # Set to use first item in job title, should be molecule name. Seems to work better than full title.
-        r = requests.get('https://zenodo.org/api/deposit/depositions',
-                        params={'q': searchString, 'access_token': ACCESS_TOKEN})
-
-        # Invalid search string may return server error, status = 500
-        # In this case just retry with molecule name only.
-        # TODO: Make this better.  ':' in search string is definitely an issue, not sure what else. RTFM.
-        # TODO: Try/fail would be clenaer here?  Type is list for real response, but dict if error.
-        # TODO: Further testing here - this may actually be a cleaner search than the full title string! NOW SET ABOVE to use this as default.
-        # if r.json() and hasattr(response.json(), 'status') and (r.json()['status'] == 500):
-        if r.json() and (type(r.json()) == dict) and ('status' in r.json().keys()) and r.json()['status'] == 500:
-            print("***Zenodo search error, retrying with molecule name only.")
-            r = requests.get('https://zenodo.org/api/deposit/depositions',
-                            params={'q': self.nbDetails[key]['title'].split()[0], 'access_token': ACCESS_TOKEN})
-
-
-        # record = None
-        # if r.json():
-        #     print(f"{self.nbDetails[key]['title']} repo already exists, repo details recovered.")
-        #     if len(r.json()) > 1:
-        #         print(f"***Warning: found {len(r.json())} matching repo records...")
-        #         for n, item in enumerate(r.json()):
-        #             print(f"Record {n}: {item['title']}, created {item['created']}")
-        #
-        #         record = input('Set record to use: ')
-        #         # r.json() = r.json()[record]
-        #     else:
-        #         record = 0  #r.json() = r.json()[0]
-
-        # BASIC search grabs also similar titles, so will need to check more carefully.
-        # TODO: add more error checking here - at the moment will still run even if server returns error code.
-        record = None
-        # if r.json() and r.json()['status'] != 500:
-        if r.json() and (type(r.json()) != dict):
-            print(f"Found {len(r.json())} possible repo matches...")
-
-            for n, item in enumerate(r.json()):
-                print(f"Item {n}: {item['title']}")
-
-                # Confirm match based on str.rfind to match substring and ignore prefixing.
-                # Should be more robust to future changes...?
-                ind = item['title'].rfind(self.nbDetails[key]['title'])
-                if item['title'][ind:] == self.nbDetails[key]['title']:
-                      print(f"Confirm match: ID {item['id']}, created {item['created']}, selecting record.")
-                      record = n
-                      id = item['id']
-                      break
-                else:
-                      print('No match.')
-
+        client = self.getRepoClient()
+
+        # Check record doesn't exist already, via local index of all depositions (by DOI or normalised title).
+        # Index is updated incrementally, at most once per client.cacheTime, rather than a search per key.
+        # Matches are re-fetched from the repo, since the saved index may be stale, and deleted records are dropped from the index.
+        # If the index update fails, just create new record.
+        try:
+            client.updateIndex(maxAge = client.cacheTime)
+            record = client.findDeposition(title = self.nbDetails[key]['title'], doi = self.nbDetails[key].get('doi'), verify = True)  # Current record from repo
+        except requests.HTTPError as e:
+            print(f"***Zenodo search error: {e}")
+            record = None
+
+        if record is not None:
+            print(f"Confirm match: {record['title']}, ID {record['id']}, created {record['created']}, selecting record.")
+            id = record['id']
+        else:
+            print('No match.')
 
         # If no matching record is found, init new.
+        r = None
         if record is None:
-            headers = {"Content-Type": "application/json"}
-            r = requests.post('https://zenodo.org/api/deposit/depositions',
-                               params={'access_token': ACCESS_TOKEN}, json={}, data=json.dumps(data),
-                               headers=headers)
+            r = client.createDeposition(data)
             print(f"***{self.nbDetails[key]['title']} repo created.")
 
         # If a matching record is found, and update is True, update record details.
         elif update:
-            headers = {"Content-Type": "application/json"}
-            r = requests.put('https://zenodo.org/api/deposit/depositions/%s' % id,
-                               params={'access_token': ACCESS_TOKEN}, json={}, data=json.dumps(data),
-                               headers=headers)
+            r = client.updateDeposition(id, data)
             print(f"***{self.nbDetails[key]['title']} repo data updated.")
 
-        # deposition_id = r.json()['id']
-
         # Confirm details returned and set in nbDetails.
-        if r.ok:
-            if record is None:
-                self.nbDetails[key]['repoInfo'] = r.json()  # Returns metadata plus repo settings
+        if (r is None) or r.ok:
+            if r is None:
+                self.nbDetails[key]['repoInfo'] = record  # Existing record
             else:
-                self.nbDetails[key]['repoInfo'] = r.json()[record]  # Case where multiple records are returned
+                self.nbDetails[key]['repoInfo'] = r.json()  # Returns metadata plus repo settings
+                client.addIndex(self.nbDetails[key]['repoInfo'])
 
             self.nbDetails[key]['doi'] = self.nbDetails[key]['repoInfo']['metadata']['prereserve_doi']['doi']
             print(f"Repo details set.")
@@ -231,38 +208,39 @@ def initRepo(self, key, manualVerify = True, dryRun = True, verbose = True, upda
         self.nbDetails[key]['repoHeaderData'] = data
 
 
-def searchRepo(self, key, searchString = None, verbose = False):
-    """Search Zenodo for item"""
+def searchRepo(self, key = None, searchString = None, verbose = False):
+    """
+    Search Zenodo for item
+
+    Search is by searchString, or first item in job title for key if not set (should be molecule name). All pages of results are returned, as a list of depositions.
+
+    """
 
     print(f"***Seaching on Zenodo")
-    ACCESS_TOKEN = initZenodo(self.hostDefn['localhost']['localSettings']/'zenodoSettings.dat')
 
     # Set default search string
     if searchString is None:
         searchString = self.nbDetails[key]['title'].split()[0]  # Set to use first item in job title, should be molecule name. Seems to work better than full title.
 
     # Search
-    r = requests.get('https://zenodo.org/api/deposit/depositions',
-                    params={'q': searchString, 'access_token': ACCESS_TOKEN})
+    items = self.getRepoClient().search(searchString)
 
     print(f"Seachstring: {searchString}")
-    for n, item in enumerate(r.json()):
+    for n, item in enumerate(items):
         print(f"Item {n}: {item['title']}")
         print(f"ID {item['id']}, DOI {item['doi']}, created {item['created']}, submitted {item['submitted']}.\n")
 
     if verbose:
         pp = pprint.PrettyPrinter(indent=1)
-        pp.pprint(r.json())
+        pp.pprint(items)
 
-    return r
+    return items
 
 
 def delRepoItem(self, key):
     """Delete item from repo (Zenodo) - for unpublished items only."""
 
-    ACCESS_TOKEN = initZenodo(self.hostDefn['localhost']['localSettings']/'zenodoSettings.dat')
-    r = requests.delete('https://zenodo.org/api/deposit/depositions/%s' % self.nbDetails[key]['repoInfo']['id'],
-                        params={'access_token': ACCESS_TOKEN})
+    r = self.getRepoClient().deleteDeposition(self.nbDetails[key]['repoInfo']['id'])
     if r.ok:
         print(f"Item {self.nbDetails[key]['title']} deleted from repo.")
         self.nbDetails[key]['repoInfo'] = None
@@ -293,34 +271,142 @@ def delRepoFiles(self, key):
     #                 print('***Item removed')
 
 
-def uploadRepoFiles(self, key):
+def uploadRepoFiles(self, key, **kwargs):
     """Upload files to repo (from local machine)
 
+    Files are streamed to the deposition bucket with retries, see repo/repoUpload.uploadFile() for options (kwargs).
+    Files already in the deposition with matching MD5 are skipped, and files that differ are replaced (set checkExisting = False to upload all).
+    Per-file results, including the checksum comparison ('action', 'md5', 'repoMD5'), are set in self.nbDetails[key]['repoFilesUpload'].
+
     For remote run see repo/remoteUpload.py
 
     """
 
-    ACCESS_TOKEN = initZenodo(self.hostDefn['localhost']['localSettings']/'zenodoSettings.dat')
-    url = f"https://zenodo.org/api/deposit/depositions/{self.nbDetails[key]['repoInfo']['id']}/files?access_token={ACCESS_TOKEN}"
+    client = self.getRepoClient()
+    bucketURL = client.getBucketURL(self.nbDetails[key]['repoInfo'])
+
+    self.nbDetails[key]['repoFilesUpload'] = uploadFiles(bucketURL, self.nbDetails[key]['repoFiles'], token = client.token, session = client.session, **kwargs)
+
+
+def newRepoVersion(self, key, local = True, dryRun = True, upload = False, verbose = True, **kwargs):
+    """
+    Create new version of published repo record, and reuse unchanged files.
+
+    The new draft (Zenodo newversion action) carries over all files from the published record. Carried-over files are then compared with the current repoFiles:
+    - Files no longer in repoFiles are deleted from the draft.
+    - For local = True, files are compared by MD5 (see repo/repoUpload.compareFile()), and changed files are deleted from the draft.
+      For remote files (local = False), changed files are replaced when uploaded, see submitUploads().
+    - Unchanged files are kept, and skipped on upload (by MD5 comparison with the draft bucket), so only changed files are uploaded.
+    - Upload progress for the key (see submitUploads()) is cleared, so files are checked against the new draft bucket on upload.
+
+    Parameters
+    ----------
+    key : int
+        Item in self.nbDetails, with repoInfo set for a published record.
+
+    local : bool, default = True
+        Files in repoFiles are on the local machine.
+
+    dryRun : bool, default = True
+        Compare files with the published record only, without creating the new version.
 
-    outputs = []
-    for fileIn in self.nbDetails[key]['repoFiles']:
-        # Basic schema... will need to run on remote however.
+    upload : bool, default = False
+        Upload changed files after creating the new version (local only), via uploadRepoFiles(). Otherwise run submitUploads() later.
 
-        data = {'name': Path(fileIn).name}
-        files = {'file': open(fileIn, 'rb')}
-        r = requests.post(url, data=data, files=files)
+    **kwargs
+        Passed to uploadRepoFiles().
+
+    Returns
+    -------
+    dict
+        File comparison, {'parent', 'draft', 'keep', 'delete', 'upload'}, also set in self.nbDetails[key]['repoVersion'].
+
+    """
+    client = self.getRepoClient()
+    parent = self.nbDetails[key]['repoInfo']
+
+    if not parent.get('submitted'):
+        print(f"***Record {parent['id']} not published, skipping new version. Use uploadRepoFiles() to update files in the existing draft.")
+        return None
 
-        if r.ok:
-            print(f"File upload OK: {fileIn}")
+    print(f"\n***New version for job: {self.nbDetails[key]['title']}, record {parent['id']}")
+
+    # Set draft, or use published record for dry run
+    if dryRun:
+        r = client.getDeposition(parent['id'])
+    else:
+        r = client.newVersion(parent['id'])
+
+    if not r.ok:
+        print(f"Repo comms failed, code: {r.status_code}")
+        return None
+
+    draft = r.json()
+
+    # Compare carried-over files with repoFiles
+    # Checksums may be prefixed ("md5:<hash>"), as per repoUpload.getBucketFiles().
+    repoFiles = {item['filename']: {'md5':item['checksum'].split(':')[-1], 'size':item['filesize'], 'id':item['id']} for item in draft.get('files', [])}
+    localNames = {Path(fileIn).name: fileIn for fileIn in self.nbDetails[key]['repoFiles']}
+
+    version = {'parent':parent['id'], 'draft':None if dryRun else draft['id'], 'keep':[], 'delete':[], 'upload':[]}
+    for name in repoFiles:
+        if name not in localNames:
+            version['delete'].append(name)
+
+    for name, fileIn in localNames.items():
+        if not local:
+            action = 'replace' if name in repoFiles else 'upload'
         else:
-            print(f"File upload failed: {fileIn}")
+            action = compareFile(fileIn, repoFiles = repoFiles, name = name)['action']
 
-        outputs.append([r.ok, r.json()])
+        if action == 'skip':
+            version['keep'].append(name)
+        elif action == 'replace':
+            version['keep' if not local else 'delete'].append(name)
+            version['upload'].append(name)
+        else:
+            version['upload'].append(name)
 
-    self.nbDetails[key]['repoFilesUpload'] = outputs
+    if verbose:
+        print(f"Keep {len(version['keep'])} files, delete {len(version['delete'])}, upload {len(version['upload'])}.")
+        pprint.pprint(version)
 
-    # return 'Not implemented'
+    if dryRun:
+        print('\n***New version dry run')
+        return version
+
+    # Remove stale/changed files from draft
+    for name in version['delete']:
+        r = client.deleteFile(draft['id'], repoFiles[name]['id'])
+        if not r.ok:
+            print(f"Failed to remove file {name} from draft {draft['id']}, code: {r.status_code}")
+
+    # Set new draft as current record
+    self.nbDetails[key]['repoInfo'] = draft
+    self.nbDetails[key]['doi'] = draft['metadata']['prereserve_doi']['doi']
+    self.nbDetails[key]['repoVersion'] = version
+    client.addIndex(draft)
+    print(f"***New version draft {draft['id']} set, DOI {self.nbDetails[key]['doi']}.")
+
+    # Clear upload progress for key (local and remote), results are for the previous bucket.
+    progressFile = self.jsonProcFile.with_name(self.jsonProcFile.stem + '_uploadProgress.json')
+    if clearProgress(progressFile, key):
+        print(f"Cleared upload progress for key {key} from {progressFile}.")
+
+    remoteProgress = Path(self.hostDefn[self.host]['nbProcDir'], self.jsonProcFile.name + '.progress').as_posix()
+    if self.c.run(f"test -f {remoteProgress}", warn = True, hide = True).ok:
+        tmpFile = self.jsonProcFile.with_name(self.jsonProcFile.name + '.progress')
+        self.c.get(remoteProgress, local = tmpFile.as_posix())
+        if clearProgress(tmpFile, key):
+            self.c.put(tmpFile.as_posix(), remote = remoteProgress)
+            print(f"Cleared upload progress for key {key} from {remoteProgress}.")
+
+        tmpFile.unlink()
+
+    if upload and local:
+        self.uploadRepoFiles(key, **kwargs)
+
+    return version
 
 
 def checkRepoFiles(self, key = None, searchString = None):
@@ -328,23 +414,25 @@ def checkRepoFiles(self, key = None, searchString = None):
 
     Supply either item key or search string.
 
+    Returns list of depositions.
+
     TODO: add comparison with local file list if key supplied.
 
     """
 
-    ACCESS_TOKEN = initZenodo(self.hostDefn['localhost']['localSettings']/'zenodoSettings.dat')
-
     # Use existing search routine, should be OK to search on ID, although might be better to just use directly?
     if searchString is not None:
-        r = self.searchRepo(searchString = searchString)
+        items = self.searchRepo(searchString = searchString)
     elif key is not None:
         # Use ID if no search string supplied
-        r = requests.get(f"https://zenodo.org/api/deposit/depositions/{self.nbDetails[key]['repoInfo']['id']}?access_token={ACCESS_TOKEN}")
+        r = self.getRepoClient().getDeposition(self.nbDetails[key]['repoInfo']['id'])
+        r.raise_for_status()
+        items = [r.json()]
     else:
         print('*** Must supply key or search string.')
         return None
 
-    for n, item in enumerate(r.json()):
+    for n, item in enumerate(items):
         print(f"Item {n}: {item['title']}")
         print(f"ID {item['id']}, DOI {item['doi']}, created {item['created']}, submitted {item['submitted']}.\n")
 
@@ -353,21 +441,20 @@ def checkRepoFiles(self, key = None, searchString = None):
                 print(f"File {m}: {file['filename']}")
                 print(f"Size: {convert_bytes(file['filesize'])}")
 
-    return r
+    return items
 
 
 def publishRepoItem(self, key, manualVerify = True):
     """Publish item/record on Zenodo."""
 
-    ACCESS_TOKEN = initZenodo(self.hostDefn['localhost']['localSettings']/'zenodoSettings.dat')
+    client = self.getRepoClient()
 
     print(f"\n***Publish repo for job: {self.nbDetails[key]['title']}, with {self.nbDetails[key]['repo']}")
     if manualVerify and self.nbDetails[key]['pkg']:
         uploadFlag = input(f"Confirm publishing? (y/n) ")
 
         if uploadFlag == 'y':
-            r = requests.post('https://zenodo.org/api/deposit/depositions/%s/actions/publish' % self.nbDetails[key]['repoInfo']['id'],
-                                 params={'access_token': ACCESS_TOKEN} )
+            r = client.publishDeposition(self.nbDetails[key]['repoInfo']['id'])
             print(r.json())
 
         else:
@@ -375,8 +462,7 @@ def publishRepoItem(self, key, manualVerify = True):
 
 
     elif self.nbDetails[key]['pkg']:
-        r = requests.post('https://zenodo.org/api/deposit/depositions/%s/actions/publish' % self.nbDetails[key]['repoInfo']['id'],
-                             params={'access_token': ACCESS_TOKEN} )
+        r = client.publishDeposition(self.nbDetails[key]['repoInfo']['id'])
         print(r.json())
 
     else:
@@ -393,7 +479,17 @@ def publishRepoItem(self, key, manualVerify = True):
 # - Add optional elec structure file to pkg.
 # - Check if arch exists before running
 # - Consider moving main loop to remote code - what are the dependecies here?  Should just be able to pass a dir path, or maybe write list to file and push to host?
-def buildArch(self, localLoop = True, dryRun = True, hide = True):
+def getArchFormats(self):
+    """Archive formats for datasets, as set in self.nbDetails[key]['archFormat'] by buildArch(). Returns single format if all datasets match, otherwise {key: format}."""
+    archFormats = {key: self.nbDetails[key].get('archFormat', 'zip') for key in self.nbDetails if key!='proc'}
+
+    if len(set(archFormats.values())) == 1:
+        return list(archFormats.values())[0]
+
+    return archFormats
+
+
+def buildArch(self, localLoop = True, dryRun = True, hide = True, workers = None, policy = None, maxSize = 90, refresh = False, pkgFormat = None):
     """
     Build archives/packages for job.
 
@@ -414,6 +510,30 @@ def buildArch(self, localLoop = True, dryRun = True, hide = True):
         If false, print all Fabric output to screen (localLoop = True case only)
         If true, only summary data is printed.
 
+    workers : int, optional, default = None
+        For localLoop = False, number of processes for parallel archive building on host.
+        If None, all host cores are used. Per-archive timing and size stats are written to pkgDir/<nbProcDir name>_pkgStats.json, see getArchLogs().
+
+    policy : dict, optional, default = None
+        Compression policy for the dataset, {suffix: [method, level]}, with method 'store', 'deflate', 'bzip2' or 'lzma', and 'default' for other file types.
+        If None, use default policy in repo/pkgFiles.py (compressPolicy). See benchArch() for codec benchmarks & suggested policy.
+        Policy is written to nbProcDir on host, and recorded in self.nbDetails['proc']['archPolicy'].
+
+    maxSize : int, optional, default = 90
+        Maximum archive size (MB). Larger archives are split into independent archives, <archive stem>_partNN.zip, on file boundaries.
+        Set to None for single archives. Parts are listed in self.nbDetails[key]['archParts'] by checkArchFiles(), and used for repoFiles.
+
+    refresh : bool, optional, default = False
+        Refresh existing archives rather than rebuilding: archive manifests are compared with current files, and only archives with changed inputs are updated (see repo/pkgFiles.refreshPkg()).
+        For localLoop = False, pkgFileList is then updated in place from the archive stats by getArchLogs().
+
+    pkgFormat : str or dict, optional, default = None
+        Archive format, 'zip' or 'tar.zst', for all datasets, or per dataset as {key: format}.
+        If None, or for keys missing from the dict, use the existing self.nbDetails[key]['archFormat'] if set, otherwise 'zip'.
+        For 'tar.zst', files are packaged as tar streamed through multi-threaded zstd compression, with an index for random member access (see repo/pkgFiles.buildPkgTar()). This is much faster than zip with LZMA for large jobs (e.g. wf-sph), but requires zstandard on host.
+        Compression policy is not used in this case. Format is recorded in self.nbDetails[key]['archFormat'], and self.nbDetails['proc']['archFormat'] (single format, or {key: format} for mixed formats).
+        For localLoop = False, per-notebook formats are written to nbProcDir on host, and passed to repo/pkgFiles.py (formats=<JSON file>).
+
     To do
     -----
     - Search logic for electronic structure files.
@@ -430,6 +550,45 @@ def buildArch(self, localLoop = True, dryRun = True, hide = True):
 
     print(f"Pkg dir: {self.hostDefn[self.host]['pkgDir']}")
 
+    # Set archive options for pkgFiles.py
+    sizeArg = f"maxSize={maxSize}" if maxSize is not None else ''
+    sizeArg += f" refresh={refresh}"
+
+    # Set archive format per dataset.
+    archFormats = {}
+    for key in self.nbDetails:
+        if key!='proc':
+            if isinstance(pkgFormat, dict):
+                archFormats[key] = pkgFormat.get(key, self.nbDetails[key].get('archFormat', 'zip'))
+            elif pkgFormat is None:
+                archFormats[key] = self.nbDetails[key].get('archFormat', 'zip')
+            else:
+                archFormats[key] = pkgFormat
+
+            if archFormats[key] not in pkgFormats:
+                print(f"*** Archive format {archFormats[key]} for key {key} not supported, use one of {list(pkgFormats)}.")
+                return None
+
+            self.nbDetails[key]['archFormat'] = archFormats[key]
+
+    if 'proc' in self.nbDetails:
+        self.nbDetails['proc']['archFormat'] = self.getArchFormats()
+
+    # Push compression policy file to host if set.
+    policyArg = ''
+    if policy is not None:
+        policyFile = Path(self.hostDefn['localhost']['wrkdir'], f"{self.hostDefn[self.host]['nbProcDir'].name}_pkgPolicy.json")
+        with open(policyFile, 'w') as f:
+            json.dump(policy, f, indent=2)
+
+        remotePolicy = Path(self.hostDefn[self.host]['nbProcDir'], policyFile.name).as_posix()
+        self.c.put(policyFile.as_posix(), remote = remotePolicy)
+        policyArg = f"policy={remotePolicy}"
+        print(f"Compression policy: {policy}")
+
+        if 'proc' in self.nbDetails:
+            self.nbDetails['proc']['archPolicy'] = policy
+
     # Loop over Notebooks locally and package corresponding files.
     # Useful for testing, but not good for large jobs.
     if localLoop:
@@ -455,7 +614,7 @@ def buildArch(self, localLoop = True, dryRun = True, hide = True):
                 jRoot = setJobRoot(item, self.hostDefn[self.host]['jobSchema'])
                 self.nbDetails[key]['jRoot'] = jRoot
 
-                archName = Path(self.hostDefn[self.host]['pkgDir'], item.stem + '.zip')
+                archName = Path(self.hostDefn[self.host]['pkgDir'], item.stem + pkgFormats[archFormats[key]])
 
                 # Check if archive exists & get file list
 
@@ -473,7 +632,7 @@ def buildArch(self, localLoop = True, dryRun = True, hide = True):
                     # result = job.c.run('python /home/femtolab/python/epsman/nbHeaderPost.py ' + f'{fileIn} {doi}')
                     # result = job.c.run('python /home/femtolab/python/epsman/repo/pkgFiles.py' + f" {job.hostDefn[job.host]['pkgDir'].as_posix()} {jRoot[1]}_{jRoot[2]} {archName}")
                     result = self.c.run(f"python {Path(self.hostDefn[self.host]['repoScpPath'], self.scpDefnRepo['pkg']).as_posix()} \
-                                        {self.hostDefn[self.host]['nbProcDir'].as_posix()} {dryRun} {archName} {self.hostDefn[self.host]['jobSchema']} {jRoot}", hide = hide)
+                                        {self.hostDefn[self.host]['nbProcDir'].as_posix()} {dryRun} {archName} {self.hostDefn[self.host]['jobSchema']} {jRoot} {policyArg} {sizeArg} format={archFormats[key]}", hide = hide)
 
                 if dryRun:
                     # self.nbDetails[key]['result'] = result
@@ -504,6 +663,15 @@ def buildArch(self, localLoop = True, dryRun = True, hide = True):
                     self.nbDetails[key]['archBuilt'] = result.stdout
 
     else:
+        # Push archive formats to host, by notebook name, for full dir run.
+        formatsFile = Path(self.hostDefn['localhost']['wrkdir'], f"{self.hostDefn[self.host]['nbProcDir'].name}_pkgFormats.json")
+        with open(formatsFile, 'w') as f:
+            json.dump({Path(self.nbDetails[key]['file']).stem: archFormats[key] for key in archFormats}, f, indent=2)
+
+        remoteFormats = Path(self.hostDefn[self.host]['nbProcDir'], formatsFile.name).as_posix()
+        self.c.put(formatsFile.as_posix(), remote = remoteFormats)
+        sizeArg += f" formats={remoteFormats}"
+
         # For remote run, call python code on host machine,
         # In this case, do this for full build dir, and loop on remote machine.
         with self.c.prefix(f"source {self.hostDefn[self.host]['condaPath']} {self.hostDefn[self.host]['condaEnv']}"):
@@ -511,9 +679,11 @@ def buildArch(self, localLoop = True, dryRun = True, hide = True):
             # result = self.c.run(f"python {Path(self.hostDefn[self.host]['repoScpPath'], self.scpDefnRepo['pkg']).as_posix()} {self.hostDefn[self.host]['nbProcDir'].as_posix()} {dryRun} {self.hostDefn[self.host]['pkgDir'].as_posix()}")
 
             # Nohup version to allow for lengthy remote
+            # Archives are built in parallel on host, with one consolidated log and stats file.
+            self.nbDetails['proc']['archStats'] = Path(self.hostDefn[self.host]['pkgDir'], f"{self.hostDefn[self.host]['nbProcDir'].name}_pkgStats.json").as_posix()
             result = self.c.run(f"{Path(self.hostDefn[self.host]['repoScpPath'], self.scpDefnRepo['pkgNohup']).as_posix()} {Path(self.hostDefn[self.host]['repoScpPath'], self.scpDefnRepo['pkg']).as_posix()} \
                                         {self.hostDefn[self.host]['nbProcDir'].as_posix()} {dryRun} {self.hostDefn[self.host]['pkgDir'].as_posix()} {self.hostDefn[self.host]['jobSchema']} \
-                                        {self.nbDetails['proc']['archLog']}",
+                                        {self.nbDetails['proc']['archLog']} {f'workers={workers}' if workers is not None else ''} {policyArg} {sizeArg}",
                                         warn = True, timeout = 10)
 
         # TODO: Logic for handling stdout here.
@@ -523,12 +693,46 @@ def buildArch(self, localLoop = True, dryRun = True, hide = True):
 
         return result
 
+# Compression codec benchmarks
+def benchArch(self, sampleMB = 100, tol = 0.05, hide = False):
+    """
+    Run compression codec benchmarks on host, for sample of files from nbProcDir.
+
+    Wrapper for repo/pkgBench.py, which reports throughput vs. compression ratio per file type and codec.
+
+    Parameters
+    ----------
+    sampleMB : int, optional, default = 100
+        Total sample size (MB), split between file types.
+
+    tol : float, optional, default = 0.05
+        Tolerance for suggested policy: fastest codec with compressed size within (1+tol) x best size.
+
+    hide : bool, default = False
+        Hide Fabric output (benchmark table).
+
+    Returns
+    -------
+    dict
+        Suggested compression policy, also set to self.archPolicy. Pass to buildArch(policy = ...) to use.
+
+    """
+
+    with self.c.prefix(f"source {self.hostDefn[self.host]['condaPath']} {self.hostDefn[self.host]['condaEnv']}"):
+        result = self.c.run(f"python {Path(self.hostDefn[self.host]['repoScpPath'], self.scpDefnRepo['pkgBench']).as_posix()} \
+                            {self.hostDefn[self.host]['nbProcDir'].as_posix()} {sampleMB} {tol}", hide = hide)
+
+    self.archPolicy = json.loads(result.stdout.splitlines()[-1])
+
+    return self.archPolicy
+
+
 # Update archive with new file(s)
 def updateArch(self, fileIn, archName, dryRun = True):
     """
     Add file to existing archive.
 
-    NOTE: if file exists in archive it will be skipped, not be updated, since python ZipFile does not support this.
+    NOTE: if file exists in archive it will be skipped if unchanged, or replaced if changed (unchanged members are copied without recompression), see repo/pkgFiles.updatePkg().
     NOTE: if file path root is different from archive root path (as set in call below) it will be addded to the archive root, otherwise relative path will be preserved.
     TODO: error checking, will fail if file is missing.
 
@@ -548,10 +752,129 @@ def updateArch(self, fileIn, archName, dryRun = True):
     return result
 
 
-def checkArchFiles(self, key = None, archName = None, verbose = False):
+# Shared files across datasets
+def setCommonArch(self, dryRun = True, verbose = True):
+    """
+    Find electronic structure files shared across datasets, by content hash, and package them once as common component archives.
+
+    Shared files (identical content, e.g. the same Molden and GAMESS files for all orbitals of a molecule) are added to a common archive, <pkgDir>/<file stem>_common_<hash>.zip,
+    instead of each per-orbital archive. Datasets sharing the same set of files use the same common archive, which is uploaded with the first dataset (owner), and referenced by the others in their JSON metadata.
+
+    Hashes are computed on host in a single call (sha256sum).
+
+    Sets self.nbDetails[key]['commonArch'] = {'archName', 'files', 'sha256', 'owner', 'doi'} for datasets with shared files.
+
+    Parameters
+    ----------
+    dryRun : bool, default = True
+        If True, set details but don't write archives.
+
+    verbose : bool, default = True
+        Print details of common archives.
+
+    Returns
+    -------
+    dict
+        Shared files per key, {key: [files]}, these should be skipped for per-dataset archives.
+
+    """
+
+    # Electronic structure files per dataset
+    esFiles = {}
+    for key in self.nbDetails:
+        if key!='proc' and self.nbDetails[key]['pkg']:
+            esFiles[key] = [self.nbDetails[key][item] for item in ['elecStructure', 'elecStructureGamess']
+                            if (self.nbDetails[key].get(item) is not None) and not self.nbDetails[key][item].startswith('***Missing')]
+
+    fileList = sorted({fileIn for files in esFiles.values() for fileIn in files})
+    if not fileList:
+        return {}
+
+    # Content hashes on host, single call.
+    result = self.c.run('sha256sum ' + ' '.join(f"'{fileIn}'" for fileIn in fileList), warn = True, hide = True)
+    fileHash = {}
+    for line in result.stdout.splitlines():
+        fHash, fileIn = line.split(maxsplit = 1)
+        fileHash[fileIn.lstrip('*')] = fHash
+
+    # Find hashes used by more than one dataset
+    hashKeys = {}
+    for key, files in esFiles.items():
+        for fileIn in files:
+            if fileIn in fileHash:
+                hashKeys.setdefault(fileHash[fileIn], set()).add(key)
+
+    # Group datasets by set of shared files, one common archive per group.
+    groups = {}
+    shared = {}
+    for key, files in esFiles.items():
+        shared[key] = [fileIn for fileIn in files if len(hashKeys.get(fileHash.get(fileIn), [])) > 1]
+        if shared[key]:
+            groups.setdefault(tuple(sorted(fileHash[fileIn] for fileIn in shared[key])), []).append(key)
+
+    for hashes, keys in groups.items():
+        owner = keys[0]
+        files = shared[owner]
+        archName = Path(self.hostDefn[self.host]['pkgDir'], f"{Path(files[0]).stem}_common_{hashlib.sha256(''.join(hashes).encode()).hexdigest()[:10]}.zip").as_posix()
+
+        # Add files to common archive, identical files are skipped on rerun.
+        for fileIn in files:
+            self.updateArch(fileIn, archName, dryRun = dryRun)
+
+        for key in keys:
+            self.nbDetails[key]['commonArch'] = {'archName':archName,
+                                                 'files':[Path(fileIn).name for fileIn in files],
+                                                 'sha256':{Path(fileIn).name:fileHash[fileIn] for fileIn in files},
+                                                 'owner':owner,
+                                                 'doi':self.nbDetails[owner]['doi']
+                                                 }
+
+        if verbose:
+            print(f"\n***Common archive {archName}")
+            print(f"Files: {[Path(fileIn).name for fileIn in files]}")
+            print(f"Datasets: {keys}, uploaded with {owner} ({self.nbDetails[owner]['doi']})")
+
+    # Reset items no longer shared
+    for key in esFiles:
+        if not shared.get(key):
+            self.nbDetails[key].pop('commonArch', None)
+
+    return {key:files for key, files in shared.items() if files}
+
+
+def listArchFiles(self, archList = None):
+    """
+    Get structured archive member lists from remote, from zip central directories only, in a single remote call (see repo/pkgList.py).
+
+    Parameters
+    -----------
+    archList : list, optional, default = None
+        Archives to list. If None, list all archives in self.hostDefn[self.host]['pkgDir'].
+
+    Returns
+    --------
+    dict
+        {archName: {part: [[filename, file_size, compress_size, CRC], ...]}}, with part lists set to None for missing or unreadable archives.
+        Split archives (<archive stem>_partNN.zip) are listed by part.
+
+    """
+
+    if archList is None:
+        archList = [self.hostDefn[self.host]['pkgDir']]
+
+    with self.c.prefix(f"source {self.hostDefn[self.host]['condaPath']} {self.hostDefn[self.host]['condaEnv']}"):
+        result = self.c.run(f"python {Path(self.hostDefn[self.host]['repoScpPath'], self.scpDefnRepo['pkgList']).as_posix()} "
+                            + ' '.join(f"'{Path(item).as_posix()}'" for item in archList), hide = True)
+
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def checkArchFiles(self, key = None, archName = None, verbose = False, archMembers = None):
     """
     Check archive file contents on remote and compare with local contents list
 
+    Archive member lists are read from the zip central directory only, see listArchFiles().
+
     Parameters
     -----------
     key : int or str
@@ -562,6 +885,12 @@ def checkArchFiles(self, key = None, archName = None, verbose = False):
 
     Either key or archName must be supplied.
 
+    verbose : bool, default = False
+        Print full local and archive file lists.
+
+    archMembers : dict, optional, default = None
+        Archive listing for archName, {part: members}, as returned by listArchFiles(). If None, get listing from remote.
+
     Returns
     --------
     localListRel, archFiles : list
@@ -570,8 +899,8 @@ def checkArchFiles(self, key = None, archName = None, verbose = False):
     fileComp : list
         Difference between lists.
 
-    result : Fabric object
-        Full return from remote, .stdout includes archFiles and file details.
+    archMembers : dict
+        Archive members per part, {part: [[filename, file_size, compress_size, CRC], ...]}.
 
     """
 
@@ -582,59 +911,51 @@ def checkArchFiles(self, key = None, archName = None, verbose = False):
         print('Skipping archive checks, no archive supplied.')
         return None
 
-    # Check if file exists on remote
-    # Note this returns a list
-    archExists = self.checkFiles(archName)
+    # Get arch contents from remote, includes split archive parts (<archive stem>_partNN.zip, see pkgFiles.buildPkgParts()).
+    if archMembers is None:
+        archMembers = self.listArchFiles([archName])[Path(archName).as_posix()]
 
-    if archExists[0]:
-        # Get arch contents from remote via Fabric.
-        with self.c.prefix(f"source {self.hostDefn[self.host]['condaPath']} {self.hostDefn[self.host]['condaEnv']}"):
-            result = self.c.run(f"python -m zipfile -l {archName}", hide = True)
-
-        # Compare with local lsit
-        # archFiles = result.stdout.splitlines()
-        # localList = self.nbDetails[key]['pkgFileList'][5:]
-        # fileComp = list(set(localList) - set(archFiles))  # Compare lists as sets
-        archFiles = [(line.split()[0]) for line in result.stdout.splitlines()[1:]]  # Keep file names only (drop header, and file properties)
-        localList = self.nbDetails[key]['pkgFileList']
-
-        # Test & set relative paths for local files in archive
-        localListRel = []
-        for fileIn in localList:
+    archParts = list(archMembers.keys())
+    if key is not None:
+        self.nbDetails[key]['archParts'] = archParts
+
+    # Local list, with relative paths for local files in archive
+    localListRel = []
+    if key is not None:
+        for fileIn in self.nbDetails[key]['pkgFileList']:
             try:
                 localListRel.append(Path(fileIn).relative_to(self.hostDefn[self.host]['nbProcDir']).as_posix())
             except ValueError:
                 localListRel.append(Path(fileIn).name)  # In this case just take file name, will go in archive root
 
+    archFiles = []
+    if all(members is not None for members in archMembers.values()):
+        archFiles = [item[0] for members in archMembers.values() for item in members]
+
         fileComp = list(set(localListRel) - set(archFiles))  # Compare lists as sets
 
         # Results
         print(f"\n***Checking archive: {archName}")
-        print(f"Found {len(archFiles)} on remote. Local list length {len(localList)}.")
+        print(f"Found {len(archFiles)} on remote. Local list length {len(localListRel)}.")
 
         # This will run if fileComp is not an empty list
         if fileComp:
-            print(f"Difference: {len(archFiles) - len(localList)}")
+            print(f"Difference: {len(archFiles) - len(localListRel)}")
             print("File differences:")
             print(*fileComp, sep = '\n')
 
         else:
             print("Local and remote file lists match.")
 
-
     else:
         print(f"***Missing archive: {archName}")
         fileComp = None
 
     # Set fileComp
     # Either empty, None or list of differences.
-    self.nbDetails[key]['archFileCheck'] = fileComp
-    if fileComp:
-        self.nbDetails[key]['archFilesOK'] = False
-    elif fileComp is None:
-        self.nbDetails[key]['archFilesOK'] = False
-    else:
-        self.nbDetails[key]['archFilesOK'] = True
+    if key is not None:
+        self.nbDetails[key]['archFileCheck'] = fileComp
+        self.nbDetails[key]['archFilesOK'] = (fileComp is not None) and not fileComp
 
     if verbose:
         print("\n***Local file list:")
@@ -642,7 +963,46 @@ def checkArchFiles(self, key = None, archName = None, verbose = False):
         print("\n***Archive file list:")
         print(*archFiles, sep='\n')
 
-    return localListRel, archFiles, fileComp, result
+    return localListRel, archFiles, fileComp, archMembers
+
+
+def checkArchAll(self, keyList = None, verbose = False):
+    """
+    Check archive contents for all items in self.nbDetails, from a single remote listing of all archives in pkgDir (see listArchFiles()).
+
+    Sets self.nbDetails[key]['archParts'], ['archFileCheck'] and ['archFilesOK'] as per checkArchFiles().
+
+    Parameters
+    -----------
+    keyList : list, optional, default = None
+        Keys to check. If None, check all items with archives set.
+
+    verbose : bool, default = False
+        Print full local and archive file lists.
+
+    Returns
+    --------
+    dict
+        Archive members for all archives, {archName: {part: members}}, also set to self.archMembers.
+
+    """
+
+    self.archMembers = self.listArchFiles()
+
+    if keyList is None:
+        keyList = [key for key in self.nbDetails if key != 'proc']
+
+    for key in keyList:
+        if not self.nbDetails[key].get('archName'):
+            continue
+
+        archName = Path(self.nbDetails[key]['archName']).as_posix()
+        self.checkArchFiles(key, verbose = verbose, archMembers = self.archMembers.get(archName, {archName:None}))
+
+    nOK = sum(1 for key in keyList if self.nbDetails[key].get('archFilesOK'))
+    print(f"\n***Checked {len(keyList)} items, {nOK} archives OK.")
+
+    return self.archMembers
 
 
 # Set electronic structure file
@@ -757,6 +1117,27 @@ def getArchLogs(self):
     else:
         print(f"Archives not yet written.")
 
+    # Pull per-archive stats, if written (parallel build).
+    if self.nbDetails['proc'].get('archStats') is not None:
+        try:
+            result = self.c.get(self.nbDetails['proc']['archStats'], local = Path(self.hostDefn['localhost']['wrkdir'], Path(self.nbDetails['proc']['archStats']).name).as_posix())
+            with open(result.local) as f:
+                self.archStats = json.load(f)
+
+            print(f"Pulled archive stats {result.remote}, {len(self.archStats)} archives, {sum(item['OK'] for item in self.archStats)} OK.")
+
+            # Update pkgFileList from final archive contents (manifests).
+            archFiles = {item['archName']:item.get('fileList') for item in self.archStats}
+            nUpdated = 0
+            for key in self.nbDetails:
+                if key!='proc' and archFiles.get(self.nbDetails[key].get('archName')) is not None:
+                    self.nbDetails[key]['pkgFileList'] = archFiles[self.nbDetails[key]['archName']]
+                    nUpdated += 1
+
+            print(f"Updated pkgFileList for {nUpdated} items.")
+        except (OSError, json.JSONDecodeError):
+            print(f"Archive stats {self.nbDetails['proc']['archStats']} not found, build may still be running.")
+
 #*********************************************
 #***  Additional utility functions
 
@@ -902,7 +1283,7 @@ def fileListCheck(self, key = None, verbose = True, errorCheck = True):
 #***High-level functions for building and updating uploads (packages)
 
 # Build notebook list & info
-def buildUploads(self, Emin = 3, repo = 'Zenodo', repoDryRun = True, verbose = False, dryRun = True, eStructCp = True, eSourceDir = None, nbSubDirs = False, schema = '2016', writeDict = None):
+def buildUploads(self, Emin = 3, repo = 'Zenodo', repoDryRun = True, verbose = False, dryRun = True, eStructCp = True, eSourceDir = None, nbSubDirs = False, schema = '2016', writeDict = None, refresh = False, pkgFormat = None):
     """
     Build notebook file list + details + archives.
 
@@ -942,6 +1323,12 @@ def buildUploads(self, Emin = 3, repo = 'Zenodo', repoDryRun = True, verbose = F
         Set to overwrite ndDetails() dictionary.
         If not set, user will be prompted to overwrite if dict exists.
 
+    refresh : bool, default = False
+        Refresh existing archives from manifests, and only update archives with changed files, rather than rebuilding all archives. See buildArch().
+
+    pkgFormat : str or dict, default = None
+        Archive format, 'zip' or 'tar.zst', for all datasets or per dataset as {key: format}. If None, use existing self.nbDetails[key]['archFormat'], or 'zip'. See buildArch().
+
 
     TODO:
     - Fix inconsistent handling of subDirs. Currently set for getNotebookList(), but not remote glob functions.
@@ -964,7 +1351,7 @@ def buildUploads(self, Emin = 3, repo = 'Zenodo', repoDryRun = True, verbose = F
 
     # Pkg dry run - use this to create file list etc.
     # This will be called again later to build archives for upload.
-    self.buildArch()
+    self.buildArch(pkgFormat = pkgFormat)
 
     # If eStructCp = True this will copy electronic structure files to job dirs.
     # If dryRun = True will just display commands.
@@ -1001,7 +1388,8 @@ def buildUploads(self, Emin = 3, repo = 'Zenodo', repoDryRun = True, verbose = F
     self.nbDetails['proc'] = {'host':self.host,
                               'nbProcDir':self.hostDefn[self.host]['nbProcDir'].as_posix(),
                               'date':datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
-                              'archLog':None
+                              'archLog':None,
+                              'archFormat':self.getArchFormats()
                               }
 
     # Pkg files - build archives for all jobs on remote
@@ -1010,7 +1398,7 @@ def buildUploads(self, Emin = 3, repo = 'Zenodo', repoDryRun = True, verbose = F
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")
         self.nbDetails['proc']['archLog'] = Path(self.hostDefn[self.host]['nbProcDir'],
                                             f"{self.hostDefn[self.host]['nbProcDir'].name}_{self.host}_archLog_nohup_{timestamp}.log").as_posix()
-        result = self.buildArch(localLoop = False, dryRun = dryRun)
+        result = self.buildArch(localLoop = False, dryRun = dryRun, refresh = refresh)  # Formats per key, as set by dry run above.
 
 
     # Write nbDetials to JSON file
@@ -1020,7 +1408,25 @@ def buildUploads(self, Emin = 3, repo = 'Zenodo', repoDryRun = True, verbose = F
     self.nbDetailsSummary()
 
 
-def updateUploads(self, dryRun = True, verbose = False, repo = 'Zenodo'):
+def updateUploads(self, dryRun = True, verbose = False, repo = 'Zenodo', shareES = True):
+    """
+    Update notebooks & archives with DOIs, add electronic structure files to archives, and set repo file lists.
+
+    Parameters
+    ----------
+    dryRun : bool, default = True
+        Set to False to initiate jobs with repo and write archives.
+
+    verbose : bool, default = False
+        Print details.
+
+    repo : str, default = 'Zenodo'
+        Repo to use.
+
+    shareES : bool, default = True
+        Package electronic structure files shared by several datasets once, in a common archive (see setCommonArch()), rather than in every dataset archive.
+
+    """
 
     # UPDATE NOTEBOOKS & ARCHIVES with DOI.
     # PLUS add missing files to archives.
@@ -1043,6 +1449,12 @@ def updateUploads(self, dryRun = True, verbose = False, repo = 'Zenodo'):
     # TODO: pull info here on notebook writing...?  Currently will be printed to screen only.
     self.nbWriteHeader(writeDict = False, hide = (not verbose))
 
+    # Set common archives for shared electronic structure files
+    if shareES:
+        shared = self.setCommonArch(dryRun = dryRun, verbose = verbose)
+    else:
+        shared = {}
+
     # Update archives
     for key in self.nbDetails:
         # Skip metadata key if present
@@ -1056,7 +1468,7 @@ def updateUploads(self, dryRun = True, verbose = False, repo = 'Zenodo'):
             fileList = []
             # if not (self.nbDetails[key]['file'] in self.nbDetails[key]['pkgFileList']):
             #     fileList.append(self.nbDetails[key]['file'])
-            if not (self.nbDetails[key]['elecStructure'] in self.nbDetails[key]['pkgFileList']):
+            if not (self.nbDetails[key]['elecStructure'] in self.nbDetails[key]['pkgFileList'] + shared.get(key, [])):
                 if self.nbDetails[key]['elecStructure'].startswith('***Missing'):
                     pass
                 else:
@@ -1064,7 +1476,7 @@ def updateUploads(self, dryRun = True, verbose = False, repo = 'Zenodo'):
 
             # Repeat for Gamess file - UGLY should change to parse as list here
             # TODO: change elecStructure files to list format
-            if not (self.nbDetails[key]['elecStructureGamess'] in self.nbDetails[key]['pkgFileList']):
+            if not (self.nbDetails[key]['elecStructureGamess'] in self.nbDetails[key]['pkgFileList'] + shared.get(key, [])):
                 if self.nbDetails[key]['elecStructureGamess'].startswith('***Missing'):
                     pass
                 else:
@@ -1082,21 +1494,42 @@ def updateUploads(self, dryRun = True, verbose = False, repo = 'Zenodo'):
                         self.nbDetails[key]['pkgFileList'].append(fileIn)  # Update pkg filelist
 
 
-            # Check archives.
-            # NOTE: if the above code is rerun it will append the same files repeatedly, but they won't be added to the archive.
-            # TODO: additional error checking above!
-            # TODO: Update arch files with any missing items?
-            self.checkArchFiles(key);
-
-            # TODO: consider filesize, might be upload limit (100Mb per file on Zenodo...?)
-            # NOW HANDLED on remote at upload time by converting to multipart archive.
+    # Check archives, single remote listing for all archives.
+    # NOTE: if the above code is rerun it will append the same files repeatedly, but they won't be added to the archive.
+    # TODO: additional error checking above!
+    # TODO: Update arch files with any missing items?
+    keyList = [key for key in self.nbDetails if key!='proc' and self.nbDetails[key]['pkg']]
+    self.checkArchAll(keyList = keyList)
 
-            # Set file list for repo upload
-            self.nbDetails[key]['repoFiles'] = [Path(Path(self.nbDetails[key]['file']).parent, 'readme.txt').as_posix(),
-                                                self.nbDetails[key]['file'],
-                                                Path(self.nbDetails[key]['file']).with_suffix('.md').as_posix(),
-                                                Path(self.nbDetails[key]['file']).with_suffix('.json').as_posix(),
-                                                self.nbDetails[key]['archName']]
+    for key in keyList:
+        # TODO: consider filesize, might be upload limit (100Mb per file on Zenodo...?)
+        # NOW HANDLED at build time by splitting into independent archives (see buildArch(maxSize)), parts set by checkArchFiles().
+        # Older single archives are still converted to multipart archives on remote at upload time.
+
+        # Set file list for repo upload
+        self.nbDetails[key]['repoFiles'] = [Path(Path(self.nbDetails[key]['file']).parent, 'readme.txt').as_posix(),
+                                            self.nbDetails[key]['file'],
+                                            Path(self.nbDetails[key]['file']).with_suffix('.md').as_posix(),
+                                            Path(self.nbDetails[key]['file']).with_suffix('.json').as_posix()]
+        self.nbDetails[key]['repoFiles'].extend(self.nbDetails[key].get('archParts', [self.nbDetails[key]['archName']]))
+
+        # Archive index for tar.zst archives, for random member access.
+        if self.nbDetails[key].get('archFormat') == 'tar.zst':
+            self.nbDetails[key]['repoFiles'].extend(getManifestFile(item).as_posix() for item in self.nbDetails[key].get('archParts', [self.nbDetails[key]['archName']]))
+
+        # Common archive for shared files, uploaded with owner dataset only.
+        if ('commonArch' in self.nbDetails[key]) and (self.nbDetails[key]['commonArch']['owner'] == key):
+            self.nbDetails[key]['repoFiles'].append(self.nbDetails[key]['commonArch']['archName'])
+
+    # Slimmed notebooks (figures in _nbfigs, see _epsProc.slimNotebooks()) are uploaded as re-embedded copies, so figures are not lost (single remote call).
+    if keyList:
+        embedded = self.slimNotebooks(nbFileList = [self.nbDetails[key]['file'] for key in keyList], embed = True)
+        for key in keyList:
+            nbFile = Path(self.nbDetails[key]['file']).as_posix()
+            if nbFile in embedded:
+                self.nbDetails[key]['repoFiles'][1] = embedded[nbFile]
+                if verbose:
+                    print(f"Set re-embedded notebook for upload: {embedded[nbFile]}")
 
     # Update nbDetials JSON file
     self.writeNBdetailsJSON()
@@ -1180,23 +1613,49 @@ def pkgOverride(self, keyList = None, pkgFlag = True, titleFlag = None):
     self.writeNBdetailsJSON()
 
 
-def submitUploads(self, local = False):
-    """Submit uploads to repo - for packaged jobs, upload files to initialized repo from local or remote machine."""
+def submitUploads(self, local = False, workers = 4, **kwargs):
+    """
+    Submit uploads to repo - for packaged jobs, upload files to initialized repo from local or remote machine.
+
+    Files for all jobs are uploaded by a scheduler with concurrent transfers, rate limiting and retries (see repo/repoUpload.scheduleUploads()).
+    Progress is saved to <jsonProcFile stem>_uploadProgress.json (local) or <jsonProcFile>.progress (remote), and completed files are skipped if the upload is rerun.
+    Files already in the deposition with matching MD5 are also skipped, and changed files replaced, see repo/repoUpload.syncFile().
+
+    Parameters
+    ----------
+    local : bool, default = False
+        Upload from local machine, otherwise run on remote with nohup (see repo/remoteUpload.py).
+
+    workers : int, default = 4
+        Number of concurrent transfers.
+
+    **kwargs
+        Passed to scheduleUploads() for local case, e.g. rate, burst, retries.
+
+    """
 
-    # Set and upload files to repo using uploadRepoFiles()
+    # Set and upload files to repo, with scheduler.
+    client = self.getRepoClient()
     if local:
+        jobs = {}
         for key in self.nbDetails:
             # Skip metadata key if present
             if key!='proc' and self.nbDetails[key]['pkg'] and self.nbDetails[key]['archFilesOK']:
-                self.uploadRepoFiles(key)
+                jobs[key] = [client.getBucketURL(self.nbDetails[key]['repoInfo']), self.nbDetails[key]['repoFiles']]
+
+        progressFile = self.jsonProcFile.with_name(self.jsonProcFile.stem + '_uploadProgress.json')
+        progress = scheduleUploads(jobs, token = client.token, workers = workers, progressFile = progressFile, **kwargs)
+
+        for key in jobs:
+            self.nbDetails[key]['repoFilesUpload'] = list(progress[str(key)].values())
 
     else:
     # Upload on remote machine.
-        ACCESS_TOKEN = initZenodo(self.hostDefn['localhost']['localSettings']/'zenodoSettings.dat')
+        ACCESS_TOKEN = client.token
         with self.c.prefix(f"source {self.hostDefn[self.host]['condaPath']} {self.hostDefn[self.host]['condaEnv']}"):
             result = self.c.run(f"{Path(self.hostDefn[self.host]['repoScpPath'], self.scpDefnRepo['uploadNohup']).as_posix()} \
                                 {Path(self.hostDefn[self.host]['repoScpPath'], self.scpDefnRepo['upload']).as_posix()} \
-                                {self.hostDefn[self.host]['nbProcDir']/self.jsonProcFile.name} {ACCESS_TOKEN}",
+                                {self.hostDefn[self.host]['nbProcDir']/self.jsonProcFile.name} {ACCESS_TOKEN} workers={workers}",
                                 warn = True, timeout = 10)
 
         print(f"Log file set: {self.hostDefn[self.host]['nbProcDir']/self.jsonProcFile.name}")
@@ -1334,9 +1793,11 @@ def nbWriteHeader(self, writeDict = None, hide = False, verbose = False):
                 doi = self.nbDetails[n]['doi']
             if 'title' in self.nbDetails[n]:
                 title = self.nbDetails[n]['title']
+            archFormat = self.nbDetails[n].get('archFormat', 'zip')
         else:
             doi = None
             title = None
+            archFormat = 'zip'
 
         if verbose:
             print(f"Running nbHeaderPost for item {n}, title = {title}, doi = {doi}")
@@ -1346,7 +1807,7 @@ def nbWriteHeader(self, writeDict = None, hide = False, verbose = False):
         with self.c.prefix(f"source {self.hostDefn[self.host]['condaPath']} {self.hostDefn[self.host]['condaEnv']}"):
             # job.c.run('/home/femtolab/python/epsman/shell/conda_test.sh')  # Still have issues here, due to code in script
             # result = job.c.run('python /home/femtolab/python/epsman/nbHeaderPost.py ' + f'{fileIn} {doi}')
-            result = self.c.run('python ' + Path(self.hostDefn[self.host]['repoScpPath'], self.scpDefnRepo['nb-post-doi']).as_posix() + f" {nb} {doi} '{title}'", hide = hide)
+            result = self.c.run('python ' + Path(self.hostDefn[self.host]['repoScpPath'], self.scpDefnRepo['nb-post-doi']).as_posix() + f" {nb} {doi} '{title}' {archFormat}", hide = hide)
 
         # Store job info locally
         # If key is missing ignore writeDict setting and add to dict
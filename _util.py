@@ -4,10 +4,19 @@ ePSman utility functions
 
 Utility functions for use with ePSman.
 
+19/10/26    getFiles() now skips duplicate local targets, and per-file setup errors are returned as failed for the file.
+
+18/10/26    Added getFiles() for bulk parallel/compressed/resumable file pulls.
+
 27/12/19    v1
 
 """
+import json
 import re
+import zlib
+import hashlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 # Parse digits from a line using re
 # https://stackoverflow.com/questions/4289331/how-to-extract-numbers-from-a-string-in-python
@@ -172,3 +181,210 @@ def pushFile(self, fileLocal, fileRemote, overwritePrompt = True):
             return Result
 
     return True
+
+
+# Local file md5
+def md5File(fileIn, blockSize = 2**20):
+    """Get md5 hex digest for local file."""
+    h = hashlib.md5()
+    with open(fileIn, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+# Bulk file pull from remote
+def getFiles(self, fileList, localDir = None, localList = None, workers = 4, compressTypes = ('.ipynb', '.out'), overwrite = None, verbose = True):
+    """
+    Pull files from host in parallel, with compression for text files and resume for partial transfers.
+
+    - Remote sizes (one call) and md5 checksums for size matches (one call) are compared with local files, and matching files are skipped.
+    - Files are transferred concurrently, each on its own SSH channel over the existing connection (self.c).
+    - Files with suffix in compressTypes are streamed through gzip on the remote, other files are pulled via SFTP.
+    - Transfers are written to <file>.part, and resumed from the current size of any existing .part file, then renamed on completion and checked against the remote size.
+      The remote size and mtime are recorded in <file>.part.info when a transfer starts, and a .part file is only resumed if these are unchanged, otherwise the transfer restarts.
+      Resumed files are also checked against the remote md5 (one call) after the rename.
+
+    Parameters
+    ----------
+    fileList : list of str or Path
+        Remote files (full paths).
+
+    localDir : str or Path, optional, default = None
+        Local dir for files, defaults to working dir. Ignored if localList is set.
+
+    localList : list of str or Path, optional, default = None
+        Local file paths, one per item in fileList.
+
+    workers : int, optional, default = 4
+        Number of concurrent transfers.
+
+    compressTypes : tuple, optional, default = ('.ipynb', '.out')
+        File suffixes to compress on the wire.
+
+    overwrite : bool, optional, default = None
+        Overwrite local files which differ from remote. If None, prompt if any are found.
+
+    verbose : bool, optional, default = True
+        Print per-file results.
+
+    Returns
+    -------
+    results : dict
+        {remote file: status}, status one of 'pulled', 'skipped', 'kept' or 'failed: <error>'.
+
+    """
+
+    fileList = [Path(item).as_posix() for item in fileList]
+    if localList is None:
+        if localDir is None:
+            localDir = Path.cwd()
+        localList = [Path(localDir, Path(item).name) for item in fileList]
+    else:
+        localList = [Path(item) for item in localList]
+
+    results = {}
+    if not fileList:
+        return results
+
+    # Remote sizes (one call)
+    fileArgs = ' '.join([f"'{item}'" for item in fileList])
+    Result = self.c.run(f"stat -c '%s %Y %n' {fileArgs}", warn = True, hide = True)
+    remoteSize = {}
+    remoteMtime = {}
+    for line in Result.stdout.splitlines():
+        size, mtime, name = line.split(maxsplit = 2)
+        remoteSize[name] = int(size)
+        remoteMtime[name] = int(mtime)
+
+    # Compare with local files, md5 for size matches (one call)
+    sizeMatch = [item for item, local in zip(fileList, localList) if local.is_file() and local.stat().st_size == remoteSize.get(item)]
+    remoteMD5 = {}
+    if sizeMatch:
+        Result = self.c.run('md5sum ' + ' '.join([f"'{item}'" for item in sizeMatch]), warn = True, hide = True)
+        for line in Result.stdout.splitlines():
+            md5, name = line.split(maxsplit = 1)
+            remoteMD5[name] = md5
+
+    jobs = []
+    existing = []
+    targets = {}
+    for item, local in zip(fileList, localList):
+        # Only pull once per local target, duplicates would share .part files.
+        if local.resolve() in targets:
+            if targets[local.resolve()] != item:
+                results[item] = f"failed: duplicate local target {local}"
+            continue
+
+        targets[local.resolve()] = item
+
+        if item not in remoteSize:
+            results[item] = 'failed: missing on remote'
+        elif item in remoteMD5 and md5File(local) == remoteMD5[item]:
+            results[item] = 'skipped'
+        else:
+            if local.is_file():
+                existing.append(item)
+            jobs.append([item, local])
+
+    # Check overwrite for local files which differ.
+    if existing and overwrite is None:
+        print(f"*** {len(existing)} local files differ from remote.")
+        overwrite = (input('Overwrite local files? (y/n) ') == 'y')
+
+    if existing and not overwrite:
+        jobs = [job for job in jobs if job[0] not in existing]
+        for item in existing:
+            results[item] = 'kept'
+
+    # Transfer
+    self.c.open()
+    transport = self.c.client.get_transport()
+
+    resumed = []
+
+    def pull(job):
+        item, local = job
+        part = local.with_name(local.name + '.part')
+        partInfo = local.with_name(local.name + '.part.info')
+        info = {'size':remoteSize[item], 'mtime':remoteMtime[item]}
+
+        # Setup and transfer errors are returned as failed for the file, so other transfers continue.
+        try:
+            local.parent.mkdir(parents = True, exist_ok = True)
+            offset = part.stat().st_size if part.is_file() else 0
+
+            # Restart if .part is invalid, or from an older version of the remote file (size or mtime changed, or not recorded).
+            if offset:
+                try:
+                    with open(partInfo, 'r') as f:
+                        partValid = (json.load(f) == info)
+                except (OSError, ValueError):
+                    partValid = False
+
+                if (offset > remoteSize[item]) or not partValid:
+                    part.unlink()
+                    offset = 0
+
+            with open(partInfo, 'w') as f:
+                json.dump(info, f)
+
+            if offset:
+                resumed.append(item)
+
+            with open(part, 'ab') as f:
+                if Path(item).suffix in compressTypes:
+                    # Stream from offset through gzip on remote, decompress locally.
+                    chan = transport.open_session()
+                    chan.exec_command(f"tail -c +{offset + 1} '{item}' | gzip -c")
+                    d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    for block in iter(lambda: chan.recv(2**16), b''):
+                        f.write(d.decompress(block))
+                    f.write(d.flush())
+                    chan.close()
+                else:
+                    sftp = self.c.client.open_sftp()
+                    with sftp.open(item, 'rb') as rf:
+                        rf.seek(offset)
+                        rf.prefetch()
+                        for block in iter(lambda: rf.read(2**20), b''):
+                            f.write(block)
+                    sftp.close()
+
+            if part.stat().st_size != remoteSize[item]:
+                return item, f"failed: size {part.stat().st_size}, expected {remoteSize[item]}"
+
+            part.replace(local)
+            partInfo.unlink()
+            return item, 'pulled'
+
+        except Exception as e:
+            return item, f"failed: {e}"
+
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        for item, status in pool.map(pull, jobs):
+            results[item] = status
+
+    # Check resumed files against remote md5 (one call), remove on mismatch.
+    resumed = [item for item in resumed if results[item] == 'pulled']
+    if resumed:
+        Result = self.c.run('md5sum ' + ' '.join([f"'{item}'" for item in resumed]), warn = True, hide = True)
+        remoteMD5 = {}
+        for line in Result.stdout.splitlines():
+            md5, name = line.split(maxsplit = 1)
+            remoteMD5[name] = md5
+
+        localFiles = dict(zip(fileList, localList))
+        for item in resumed:
+            if md5File(localFiles[item]) != remoteMD5.get(item):
+                localFiles[item].unlink()
+                results[item] = 'failed: md5 mismatch after resume, local file removed'
+
+    if verbose:
+        for item, local in zip(fileList, localList):
+            print(f"{results[item]}: {item} -> {local}")
+
+    print(f"\n***Pulled {list(results.values()).count('pulled')} files, skipped {list(results.values()).count('skipped')} unchanged, failed {sum([1 for status in results.values() if status.startswith('failed')])}.")
+
+    return results
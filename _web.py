@@ -62,3 +62,11 @@ def updateWebNotebookFiles(self):
             print(f"cp {item} {self.hostDefn[self.host]['webSystemDir'].as_posix()}")
         else:
             print(f"cp {item} {self.hostDefn[self.host]['webSystemDir'].as_posix()} fail")
+
+    # Copy figure stores for slimmed notebooks (see _epsProc.slimNotebooks()), if present.
+    figDirs = set([Path(Path(item).parent, '_nbfigs').as_posix() for item in self.nbFileList])
+    for figDir in figDirs:
+        Result = self.c.run(f"[ -d '{figDir}' ] && cp -r '{figDir}' {self.hostDefn[self.host]['webSystemDir'].as_posix()}", warn = True, hide = True)
+
+        if Result.ok:
+            print(f"cp -r {figDir} {self.hostDefn[self.host]['webSystemDir'].as_posix()}")
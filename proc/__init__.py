@@ -0,0 +1,10 @@
+"""
+Proc functions
+
+Tools for post-processing ePS jobs with ePSproc, including batch notebook execution.
+
+These are usually run headless on remote machine.
+
+Most code is called via methods in .._epsProc.py.
+
+"""
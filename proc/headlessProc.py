@@ -0,0 +1,274 @@
+"""
+epsman
+
+Local python script for headless batch post-processing, without per-file notebooks.
+
+Can be called from Fabric for remote run case, requires only standard libs plus ePSproc (and deps) for the template code, and nbRunPool.py in the same dir.
+IPython (if available) is used to convert magics and shell commands in the template to plain Python.
+
+The code cells of the notebook template are extracted and run as a plain Python script for each DATAFILE, in one long-lived process pool (one ePSproc import per worker).
+Outputs written by the template code (.nc files) are the same as for notebook runs, and open figures are saved as <DATAFILE stem>_fig<N>.<figFormat> next to the DATAFILE.
+Per-job stdout (job summary etc.) is written to <DATAFILE stem>.headless.log.
+
+Notebooks can then be rendered later for selected jobs only, with _epsProc.runNotebooks(jobList = ...).
+
+19/10/26    Worker module imports are checked before starting the pool, and worker init errors are reported per job (previously the pool restarted failed workers indefinitely).
+            readParams() now imported from nbRunPool.py.
+
+18/10/26    v1
+
+"""
+
+import sys
+import os
+import io
+import re
+import json
+import time
+import datetime
+import contextlib
+from pathlib import Path
+import importlib
+from multiprocessing import Pool
+
+from nbRunPool import readParams
+
+try:
+    from IPython.core.inputtransformer2 import TransformerManager
+except ImportError:
+    TransformerManager = None
+
+# Shim for converted IPython calls, shell commands are run with subprocess, line and cell magics are skipped.
+ipyShim = """
+class _HeadlessShell():
+    def getoutput(self, cmd, *args, **kwargs):
+        import subprocess
+        return subprocess.run(cmd, shell = True, capture_output = True, text = True).stdout.splitlines()
+
+    def system(self, cmd, *args, **kwargs):
+        import subprocess
+        return subprocess.run(cmd, shell = True).returncode
+
+    def run_line_magic(self, *args, **kwargs):
+        return None
+
+    def run_cell_magic(self, *args, **kwargs):
+        return None
+
+def get_ipython():
+    return _HeadlessShell()
+
+def display(*args, **kwargs):
+    print(*args)
+"""
+
+
+def transformLine(line):
+    """
+    Convert IPython shell commands and line magics to plain Python calls (get_ipython() shim), for use if IPython is not available.
+
+    Handles `!cmd`, `%magic args`, `x = !cmd` and `x = %magic args` forms, as per IPython's TransformerManager.
+
+    """
+    indent = line[:len(line) - len(line.lstrip())]
+    text = line.strip()
+
+    assign = re.match(r"^([\w\.\[\], ]+?)\s*=\s*([!%])(.*)$", text)
+    if assign:
+        target, prefix, cmd = assign.groups()
+    elif text.startswith(('!', '%')):
+        target, prefix, cmd = None, text[0], text[1:]
+    else:
+        return line
+
+    if prefix == '!':
+        call = f"get_ipython().{'getoutput' if target else 'system'}({cmd.strip()!r})"
+    else:
+        name, _, args = cmd.partition(' ')
+        call = f"get_ipython().run_line_magic({name!r}, {args.strip()!r})"
+
+    return indent + (f"{target} = {call}" if target else call)
+
+
+def transformCell(source):
+    """Convert cell source to plain Python, with IPython's TransformerManager if available, else transformLine(). Cell magics (%%) are skipped."""
+    if source.lstrip().startswith('%%'):
+        return '\n'.join('# ' + line for line in source.splitlines())
+
+    if TransformerManager is not None:
+        return TransformerManager().transform_cell(source)
+
+    return '\n'.join(transformLine(line) for line in source.splitlines())
+
+
+def getTemplateCode(template):
+    """
+    Get code from notebook template as a single script.
+
+    IPython magics and shell commands (including assignment forms, e.g. `host = !hostname`) are converted to plain Python, see transformCell().
+    Shell commands are run via a get_ipython() shim, line and cell magics are skipped, and display() calls are mapped to print().
+
+    """
+    with open(template, 'r') as f:
+        nb = json.load(f)
+
+    cells = [ipyShim]
+    for cell in nb['cells']:
+        if cell['cell_type'] == 'code':
+            source = cell['source']
+            if type(source) is list:
+                source = ''.join(source)
+
+            cells.append(transformCell(source))
+
+    return '\n\n'.join(cells)
+
+
+# Modules preloaded per worker, see initWorker().
+workerModules = ['matplotlib', 'xarray', 'epsproc']
+
+# Set by initWorker() if preload fails, and reported per job by runJob().
+initError = None
+
+
+def checkImports(modules = workerModules):
+    """
+    Check worker modules import OK, returns list of errors as [module, error].
+
+    Run once before starting the pool, since an exception in the pool initializer causes the pool to restart workers indefinitely.
+
+    """
+    errors = []
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            errors.append([module, f"{type(e).__name__}: {e}"])
+
+    return errors
+
+
+def initWorker():
+    """Pool initializer: set non-interactive backend and preload modules. Errors are set in initError (not raised), and reported by runJob()."""
+    global initError
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot
+        for module in workerModules:
+            importlib.import_module(module)
+    except Exception as e:
+        initError = f"{type(e).__name__}: {e}"
+
+
+def runJob(job):
+    """Run template code for one job in a clean namespace, save figures and log. Returns [n, params, status, time, figs]."""
+
+    n, params, code, template, figFormat = job
+    if initError is not None:
+        return [n, params, f"failed: worker init: {initError}", 0, []]
+
+    import matplotlib.pyplot as plt
+
+    dataFile = Path(params['DATAFILE'])
+    logFile = dataFile.parent/(Path(dataFile.stem).stem + '.headless.log')
+    os.environ.update(params)
+    ns = dict(params)
+    ns['__name__'] = '__main__'
+
+    start = time.time()
+    out = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            exec(compile(code, str(template), 'exec'), ns)
+        status = 'ok'
+    except Exception as e:
+        status = f"failed: {type(e).__name__}: {e}"
+
+    # Save summary figures & log
+    figs = []
+    for m, num in enumerate(plt.get_fignums()):
+        figFile = dataFile.parent/f"{Path(dataFile.stem).stem}_fig{m}.{figFormat}"
+        plt.figure(num).savefig(figFile)
+        figs.append(figFile.as_posix())
+    plt.close('all')
+
+    with open(logFile, 'w') as f:
+        f.write(out.getvalue())
+        f.write(f"\n***Status: {status}\n")
+
+    return [n, params, status, round(time.time() - start, 1), figs]
+
+
+def runHeadless(wrkDir, workers, paramsFile, template, figFormat = 'png'):
+    """
+    Run template code for all jobs in paramsFile with process pool.
+
+    Parameters
+    ----------
+    wrkDir : str or Path
+        Working dir, paramsFile is read from here.
+
+    workers : int
+        Number of worker processes.
+
+    paramsFile : str or Path
+        Jupyter-runner style parameter file, one job per line.
+
+    template : str or Path
+        Notebook template.
+
+    figFormat : str, optional, default = 'png'
+        Format for saved figures.
+
+    Returns
+    -------
+    results : list
+        [n, params, status, time, figs] per job.
+
+    """
+
+    errors = checkImports(workerModules)
+    if errors:
+        print("***Headless run aborted, worker modules failed to import:")
+        for module, error in errors:
+            print(f"{module}: {error}")
+        return []
+
+    jobs = readParams(Path(wrkDir, paramsFile))
+    code = getTemplateCode(template)
+    workers = max(1, min(int(workers), len(jobs)))
+
+    print(f"***Headless run for {len(jobs)} jobs with {workers} workers")
+    print(f"Template: {template}")
+    print(datetime.datetime.now().strftime("%Y-%m-%d %H:%M") + '\n')
+
+    os.chdir(wrkDir)
+    results = []
+    with Pool(workers, initializer = initWorker) as pool:
+        for result in pool.imap_unordered(runJob, [[n, params, code, template, figFormat] for n, params in enumerate(jobs)]):
+            results.append(result)
+            print(f"[{len(results)}/{len(jobs)}] {result[1]['DATAFILE']}: {result[2]}, {result[3]}s, {len(result[4])} figs")
+            sys.stdout.flush()
+
+    print(f"\nJobs completed at {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}")
+    print(f"OK: {sum(1 for r in results if r[2] == 'ok')}, failed: {sum(1 for r in results if r[2] != 'ok')}")
+
+    return results
+
+
+# Code for CLI call from Fabric
+# Args: wrkDir, workers, paramsFile, template, as per nbRunPool.py. Optional: figFormat.
+if __name__ == "__main__":
+
+    wrkDir = sys.argv[1]
+    workers = int(sys.argv[2])
+    paramsFile = sys.argv[3]
+    template = sys.argv[4]
+
+    if len(sys.argv) > 5:
+        figFormat = sys.argv[5]
+    else:
+        figFormat = 'png'
+
+    runHeadless(wrkDir, workers, paramsFile, template, figFormat = figFormat)
@@ -0,0 +1,526 @@
+"""
+epsman
+
+Local python script for batch notebook execution with a pool of warm kernels.
+
+Can be called from Fabric for remote run case, requires nbformat, nbclient and jupyter_client (as used by jupyter-runner), plus ePSproc in the kernel env.
+
+Replaces jupyter-runner fan-out (shell/jr_epsProc_nb.sh), which starts a new kernel and reimports ePSproc/xarray/matplotlib for every notebook.
+Here each worker starts one kernel, runs preloadCode once, then executes notebooks from the job queue in that kernel, with the namespace reset between jobs.
+
+Output notebooks are written as <template>_<n>.ipynb in the working dir, as per jupyter-runner, for tidyNotebooks().
+
+Results are cached by hash of (template, DATAFILE contents, ePSproc version) in <wrkDir>/.nbCache, and only new or changed jobs are executed.
+For E-chunked jobs, all chunk files (CHUNKFILES param, ';' separated) are included in the hash.
+On a cache hit the cached notebook is copied to the output name, and the existing .nc outputs are reused (checked by size).
+Outputs for a job are the <DATAFILE>_*.nc files written during the run (as per the templates, fileName = dataFile + '_BLM-L_' ...), and jobs with no outputs found are not cached.
+
+Peak kernel memory per notebook (Linux /proc VmHWM) is measured, and written to <template>.stats.json for worker admission control, see _epsProc.setNotebookWorkers().
+
+Run status is tracked in <wrkDir>/<paramsFile stem>_nbStatus.json (pool PID, start time, per-notebook status and error cells), updated as jobs start and finish.
+This can be polled with _epsProc.pollNotebooks(), and finished notebooks tidied while the pool is still running.
+
+18/10/26    v1
+
+"""
+
+import sys
+import os
+import re
+import json
+import time
+import glob
+import shutil
+import hashlib
+import datetime
+from pathlib import Path
+from multiprocessing import Process, Queue
+
+# Required for runPool(), optional at import so readParams() can be used without them (see headlessProc.py).
+try:
+    import nbformat
+    from nbclient import NotebookClient
+    from jupyter_client.manager import start_new_kernel
+except ImportError:
+    nbformat = None
+
+# Settings
+nbVersion = 4
+
+# Heavy imports to run once per kernel. Modules stay in sys.modules after %reset, so template imports are then cheap.
+preloadCode = """
+import numpy as np
+import xarray as xr
+import matplotlib.pyplot as plt
+import epsproc as ep
+"""
+
+# Run between jobs to clear namespace and figures, but keep loaded modules.
+resetCode = """
+plt.close('all')
+%reset -f
+"""
+
+
+def readParams(paramsFile):
+    """
+    Read jupyter-runner style parameter file, one job per line as KEY='value' pairs.
+
+    Returns list of dicts, one per job.
+
+    """
+    jobs = []
+    with open(paramsFile, 'r') as f:
+        for line in f:
+            if line.strip():
+                params = {}
+                for key, val in re.findall(r"(\w+)=('[^']*'|\"[^\"]*\"|\S+)", line):
+                    params[key] = val.strip("'\"")
+                jobs.append(params)
+
+    return jobs
+
+
+def injectParams(nb, params):
+    """
+    Inject parameters cell into notebook, papermill-style.
+
+    Parameters are set as variables and also in os.environ (as per jupyter-runner), so either template style will work.
+    Cell is inserted after a cell tagged 'parameters' if present, otherwise at the top of the notebook.
+
+    """
+    lines = ['# Parameters (injected by epsman nbRunPool)', 'import os']
+    for key, val in params.items():
+        lines.append(f"os.environ[{key!r}] = {val!r}")
+        lines.append(f"{key} = {val!r}")
+
+    cell = nbformat.v4.new_code_cell(source = '\n'.join(lines))
+    cell.metadata['tags'] = ['injected-parameters']
+
+    ind = 0
+    for n, item in enumerate(nb.cells):
+        if 'parameters' in item.get('metadata', {}).get('tags', []):
+            ind = n + 1
+            break
+
+    nb.cells.insert(ind, cell)
+
+    return nb
+
+
+def startKernel(wrkDir, kernelName = 'python3', timeout = 600):
+    """Start kernel in wrkDir and run preloadCode, returns (km, kc)."""
+    km, kc = start_new_kernel(kernel_name = kernelName, cwd = wrkDir)
+    kc.execute_interactive(preloadCode, timeout = timeout)
+
+    return km, kc
+
+
+def kernelPid(km):
+    """Get kernel process ID from KernelManager, returns None if not available."""
+    try:
+        return km.provisioner.process.pid  # jupyter_client >= 7
+    except AttributeError:
+        try:
+            return km.kernel.pid
+        except AttributeError:
+            return None
+
+
+def resetPeakMem(pid):
+    """Reset peak RSS (VmHWM) for process, Linux only."""
+    try:
+        with open(f"/proc/{pid}/clear_refs", 'w') as f:
+            f.write('5')
+    except (OSError, TypeError):
+        pass
+
+
+def readPeakMem(pid):
+    """Read peak RSS (VmHWM, kB) for process, Linux only. Returns None if not available."""
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM'):
+                    return int(line.split()[1])
+    except (OSError, TypeError):
+        pass
+
+    return None
+
+
+def writeStats(template, results):
+    """Write measured peak notebook memory (kB) to <template>.stats.json, used for admission control."""
+    peakMem = [r[6] for r in results if r[6] is not None]
+    if not peakMem:
+        return None
+
+    stats = {'template':Path(template).name,
+             'date':datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
+             'jobs':len(peakMem),
+             'peakMemKB':max(peakMem),
+             'meanMemKB':int(sum(peakMem)/len(peakMem))
+             }
+
+    statsFile = Path(template).with_suffix('.stats.json')
+    try:
+        with open(statsFile, 'w') as f:
+            json.dump(stats, f, indent=2)
+        print(f"Written notebook stats: {statsFile}, peak {stats['peakMemKB']} kB")
+    except OSError:
+        print(f"***Could not write notebook stats: {statsFile}")
+
+    return stats
+
+
+def hashFile(fileIn, h = None, blockSize = 2**20):
+    """Update hash object h (default sha256) with file contents, read in blocks."""
+    if h is None:
+        h = hashlib.sha256()
+
+    with open(fileIn, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            h.update(block)
+
+    return h
+
+
+def getEpsprocVersion():
+    """Get ePSproc version string for cache keys, without importing the package if possible."""
+    try:
+        from importlib.metadata import version
+        return version('ePSproc')
+    except Exception:
+        pass
+
+    try:
+        import epsproc
+        return getattr(epsproc, '__version__', 'unknown')
+    except ImportError:
+        return 'none'
+
+
+def getCacheKey(template, params, epsVersion):
+    """Cache key from template, DATAFILE and CHUNKFILES contents (if present, else param value) and ePSproc version."""
+    h = hashFile(template)
+    h.update(epsVersion.encode())
+
+    for key in sorted(params):
+        h.update(f"{key}={params[key]}".encode())
+
+        if key == 'DATAFILE':
+            fileList = [params[key]]
+        elif key == 'CHUNKFILES':
+            fileList = [item for item in params[key].split(';') if item]
+        else:
+            fileList = []
+
+        for fileIn in fileList:
+            if Path(fileIn).is_file():
+                hashFile(fileIn, h)
+
+    return h.hexdigest()
+
+
+def readCache(cacheDir):
+    """Read cache index, {key: {'notebook':..., 'ncFiles':[[file, size],...]}}."""
+    indexFile = Path(cacheDir, 'index.json')
+    if indexFile.is_file():
+        with open(indexFile, 'r') as f:
+            return json.load(f)
+
+    return {}
+
+
+def writeCache(cacheDir, index):
+    """Write cache index."""
+    Path(cacheDir).mkdir(parents = True, exist_ok = True)
+    with open(Path(cacheDir, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=2)
+
+
+def checkCache(index, key):
+    """Return cache item if key is present and cached notebook and .nc outputs are unchanged, else None."""
+    item = index.get(key)
+    if item is None or not Path(item['notebook']).is_file():
+        return None
+
+    for ncFile, size in item['ncFiles']:
+        if not Path(ncFile).is_file() or Path(ncFile).stat().st_size != size:
+            return None
+
+    return item
+
+
+def getNcOutputs(params, start):
+    """Get <DATAFILE>_*.nc files written since start (job outputs), so outputs from other jobs in the same dir are not included."""
+    if 'DATAFILE' not in params:
+        return []
+
+    dataFile = Path(params['DATAFILE'])
+    ncFiles = []
+    for ncFile in dataFile.parent.glob(f"{glob.escape(dataFile.name)}_*.nc"):
+        stat = ncFile.stat()
+        if stat.st_mtime >= start:
+            ncFiles.append([ncFile.as_posix(), stat.st_size])
+
+    return ncFiles
+
+
+def getStatusFile(wrkDir, paramsFile):
+    """Status file for run, <wrkDir>/<paramsFile stem>_nbStatus.json."""
+    return Path(wrkDir, Path(paramsFile).stem + '_nbStatus.json')
+
+
+def writeStatus(statusFile, runStatus):
+    """Write run status dict, via temp file so readers never see a partial file."""
+    runStatus['updated'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    tmpFile = Path(statusFile).with_suffix('.tmp')
+    with open(tmpFile, 'w') as f:
+        json.dump(runStatus, f, indent=1)
+
+    os.replace(tmpFile, statusFile)
+
+
+def getErrorCells(nb):
+    """Get error outputs from executed notebook, as [cell index, ename, evalue] (injected parameters cell included in index)."""
+    errors = []
+    for n, cell in enumerate(nb.cells):
+        for output in cell.get('outputs', []):
+            if output.get('output_type') == 'error':
+                errors.append([n, output.get('ename'), output.get('evalue')])
+
+    return errors
+
+
+def runNotebook(km, kc, template, params, outFile, wrkDir, timeout = None):
+    """Execute template with params in existing kernel, and write to outFile. Returns status and error cells."""
+
+    nb = nbformat.read(template, as_version = nbVersion)
+    nb = injectParams(nb, params)
+
+    client = NotebookClient(nb, km = km, timeout = timeout, allow_errors = True,
+                            resources = {'metadata': {'path': wrkDir}})
+    client.kc = kc  # Reuse running kernel client, kernel is not shut down by client if km is passed.
+
+    try:
+        client.execute()
+        status = 'ok'
+    except Exception as e:
+        status = f"failed: {type(e).__name__}: {e}"
+
+    # Flag error outputs (allow_errors = True, as per jupyter-runner --allow-errors)
+    errors = getErrorCells(nb)
+    if status == 'ok' and errors:
+        status = 'errors'
+
+    nbformat.write(nb, outFile, version = nbVersion)
+
+    return status, errors
+
+
+def runWorker(wID, jobQueue, resultQueue, template, wrkDir, timeout):
+    """Worker process: start warm kernel, then run jobs from jobQueue until None is received."""
+
+    km, kc = startKernel(wrkDir)
+    nJobs = 0
+
+    while True:
+        job = jobQueue.get()
+        if job is None:
+            break
+
+        n, params = job
+
+        # Restart kernel if it died on a previous job, otherwise reset namespace.
+        if not km.is_alive():
+            kc.stop_channels()
+            km.shutdown_kernel(now = True)
+            km, kc = startKernel(wrkDir)
+        elif nJobs:
+            kc.execute_interactive(resetCode + preloadCode, timeout = 600)
+
+        outFile = Path(wrkDir, f"{Path(template).stem}_{n+1}.ipynb").as_posix()
+        pid = kernelPid(km)
+        resetPeakMem(pid)
+        start = time.time()
+        resultQueue.put(['running', n, wID, start])
+        status, errors = runNotebook(km, kc, template, params, outFile, wrkDir, timeout = timeout)
+        nJobs += 1
+
+        resultQueue.put([n, wID, params, outFile, status, round(time.time() - start, 1), readPeakMem(pid), start, errors])
+
+    kc.stop_channels()
+    km.shutdown_kernel(now = True)
+
+
+def runPool(wrkDir, workers, paramsFile, template, timeout = None, cache = True):
+    """
+    Run all jobs in paramsFile with template, using pool of warm kernels.
+
+    Parameters
+    ----------
+    wrkDir : str or Path
+        Working dir for kernels and output notebooks.
+
+    workers : int
+        Number of kernels (worker processes).
+
+    paramsFile : str or Path
+        Jupyter-runner style parameter file, one job per line.
+
+    template : str or Path
+        Notebook template.
+
+    timeout : int, optional, default = None
+        Per-cell timeout (s), passed to nbclient.
+
+    cache : bool, optional, default = True
+        Use result cache in <wrkDir>/.nbCache, and skip execution for unchanged jobs.
+
+    Returns
+    -------
+    results : list
+        [n, worker, params, outFile, status, time, peakMemKB, start, errors] per job.
+
+    """
+
+    if nbformat is None:
+        raise ImportError("nbformat, nbclient and jupyter_client are required for runPool().")
+
+    jobs = readParams(Path(wrkDir, paramsFile))
+
+    # Run status, written to statusFile for polling.
+    statusFile = getStatusFile(wrkDir, paramsFile)
+    runStatus = {'pid':os.getpid(),
+                 'start':datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                 'template':Path(template).name,
+                 'paramsFile':Path(paramsFile).name,
+                 'total':len(jobs),
+                 'finished':False,
+                 'jobs':{}
+                 }
+    for n, params in enumerate(jobs):
+        runStatus['jobs'][str(n)] = {'DATAFILE':params.get('DATAFILE'),
+                                     'outFile':Path(wrkDir, f"{Path(template).stem}_{n+1}.ipynb").as_posix(),
+                                     'status':'queued'}
+    writeStatus(statusFile, runStatus)
+
+    print(f"***Running {len(jobs)} notebooks")
+    print(f"Template: {template}")
+    print(datetime.datetime.now().strftime("%Y-%m-%d %H:%M") + '\n')
+
+    # Check cache, and set outputs for cache hits.
+    results = []
+    runJobs = []
+    cacheDir = Path(wrkDir, '.nbCache')
+    if cache:
+        index = readCache(cacheDir)
+        epsVersion = getEpsprocVersion()
+        keys = {}
+
+        for n, params in enumerate(jobs):
+            keys[n] = getCacheKey(template, params, epsVersion)
+            item = checkCache(index, keys[n])
+            outFile = Path(wrkDir, f"{Path(template).stem}_{n+1}.ipynb").as_posix()
+
+            if item is not None:
+                shutil.copyfile(item['notebook'], outFile)
+                results.append([n, 'cache', params, outFile, 'cached', 0, None, None, []])
+                runStatus['jobs'][str(n)]['status'] = 'cached'
+            else:
+                runJobs.append([n, params])
+
+        print(f"Cache: {len(results)} unchanged jobs reused, {len(runJobs)} to run (ePSproc {epsVersion}).")
+        writeStatus(statusFile, runStatus)
+
+    else:
+        runJobs = [[n, params] for n, params in enumerate(jobs)]
+
+    # Run remaining jobs with kernel pool
+    workers = max(0, min(int(workers), len(runJobs)))
+    print(f"Running {len(runJobs)} notebooks with {workers} kernels")
+
+    jobQueue = Queue()
+    resultQueue = Queue()
+    for job in runJobs:
+        jobQueue.put(job)
+    for w in range(workers):
+        jobQueue.put(None)
+
+    procs = [Process(target = runWorker, args = (w, jobQueue, resultQueue, template, wrkDir, timeout)) for w in range(workers)]
+    for p in procs:
+        p.start()
+
+    while len(results) < len(jobs):
+        if not any(p.is_alive() for p in procs) and resultQueue.empty():
+            print('***Workers exited with jobs remaining.')
+            break
+
+        try:
+            result = resultQueue.get(timeout = 10)
+        except Exception:
+            continue
+
+        # Job start message from worker
+        if result[0] == 'running':
+            runStatus['jobs'][str(result[1])].update({'status':'running', 'worker':result[2],
+                                                      'started':datetime.datetime.fromtimestamp(result[3]).strftime("%Y-%m-%d %H:%M:%S")})
+            writeStatus(statusFile, runStatus)
+            continue
+
+        results.append(result)
+        runStatus['jobs'][str(result[0])].update({'status':result[4], 'time':result[5], 'peakMemKB':result[6], 'errors':result[8]})
+        writeStatus(statusFile, runStatus)
+        print(f"[{len(results)}/{len(jobs)}] {result[3]} ({result[2]}): {result[4]}, {result[5]}s, kernel {result[1]}")
+        sys.stdout.flush()
+
+        # Add successful jobs to cache, only if outputs are found (otherwise a cache hit would reuse missing outputs).
+        if cache and result[4] == 'ok':
+            ncFiles = getNcOutputs(result[2], result[7])
+            if ncFiles:
+                cacheFile = Path(cacheDir, keys[result[0]] + '.ipynb')
+                cacheDir.mkdir(parents = True, exist_ok = True)
+                shutil.copyfile(result[3], cacheFile)
+                index[keys[result[0]]] = {'notebook':cacheFile.as_posix(), 'ncFiles':ncFiles}
+            else:
+                print(f"No outputs found for {result[2].get('DATAFILE')}, job not cached.")
+
+    for p in procs:
+        p.join()
+
+    # Jobs not returned (worker or kernel crash) are flagged as failed.
+    for item in runStatus['jobs'].values():
+        if item['status'] in ('queued', 'running'):
+            item['status'] = 'failed: no result'
+
+    runStatus['finished'] = True
+    writeStatus(statusFile, runStatus)
+
+    if cache:
+        writeCache(cacheDir, index)
+
+    writeStats(template, results)
+
+    print(f"\nNotebooks completed at {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}")
+    print(f"OK: {sum(1 for r in results if r[4] == 'ok')}, cached: {sum(1 for r in results if r[4] == 'cached')}, with errors: {sum(1 for r in results if r[4] == 'errors')}, failed: {sum(1 for r in results if r[4].startswith('failed'))}")
+
+    return results
+
+
+# Code for CLI call from Fabric
+# Args: wrkDir, workers, paramsFile, template - as per jupyter-runner call in shell/jr_epsProc_nb.sh
+# Optional arg: cache (True/False), default True.
+if __name__ == "__main__":
+
+    wrkDir = sys.argv[1]
+    workers = int(sys.argv[2])
+    paramsFile = sys.argv[3]
+    template = sys.argv[4]
+
+    if len(sys.argv) > 5:
+        cache = (sys.argv[5] != 'False')
+    else:
+        cache = True
+
+    runPool(wrkDir, workers, paramsFile, template, cache = cache)
@@ -0,0 +1,23 @@
+#!/bin/bash
+
+# Nohup wrapper for notebook pool batch jobs for remote run with Fabric
+# Also used for headlessProc.py, with same args (7: figFormat).
+# 18/10/26
+#
+# Passed args:
+# 1: {Path(self.hostDefn[self.host]['procScpPath'], self.scpDefnProc['nbPool']).as_posix()}
+# 2: {self.hostDefn[self.host]['nbProcDir'].as_posix()}
+# 3: {proc}
+# 4: {paramsFile}
+# 5: {self.hostDefn[self.host]['nbTemplate'].as_posix()}
+# 6: log file
+# 7: cache (True/False)
+
+echo Starting notebook pool batch run with nohup
+
+# Set env - now set in Fabric call, e.g.
+# with self.c.prefix(f"source {self.hostDefn[self.host]['condaPath']} {self.hostDefn[self.host]['condaEnv']}"):
+cd $2
+
+stdoutTxt=$6
+nohup python $1 $2 $3 $4 $5 $7 > $stdoutTxt 2>&1 &
@@ -0,0 +1,264 @@
+"""
+epsman
+
+Local python script for notebook output slimming, with external figure store.
+
+Can be called from Fabric for remote run case, requires nbformat for notebook IO, and optionally PIL (Pillow) for figure downsampling/recompression.
+
+Large image outputs (PNG, JPEG, SVG) are written to a content-addressed store, <notebook dir>/_nbfigs/<sha256[:20]>.<ext>, so identical figures are stored once per dir.
+Outputs are replaced by markdown image references (rendered by Jupyter and nbsphinx), and the original MIME types (and any original markdown output) are kept in output metadata so the notebook can be restored.
+
+Slimmed notebooks can also be re-embedded to a copy, <notebook dir>/_nbembed/<notebook>, for upload as a single file (see _repo.updateUploads()).
+
+19/10/26    Outputs with multiple image types now keep all figures in metadata (list per output), and any original markdown output is kept and restored.
+
+18/10/26    v1
+
+"""
+
+import sys
+import json
+import base64
+import hashlib
+from io import BytesIO
+from pathlib import Path
+
+import nbformat
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Settings
+nbVersion = 4
+figDir = '_nbfigs'
+embedDir = '_nbembed'
+imageTypes = {'image/png':'png', 'image/jpeg':'jpg', 'image/svg+xml':'svg'}
+
+
+def getImageBytes(data, mime):
+    """Get raw bytes for image output data (base64 for binary types, text for SVG)."""
+    if type(data) is list:
+        data = ''.join(data)
+
+    if mime == 'image/svg+xml':
+        return data.encode()
+
+    return base64.b64decode(data)
+
+
+def processImage(raw, ext, maxWidth = None, recompress = False):
+    """Downsample to maxWidth and/or recompress bitmap image with PIL, if available."""
+    if Image is None or ext == 'svg' or (maxWidth is None and not recompress):
+        return raw
+
+    img = Image.open(BytesIO(raw))
+    if maxWidth is not None and img.width > maxWidth:
+        img = img.resize((maxWidth, int(img.height*maxWidth/img.width)), Image.LANCZOS)
+
+    out = BytesIO()
+    if ext == 'png':
+        img.save(out, format = 'PNG', optimize = True)
+    else:
+        img.convert('RGB').save(out, format = 'JPEG', quality = 85, optimize = True)
+
+    # Keep original if no gain.
+    if len(out.getvalue()) < len(raw):
+        return out.getvalue()
+
+    return raw
+
+
+def getSlimInfo(output):
+    """
+    Get slimmed figure info from output metadata, {'figs':[{'figStore', 'mime'}, ...], 'markdown'}, or None if not slimmed.
+
+    'markdown' is the original text/markdown output (None if not set). Single figure info from older versions, {'figStore', 'mime'}, is converted.
+
+    """
+    info = output.get('metadata', {}).get('epsman')
+    if (info is not None) and ('figs' not in info):
+        output['metadata']['epsman'] = {'figs':[dict(info)], 'markdown':None}
+
+    return output.get('metadata', {}).get('epsman')
+
+
+def setMarkdown(info):
+    """Set markdown output for slimmed figures, image references appended to any original markdown."""
+    refs = [f"![{Path(fig['figStore']).name}]({fig['figStore']})" for fig in info['figs']]
+    if info['markdown'] is not None:
+        markdown = info['markdown']
+        refs.insert(0, ''.join(markdown) if type(markdown) is list else markdown)
+
+    return '\n\n'.join(refs)
+
+
+def slimNotebook(fileIn, minSize = 10240, maxWidth = None, recompress = False, dryRun = False):
+    """
+    Move image outputs > minSize (bytes) to figure store, and replace with references.
+
+    Parameters
+    ----------
+    fileIn : str or Path
+        Notebook file.
+
+    minSize : int, optional, default = 10240
+        Minimum output size (bytes) for moving to store.
+
+    maxWidth : int, optional, default = None
+        If set, downsample bitmap figures wider than this (pixels). Requires PIL.
+
+    recompress : bool, optional, default = False
+        Recompress bitmap figures (optimized PNG, JPEG q=85). Requires PIL.
+
+    dryRun : bool, optional, default = False
+        Report only, don't write files.
+
+    Returns
+    -------
+    list : [fileIn, size before, size after, figures moved]
+
+    """
+
+    fileIn = Path(fileIn)
+    sizeIn = fileIn.stat().st_size
+    nb = nbformat.read(fileIn.as_posix(), as_version = nbVersion)
+    store = Path(fileIn.parent, figDir)
+
+    nFigs = 0
+    for cell in nb.cells:
+        if cell.cell_type != 'code':
+            continue
+
+        for output in cell.get('outputs', []):
+            if output.get('output_type') not in ('display_data', 'execute_result'):
+                continue
+
+            for mime, ext in imageTypes.items():
+                if mime not in output.get('data', {}):
+                    continue
+
+                raw = getImageBytes(output['data'][mime], mime)
+                if len(raw) < minSize:
+                    continue
+
+                # Content address from original bytes, so repeated runs dedupe to the same file.
+                figFile = Path(figDir, f"{hashlib.sha256(raw).hexdigest()[:20]}.{ext}")
+                if not dryRun:
+                    store.mkdir(exist_ok = True)
+                    if not Path(fileIn.parent, figFile).is_file():
+                        with open(Path(fileIn.parent, figFile), 'wb') as f:
+                            f.write(processImage(raw, ext, maxWidth = maxWidth, recompress = recompress))
+
+                # Record all figures moved for output, and any original markdown, for restoreNotebook().
+                if getSlimInfo(output) is None:
+                    output.setdefault('metadata', {})['epsman'] = {'figs':[], 'markdown':output['data'].get('text/markdown')}
+
+                info = getSlimInfo(output)  # Set as NotebookNode (copy) on assignment, so get stored item.
+
+                del output['data'][mime]
+                info['figs'].append({'figStore':figFile.as_posix(), 'mime':mime})
+                output['data']['text/markdown'] = setMarkdown(info)
+                nFigs += 1
+
+    if not dryRun and nFigs:
+        nbformat.write(nb, fileIn.as_posix(), version = nbVersion)
+
+    sizeOut = fileIn.stat().st_size
+    if dryRun:
+        print(f"{fileIn}: {nFigs} figures to move to {store} (dry run, no changes), {sizeIn} bytes")
+    else:
+        print(f"{fileIn}: {nFigs} figures moved to {store}, {sizeIn} -> {sizeOut} bytes")
+
+    return [fileIn.as_posix(), sizeIn, sizeOut, nFigs]
+
+
+def restoreNotebook(fileIn, fileOut = None):
+    """
+    Re-embed figures from store into notebook (e.g. for repo upload as a single file).
+
+    If fileOut is set, the restored notebook is written there and fileIn is unchanged (only if figures were restored).
+    Returns [fileIn, figures restored, output file].
+
+    """
+
+    fileIn = Path(fileIn)
+    nb = nbformat.read(fileIn.as_posix(), as_version = nbVersion)
+
+    nFigs = 0
+    for cell in nb.cells:
+        for output in cell.get('outputs', []):
+            info = getSlimInfo(output)
+            if info is None:
+                continue
+
+            for fig in info['figs']:
+                with open(Path(fileIn.parent, fig['figStore']), 'rb') as f:
+                    raw = f.read()
+
+                if fig['mime'] == 'image/svg+xml':
+                    output['data'][fig['mime']] = raw.decode()
+                else:
+                    output['data'][fig['mime']] = base64.b64encode(raw).decode()
+
+                nFigs += 1
+
+            if info['markdown'] is None:
+                output['data'].pop('text/markdown', None)
+            else:
+                output['data']['text/markdown'] = info['markdown']
+
+            del output['metadata']['epsman']
+
+    if fileOut is None:
+        fileOut = fileIn
+
+    if nFigs:
+        Path(fileOut).parent.mkdir(parents = True, exist_ok = True)
+        nbformat.write(nb, Path(fileOut).as_posix(), version = nbVersion)
+
+    print(f"{fileIn}: {nFigs} figures restored" + (f" to {fileOut}" if nFigs and (fileOut != fileIn) else ''))
+
+    return [fileIn.as_posix(), nFigs, Path(fileOut).as_posix() if nFigs else None]
+
+
+def embedNotebook(fileIn):
+    """Write re-embedded copy of slimmed notebook to <notebook dir>/_nbembed/<notebook>, returns as per restoreNotebook()."""
+    fileIn = Path(fileIn)
+    return restoreNotebook(fileIn, fileOut = Path(fileIn.parent, embedDir, fileIn.name))
+
+
+# Code for CLI call from Fabric
+# Args: mode (slim, restore, embed or dryRun), minSize, maxWidth (int or None), recompress (True/False), notebook files...
+# For embed mode, {notebook: embedded copy} is printed as JSON on the final line, for slimmed notebooks only.
+if __name__ == "__main__":
+
+    mode = sys.argv[1]
+    minSize = int(sys.argv[2])
+    maxWidth = None if sys.argv[3] == 'None' else int(sys.argv[3])
+    recompress = (sys.argv[4] == 'True')
+    fileList = sys.argv[5:]
+
+    if (maxWidth is not None or recompress) and Image is None:
+        print('***PIL not found, skipping figure downsampling/recompression.')
+
+    results = []
+    for fileIn in fileList:
+        if mode == 'restore':
+            results.append(restoreNotebook(fileIn))
+        elif mode == 'embed':
+            if Path(fileIn).is_file():
+                results.append(embedNotebook(fileIn))
+            else:
+                print(f"***Missing notebook {fileIn}, skipping.")
+        else:
+            results.append(slimNotebook(fileIn, minSize = minSize, maxWidth = maxWidth, recompress = recompress, dryRun = (mode == 'dryRun')))
+
+    if mode == 'embed':
+        print(json.dumps({r[0]: r[2] for r in results if r[1]}))
+
+    elif mode != 'restore':
+        sizeIn = sum(r[1] for r in results)
+        sizeOut = sum(r[2] for r in results)
+        print(f"\n***Slimmed {len(results)} notebooks, {sizeIn} -> {sizeOut} bytes" + (" (dry run, no changes)" if mode == "dryRun" else ""))
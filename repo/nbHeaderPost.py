@@ -7,6 +7,9 @@ Can be called from Fabric for remote run case, only requires standard libs + nbf
 
 May be a better way to do this?
 
+18/10/26    Added archive format to readme text (zip or tar.zst), passed as optional 4th arg.
+            Updated readme text for split archives (<file>_partNN.zip), and common archives for shared files.
+
 16/12/19    v1
 
 TO DO:
@@ -174,7 +177,7 @@ def writeFooter(inputNB, sourceText):
 
 
 # Write markdown readme file to include with job
-def writeReadme(sourceTextHead, sourceTextFoot):
+def writeReadme(sourceTextHead, sourceTextFoot, archFormat = 'zip'):
 
     # Set files
     textFile = fileIn.with_suffix('.md')
@@ -198,6 +201,15 @@ See [about ePSdata](https://phockett.github.io/ePSdata/about.html) for details.
     print(f"***Written md summary file: {textFile}")
 
 
+    # Archive format description, see pkgFiles.pkgFormats
+    if archFormat == 'tar.zst':
+        archText = """- <file>.tar.zst  Archive of source files, tar format with zstd compression (extract with `tar --zstd -xf <file>.tar.zst`, or `zstd -d` then `tar -xf`).
+                Large datasets are split into independent archives, <file>_partNN.tar.zst, which can each be extracted separately.
+- <file>_manifest.json  Archive index, with member frame offsets for random access, plus sizes and SHA-256 hashes (one per archive part)."""
+    else:
+        archText = """- <file>.zip    Archive of source files. Large datasets are split into independent archives, <file>_partNN.zip, which can each be extracted separately.
+                Older datasets may instead use a multipart zip format due to repository file-size limits.*"""
+
     # Format and write generic readme
     sourceText = f"""
 ePSdata dataset general readme
@@ -206,8 +218,9 @@ This dataset contains files:
 - readme.txt    This file.
 - <file>.md     Markdown (text) file summarising the dataset, including dataset-specific links and citation information.
 - <file>.ipynb  Jupyter notebook file with basic post-processing (for an HTML version, see https://phockett.github.io/ePSdata).
-- <file>.zip    Archive of source files, may be in a multipart zip format due to repository file-size limits.*
+{archText}
 - <file>.json   Full job details in JSON format, including archive file list.
+- <name>_common_<hash>.zip  Source files shared by a set of datasets (e.g. electronic structure files), if present. These are included with one dataset only, and referenced by the others in <file>.json ('commonArch' entry, with dataset DOI and file hashes).
 
 For more details, see:
 https://phockett.github.io/ePSdata/about.html
@@ -245,6 +258,7 @@ if __name__ == "__main__":
     # Case for passing all args, but may be None
     doi = sys.argv[2]
     title = sys.argv[3]
+    archFormat = sys.argv[4] if len(sys.argv) > 4 else 'zip'
 
     # Read notebook
     print(f'\n***Reading notebook: {fileIn}')
@@ -269,7 +283,7 @@ if __name__ == "__main__":
         writeFooter(inputNB, sourceTextFoot)
         print(f'\n***Written notebook footer: {fileIn}, job name: {title}')
 
-        writeReadme(sourceTextHead, sourceTextFoot)
+        writeReadme(sourceTextHead, sourceTextFoot, archFormat = archFormat)
 
     else:
         pass
@@ -0,0 +1,154 @@
+"""
+epsman
+
+Local python script for archive compression benchmarks.
+
+Can be called from Fabric for remote run case, only requires standard libs (plus pkgFiles.py, in the same dir).
+
+Samples files by type from a job tree, and compresses each sample with a set of codecs (as used by zipfile), to report throughput vs. compression ratio per file type.
+A suggested compression policy (fastest codec within a tolerance of the best ratio, per file type) is printed as JSON on the final line, and can be passed to pkgFiles.py (policy=<JSON file>).
+
+18/10/26    v1
+
+"""
+
+import sys
+import json
+import time
+import random
+import zipfile
+from io import BytesIO
+from pathlib import Path
+
+from pkgFiles import scanFilesPkg, pkgExclude, compressTypes, compressPolicy
+
+# Codecs to test, as [method, level]
+codecs = [['store', None],
+          ['deflate', 1],
+          ['deflate', 6],
+          ['deflate', 9],
+          ['bzip2', 9],
+          ['lzma', None]
+          ]
+
+
+def sampleFiles(pkgDir, sampleMB = 100, seed = 1):
+    """
+    Random sample of files from pkgDir, by file type.
+
+    Sample size is split equally between file types (suffixes), excluding types as per pkgFiles.pkgExclude.
+
+    Returns
+    -------
+    dict
+        {suffix: fileList}
+
+    """
+    fileTypes = {}
+    for item in scanFilesPkg(pkgDir):
+        if Path(item).is_file() and not pkgExclude.search(item):
+            fileTypes.setdefault(Path(item).suffix.lower(), []).append(item)
+
+    if not fileTypes:
+        return {}
+
+    random.seed(seed)
+    typeBytes = sampleMB * 2**20 / len(fileTypes)
+
+    samples = {}
+    for suffix, fileList in fileTypes.items():
+        random.shuffle(fileList)
+        samples[suffix] = []
+        total = 0
+
+        for item in fileList:
+            if total >= typeBytes:
+                break
+
+            samples[suffix].append(item)
+            total += Path(item).stat().st_size
+
+    return samples
+
+
+def benchCodec(fileList, method, level):
+    """Compress fileList with codec via in-memory zip, returns [size in, size out, time (s)]."""
+    sizeIn = 0
+    sizeOut = 0
+    start = time.perf_counter()
+
+    for item in fileList:
+        with zipfile.ZipFile(BytesIO(), 'w') as benchZip:
+            benchZip.write(item, arcname = Path(item).name, compress_type = compressTypes[method], compresslevel = level)
+            info = benchZip.infolist()[0]
+
+        sizeIn += info.file_size
+        sizeOut += info.compress_size
+
+    return [sizeIn, sizeOut, time.perf_counter() - start]
+
+
+def runBench(pkgDir, sampleMB = 100, tol = 0.05):
+    """
+    Run codec benchmarks for sample of files from pkgDir, by file type.
+
+    Parameters
+    ----------
+    pkgDir : str or Path
+        Job tree to sample.
+
+    sampleMB : int, optional, default = 100
+        Total sample size (MB), split between file types.
+
+    tol : float, optional, default = 0.05
+        Tolerance for suggested policy: choose the fastest codec with compressed size within (1+tol) x best size.
+
+    Returns
+    -------
+    results : dict
+        {suffix: [[method, level, sizeIn, sizeOut, ratio, MB/s], ...]}
+
+    policy : dict
+        Suggested compression policy, {suffix: [method, level]}.
+
+    """
+    samples = sampleFiles(pkgDir, sampleMB = sampleMB)
+
+    print(f"***Codec benchmark for {pkgDir}, {sampleMB} MB sample")
+    print(f"{'Type':<8} {'Files':>6} {'Codec':<12} {'Size in':>12} {'Size out':>12} {'Ratio':>7} {'MB/s':>8}")
+
+    results = {}
+    policy = {}
+    for suffix, fileList in samples.items():
+        results[suffix] = []
+
+        for method, level in codecs:
+            sizeIn, sizeOut, t = benchCodec(fileList, method, level)
+            ratio = round(sizeOut/sizeIn, 3) if sizeIn else 1
+            rate = round(sizeIn/2**20/t, 1) if t else None
+            results[suffix].append([method, level, sizeIn, sizeOut, ratio, rate])
+
+            print(f"{suffix or '(none)':<8} {len(fileList):>6} {method + ('' if level is None else '-' + str(level)):<12} {sizeIn:>12} {sizeOut:>12} {ratio:>7} {rate:>8}")
+
+        # Suggested codec - fastest within tolerance of best compression
+        best = min(item[3] for item in results[suffix])
+        choice = max([item for item in results[suffix] if item[3] <= best*(1 + tol)], key = lambda item: item[5] or 0)
+        policy[suffix] = choice[0:2]
+
+    policy.setdefault('default', compressPolicy['default'])
+
+    return results, policy
+
+
+# Code for CLI call from Fabric
+# Args: pkgDir, optional sampleMB, tol
+if __name__ == "__main__":
+
+    pkgDir = Path(sys.argv[1])
+    sampleMB = float(sys.argv[2]) if len(sys.argv) > 2 else 100
+    tol = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+
+    results, policy = runBench(pkgDir, sampleMB = sampleMB, tol = tol)
+
+    print(f"\nSuggested policy (fastest within {tol*100}% of best size):")
+    print(json.dumps(policy))
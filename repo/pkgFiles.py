@@ -7,13 +7,28 @@ Can be called from Fabric for remote run case, only requires standard libs.
 
 May be a better way to do this?
 
+19/10/26    Raw member copy (copyMembersRaw()) and per member compression level now fall back to the public zipfile API if zipfile internals are not available.
+            Added per notebook archive formats for full dir case, formats=<JSON file> arg, {notebook stem: format}.
+            File lists now use job move manifests (<job>_manifest.json in jobDir, see _epsRun.moveJobs()) where present, see manifestFilesPkg().
+
+18/10/26    Added tar.zst archive format (archName.tar.zst, or format=tar.zst arg), streamed through multi-threaded zstd as independent frames, with frame offsets per member in the manifest for random access. Requires zstandard.
+            Added listPkg() for structured archive listings from the zip central directory, see also pkgList.py for bulk listing of all archives in a dir.
+            Added incremental archive refresh (refresh=True arg), see refreshPkg(). Archive manifests (with source path, size, mtime & hash per member) are compared with the current files, and only changed archives are updated.
+            Added size-bounded archive splitting (maxSize), as a series of independent archives <archive stem>_partNN.zip split on file boundaries. Replaces multipart zip (zip -s) for new archives.
+            Added append/update engine for archMode = 'a', see updatePkg(). Identical files are skipped, and changed files replaced, with unchanged members copied without recompression.
+            Added streaming archive writer with inline SHA-256, and sidecar manifest per archive (<archive stem>_manifest.json).
+            Archives are now verified against the manifest from the zip central directory, rather than with testzip() (full decompression).
+            Added per-file-type compression policy for archives (compressPolicy), configurable per dataset with policy=<JSON file> arg. See also pkgBench.py for codec benchmarks.
+            Added parallel archive building for full dir case, with process pool (pass workers=N, default all cores), consolidated log and per-archive stats file.
+            Added single-pass directory indexer, indexFilesPkg(), for file lists for all archives from one scan of pkgDir (previously one recursive glob per notebook).
+
 15/01/20    Change file type pattern matching from globPat to rePat - fixes bug with some files being ignored erroneously.
 
 01/01/20    v1
 
 """
 
-from zipfile import ZipFile
+from zipfile import ZipFile, ZipInfo
 import zipfile
 import os
 import sys
@@ -21,6 +36,67 @@ from pathlib import Path
 import glob
 import re
 import datetime
+import hashlib
+import zlib
+import struct
+import io
+import json
+import time
+import contextlib
+import tarfile
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Optional, for tar.zst archives.
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+
+# Compression methods by name, for compression policy settings.
+compressTypes = {'store':zipfile.ZIP_STORED,
+                 'deflate':zipfile.ZIP_DEFLATED,
+                 'bzip2':zipfile.ZIP_BZIP2,
+                 'lzma':zipfile.ZIP_LZMA
+                 }
+
+# Default compression policy by file suffix, as [method, level]. Level None for method default (level is not supported for lzma by zipfile).
+# Already compressed types are stored, large ePS text outputs use deflate (much faster than LZMA for similar ratio), and anything else uses LZMA.
+compressPolicy = {'.nc':['store', None],
+                  '.png':['store', None],
+                  '.jpg':['store', None],
+                  '.gz':['store', None],
+                  '.dat':['deflate', 6],
+                  '.idy':['deflate', 6],
+                  'default':['lzma', None]
+                  }
+
+
+# Archive formats by name, as archive suffix. tar.zst requires zstandard.
+pkgFormats = {'zip':'.zip',
+              'tar.zst':'.tar.zst'
+              }
+
+# Compression level for tar.zst archives.
+zstdLevel = 3
+
+
+def readPolicy(policyFile):
+    """Read compression policy from JSON file, {suffix: [method, level]}. Missing 'default' is set from compressPolicy."""
+    with open(policyFile, 'r') as f:
+        policy = json.load(f)
+
+    policy.setdefault('default', compressPolicy['default'])
+
+    return policy
+
+
+def getCompression(fileName, policy):
+    """Get (compress_type, compresslevel) for fileName from policy."""
+    method, level = policy.get(Path(fileName).suffix.lower(), policy['default'])
+
+    return compressTypes[method], level
 
 
 # Basic bytes to KB/Mb... conversion, from https://stackoverflow.com/questions/2104080/how-to-check-file-size-in-python
@@ -142,6 +218,171 @@ def getFilesPkg(pkgDir, globPat = r"/**/*", rePat = None, recursive=True):
 
     return fileListRe
 
+
+# Exclusions for pkg file lists - zip and multipart zip (.zNN) files, notebooks and scripts. See pkgRePat().
+pkgExclude = re.compile(r"(zip|z[0-9][0-9]|ipynb|sh|sh~)$")
+
+
+def pkgRePat(jRoot):
+    """
+    Set re pattern for files in job package from jRoot (see setJobRoot()).
+
+    NOTE: currently set to ignore zip and ipynb files for later inclusion via single-file calls.
+    Also skips files of type .zNN, which are multipart zip files.
+
+    """
+    # rePat = f".*{jRoot}.*$(?<!zip)(?<!z[0-9][0-9])(?<!ipynb)(?<!sh)(?<!sh~)"
+    return f".*{jRoot}(?!-).*$(?<!zip)(?<!z[0-9][0-9])(?<!ipynb)(?<!sh)(?<!sh~)"  # 25/07/20: added (?!-) to ignore excited state cases with orbXX-XX
+
+
+def scanFilesPkg(pkgDir):
+    """
+    Single pass recursive scan of pkgDir with os.scandir.
+
+    Returns all paths (files and dirs) as per glob.glob(f"{pkgDir}/**/*", recursive=True), i.e. hidden items are skipped.
+
+    """
+    fileList = []
+    dirList = [str(pkgDir)]
+
+    while dirList:
+        try:
+            with os.scandir(dirList.pop()) as items:
+                for item in items:
+                    if item.name.startswith('.'):
+                        continue
+
+                    fileList.append(item.path)
+                    if item.is_dir():
+                        dirList.append(item.path)
+
+        except OSError:
+            pass
+
+    return fileList
+
+
+def readMoveManifests(fileList):
+    """
+    Read job move manifests (<job>_manifest.json in jobDir, as written by _epsRun.moveJobs()) from scanned fileList.
+
+    Move manifests are identified by 'job' and 'files' keys, archive manifests (see writeManifest()) are ignored.
+
+    Returns
+    -------
+    dict
+        {manifestFile: manifest}
+
+    """
+    manifests = {}
+    for item in fileList:
+        if not item.endswith('_manifest.json'):
+            continue
+
+        try:
+            with open(item, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+
+        if isinstance(manifest, dict) and ('job' in manifest) and ('files' in manifest):
+            manifests[item] = manifest
+
+    return manifests
+
+
+def manifestFilesPkg(fileList, manifests = None):
+    """
+    Set file list from job move manifests where present, otherwise use scanned files.
+
+    For each move manifest, scanned files for the job (<job>* in the manifest dir) are replaced by the manifest file list, so only validated files moved from jobComplete are packaged.
+    Manifest files missing from the dir are skipped. Other files (including the move manifest), and dirs without a manifest, are taken from the scan.
+
+    Parameters
+    ----------
+    fileList : list
+        Scan of pkgDir, as returned by scanFilesPkg().
+
+    manifests : dict, optional, default = None
+        Move manifests, as returned by readMoveManifests(). If None, read from fileList.
+
+    Returns
+    -------
+    list
+        File list, as fileList.
+
+    """
+    if manifests is None:
+        manifests = readMoveManifests(fileList)
+
+    if not manifests:
+        return fileList
+
+    # Manifest files by dir & job stem, paths set from manifest location (jobDir may differ by host).
+    jobFiles = {}
+    for manifestFile, manifest in manifests.items():
+        jobDir = os.path.dirname(manifestFile)
+        jobFiles.setdefault(jobDir, {})[manifest['job']] = [os.path.join(jobDir, item['name']) for item in manifest['files']]
+
+    fileListOut = []
+    for item in fileList:
+        jobs = jobFiles.get(os.path.dirname(item), {})
+        if (item in manifests) or not any(os.path.basename(item).startswith(job) for job in jobs):
+            fileListOut.append(item)
+
+    for jobs in jobFiles.values():
+        for files in jobs.values():
+            fileListOut.extend([item for item in files if os.path.exists(item)])
+
+    return fileListOut
+
+
+def indexFilesPkg(pkgDir, jRoots, fileList = None, useManifest = True):
+    """
+    Index files in pkgDir by job root, from a single directory scan.
+
+    Gives the same file lists as getFilesPkg(pkgDir, rePat = pkgRePat(jRoot)) for each jRoot, but pkgDir is only scanned once.
+    Files are pre-filtered by pkgExclude, and by any literal parts of jRoot, before re matching.
+    For job dirs with a move manifest, files for the job are set from the manifest file list, see manifestFilesPkg().
+
+    Parameters
+    ----------
+    pkgDir : str or Path object
+        Directory to search.
+
+    jRoots : list of str
+        Job roots, as set by setJobRoot().
+
+    fileList : list, optional, default = None
+        Pass existing scan of pkgDir, as returned by scanFilesPkg(). If None, pkgDir is scanned.
+
+    useManifest : bool, optional, default = True
+        Use job move manifests for file lists where present. If False, use the scan only.
+
+    Returns
+    -------
+    dict
+        {jRoot: fileList} for all jRoots.
+
+    """
+    if fileList is None:
+        fileList = scanFilesPkg(pkgDir)
+
+    if useManifest:
+        fileList = manifestFilesPkg(fileList)
+
+    # Drop excluded types once for all jobs
+    fileList = [item for item in fileList if not pkgExclude.search(item)]
+
+    pkgIndex = {}
+    for jRoot in set(jRoots):
+        rePat = re.compile(pkgRePat(jRoot))
+        literals = [part for part in jRoot.split('.*') if part and not re.search(r"[.^$*+?{}\[\]\\|()]", part)]
+
+        pkgIndex[jRoot] = [item for item in fileList if all(part in item for part in literals) and rePat.search(item)]
+
+    return pkgIndex
+
 # THIS IS NOT REQUIRED - just call this script with single file.
 # See _repo.updateArch()
 #
@@ -163,7 +404,546 @@ def getFilesPkg(pkgDir, globPat = r"/**/*", rePat = None, recursive=True):
 #             return False
 
 
-def buildPkg(archName, fileList, pkgDir, archMode = 'w', cType = zipfile.ZIP_LZMA):
+def setCompressLevel(zinfo, cLevel):
+    """
+    Set per member compression level, for ZipFile.open(zinfo, 'w').
+
+    zipfile has no public setting for this before Python 3.13 (ZipInfo.compress_level, previously private _compresslevel). If neither is available the default level is used.
+
+    """
+    for attr in ['compress_level', '_compresslevel']:
+        if hasattr(zinfo, attr):
+            setattr(zinfo, attr, cLevel)
+            return True
+
+    return False
+
+
+def writeMember(pkgZip, fileIn, arcname, cType, cLevel = None, blockSize = 2**20):
+    """
+    Stream file into open archive, with SHA-256 computed inline. CRC and sizes are set by zipfile on write.
+
+    Returns manifest entry for the file, {'size', 'CRC', 'sha256', 'mtime', 'compressType', 'source'}, or None for dirs.
+
+    """
+    if os.path.isdir(fileIn):
+        pkgZip.write(fileIn, arcname = arcname)
+        return None
+
+    zinfo = ZipInfo.from_file(fileIn, arcname = arcname)
+    zinfo.compress_type = cType
+    setCompressLevel(zinfo, cLevel)
+
+    h = hashlib.sha256()
+    with open(fileIn, 'rb') as fIn, pkgZip.open(zinfo, 'w') as fOut:
+        for block in iter(lambda: fIn.read(blockSize), b''):
+            h.update(block)
+            fOut.write(block)
+
+    return {'size':zinfo.file_size,
+            'CRC':zinfo.CRC,
+            'sha256':h.hexdigest(),
+            'mtime':os.path.getmtime(fileIn),
+            'compressType':cType,
+            'source':Path(fileIn).as_posix()
+            }
+
+
+def getArchFormat(archName):
+    """Archive format from archive name, 'tar.zst' or 'zip'."""
+    return 'tar.zst' if Path(archName).name.endswith(pkgFormats['tar.zst']) else 'zip'
+
+
+def getArchStem(archName):
+    """Archive name without format suffix."""
+    suffix = pkgFormats[getArchFormat(archName)]
+    if Path(archName).name.endswith(suffix):
+        return Path(archName).name[:-len(suffix)]
+
+    return Path(archName).stem
+
+
+def getManifestFile(archName):
+    """Sidecar manifest file for archive, <archive stem>_manifest.json."""
+    return Path(archName).with_name(getArchStem(archName) + '_manifest.json')
+
+
+def readManifest(archName):
+    """Read manifest for archive, returns None if missing."""
+    manifestFile = getManifestFile(archName)
+    if not manifestFile.is_file():
+        return None
+
+    with open(manifestFile, 'r') as f:
+        return json.load(f)
+
+
+def writeManifest(archName, members, **info):
+    """
+    Write manifest for archive, {'archive', 'date', 'members':{arcname:{'size', 'CRC', 'sha256', 'mtime', 'compressType', 'source'}}}.
+
+    Any additional info is added to the manifest, e.g. format and end of archive offset for tar.zst archives (see buildPkgTar()).
+
+    """
+    manifest = {'archive':Path(archName).name,
+                'date':datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
+                'members':members
+                }
+    manifest.update(info)
+
+    with open(getManifestFile(archName), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    return manifest
+
+
+def verifyArch(archName, manifest = None, full = False, blockSize = 2**20):
+    """
+    Verify archive against manifest.
+
+    By default only the zip central directory is read, and member names, sizes and CRCs are checked against the manifest, plus local header offsets against archive size.
+    This replaces testzip(), which decompresses the full archive.
+
+    Parameters
+    ----------
+    archName : str or Path
+        Archive to check.
+
+    manifest : dict, optional, default = None
+        Manifest to check against. If None, read from sidecar file if present, otherwise only central directory consistency is checked.
+
+    full : bool, optional, default = False
+        Also decompress all members, and check SHA-256 against manifest (and CRC, checked by zipfile on read).
+
+    Returns
+    -------
+    list
+        Problems found, as [member, issue]. Empty list if archive is OK.
+
+    """
+    if getArchFormat(archName) == 'tar.zst':
+        return verifyArchTar(archName, manifest = manifest, full = full)
+
+    if manifest is None:
+        manifest = readManifest(archName)
+
+    problems = []
+    try:
+        with ZipFile(archName, 'r') as checkZip:
+            archSize = os.path.getsize(archName)
+            infoList = {info.filename:info for info in checkZip.infolist()}
+
+            for name, info in infoList.items():
+                if info.header_offset + info.compress_size > archSize:
+                    problems.append([name, 'truncated'])
+
+            if manifest is not None:
+                for name, entry in manifest['members'].items():
+                    info = infoList.get(name)
+                    if info is None:
+                        problems.append([name, 'missing'])
+                    elif (info.file_size != entry['size']) or (info.CRC != entry['CRC']):
+                        problems.append([name, 'size/CRC mismatch'])
+
+                for name, info in infoList.items():
+                    if (name not in manifest['members']) and not info.is_dir():
+                        problems.append([name, 'not in manifest'])
+
+            if full:
+                for name, info in infoList.items():
+                    if info.is_dir():
+                        continue
+
+                    h = hashlib.sha256()
+                    try:
+                        with checkZip.open(info) as f:
+                            for block in iter(lambda: f.read(blockSize), b''):
+                                h.update(block)
+                    except Exception as e:
+                        # Decompression errors are codec specific (zlib.error, lzma.LZMAError...), or BadZipFile for CRC.
+                        problems.append([name, f"{type(e).__name__}: {e}"])
+                        continue
+
+                    entry = manifest['members'].get(name, {}) if manifest is not None else {}
+                    if entry.get('sha256') not in (None, h.hexdigest()):
+                        problems.append([name, 'sha256 mismatch'])
+
+    except (zipfile.BadZipFile, OSError, EOFError) as e:
+        problems.append([Path(archName).name, f"{type(e).__name__}: {e}"])
+
+    return problems
+
+
+def getArcName(fileIn, pkgDir):
+    """Set relative path for file in archive, or just file name (archive root) if path root is different from pkgDir."""
+    # Test & set relative paths for file in archive - may fail in some cases if path root is different.
+    try:
+        arcFile = Path(fileIn).relative_to(pkgDir)
+    except ValueError:
+        arcFile = Path(fileIn).name  # In this case just take file name, will go in archive root
+
+    return Path(arcFile).as_posix()
+
+
+def crcFile(fileIn, blockSize = 2**20):
+    """CRC32 of file, as per zip member CRC."""
+    crc = 0
+    with open(fileIn, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            crc = zlib.crc32(block, crc)
+
+    return crc
+
+
+def checkMember(info, fileIn, entry = None):
+    """
+    Check if file is identical to archive member.
+
+    Sizes are compared first, then mtime from manifest entry if available (same size and mtime are taken as unchanged), otherwise the file CRC is computed and compared.
+
+    """
+    if os.path.getsize(fileIn) != info.file_size:
+        return False
+
+    if (entry is not None) and (entry.get('mtime') == os.path.getmtime(fileIn)):
+        return True
+
+    return crcFile(fileIn) == info.CRC
+
+
+def copyMembersRaw(srcZip, destZip, infoList, blockSize = 2**20):
+    """
+    Copy members from srcZip to destZip, as compressed data (no recompression).
+
+    Python's ZipFile has no raw copy method, so this writes local headers and data directly to destZip.fp, and updates the ZipFile members list, as per ZipFile.write().
+    This uses zipfile internals (_MASK_USE_DATA_DESCRIPTOR, _strip_extra, ZipFile._didModify), if these are not available members are recompressed instead, see copyMembers().
+    Both archives must be open, and destZip must not have an open write handle.
+
+    """
+    if not (hasattr(zipfile, '_MASK_USE_DATA_DESCRIPTOR') and hasattr(zipfile, '_strip_extra') and hasattr(destZip, '_didModify')):
+        return copyMembers(srcZip, destZip, infoList, blockSize = blockSize)
+
+    for info in infoList:
+        # Get data offset from source local header (name & extra field lengths may differ from central directory)
+        srcZip.fp.seek(info.header_offset)
+        header = srcZip.fp.read(zipfile.sizeFileHeader)
+        nameLen, extraLen = struct.unpack('<HH', header[26:30])
+        srcZip.fp.seek(info.header_offset + zipfile.sizeFileHeader + nameLen + extraLen)
+
+        # New entry with sizes in local header (no data descriptor), and any existing zip64 extra field dropped (reset by FileHeader if required).
+        newInfo = ZipInfo(info.filename, date_time = info.date_time)
+        for attr in ['compress_type', 'comment', 'create_system', 'create_version', 'extract_version', 'internal_attr', 'external_attr', 'CRC', 'compress_size', 'file_size']:
+            setattr(newInfo, attr, getattr(info, attr))
+
+        newInfo.flag_bits = info.flag_bits & ~zipfile._MASK_USE_DATA_DESCRIPTOR
+        newInfo.extra = zipfile._strip_extra(info.extra, (1,))
+        newInfo.header_offset = destZip.fp.tell()
+
+        destZip.fp.write(newInfo.FileHeader())
+        remaining = info.compress_size
+        while remaining > 0:
+            block = srcZip.fp.read(min(blockSize, remaining))
+            if not block:
+                raise EOFError(f"Truncated member {info.filename}")
+            destZip.fp.write(block)
+            remaining -= len(block)
+
+        destZip.filelist.append(newInfo)
+        destZip.NameToInfo[newInfo.filename] = newInfo
+        destZip.start_dir = destZip.fp.tell()
+        destZip._didModify = True
+
+
+def copyMembers(srcZip, destZip, infoList, blockSize = 2**20):
+    """
+    Copy members from srcZip to destZip, with decompression and recompression (same compression method, default level).
+
+    Fallback for copyMembersRaw(), using the public ZipFile API only.
+
+    """
+    for info in infoList:
+        newInfo = ZipInfo(info.filename, date_time = info.date_time)
+        for attr in ['compress_type', 'comment', 'create_system', 'internal_attr', 'external_attr']:
+            setattr(newInfo, attr, getattr(info, attr))
+
+        if info.is_dir():
+            destZip.writestr(newInfo, b'')
+            continue
+
+        with srcZip.open(info, 'r') as fIn, destZip.open(newInfo, 'w') as fOut:
+            for block in iter(lambda: fIn.read(blockSize), b''):
+                fOut.write(block)
+
+
+def diffPkg(index, fileList, pkgDir, members = None):
+    """
+    Check files against archive members.
+
+    Parameters
+    ----------
+    index : dict
+        Archive members {name: ZipInfo}.
+
+    fileList, pkgDir
+        As per buildPkg().
+
+    members : dict, optional
+        Manifest entries, used for mtime checks, see checkMember().
+
+    Returns
+    -------
+    dict
+        Lists of [file, arcname] for {'add', 'replace', 'skip'}.
+
+    """
+    if members is None:
+        members = {}
+
+    changes = {'add':[], 'replace':[], 'skip':[]}
+    for fileIn in fileList:
+        arcFile = getArcName(fileIn, pkgDir)
+
+        if os.path.isdir(fileIn):
+            changes['skip' if (arcFile + '/') in index else 'add'].append([fileIn, arcFile])
+        elif arcFile not in index:
+            changes['add'].append([fileIn, arcFile])
+        elif checkMember(index[arcFile], fileIn, members.get(arcFile)):
+            changes['skip'].append([fileIn, arcFile])
+        else:
+            changes['replace'].append([fileIn, arcFile])
+
+    return changes
+
+
+def updatePkg(archName, fileList, pkgDir, cType = zipfile.ZIP_LZMA, policy = compressPolicy, members = None, remove = None):
+    """
+    Append or update files in existing archive.
+
+    Existing members are indexed by name (with sizes and CRCs), and each file is checked against the index:
+
+    - New files are appended.
+    - Identical files (see checkMember()) are skipped.
+    - Changed files are replaced. In this case the archive is rewritten, with unchanged members copied as compressed data (see copyMembersRaw()), so only changed files are recompressed.
+
+    Parameters
+    ----------
+    archName, fileList, pkgDir, cType, policy
+        As per buildPkg().
+
+    members : dict, optional, default = None
+        Manifest entries for existing members, updated in place. See writeManifest().
+
+    remove : list, optional, default = None
+        Members (archive names) to remove. Archive is rewritten if set.
+
+    Returns
+    -------
+    members : dict
+        Updated manifest entries.
+
+    changes : dict
+        Lists of files {'add', 'replace', 'skip'}.
+
+    """
+    if members is None:
+        members = {}
+
+    if remove is None:
+        remove = []
+
+    index = getPkgIndex(archName)
+
+    # Check files against index
+    changes = diffPkg(index, fileList, pkgDir, members)
+    writeList = changes['replace'] + changes['add']
+
+    for name in remove:
+        members.pop(name, None)
+
+    if changes['replace'] or remove:
+        # Rewrite archive: copy unchanged members, then write changed & new files.
+        dropNames = {arcFile for fileIn, arcFile in changes['replace']}.union(remove)
+        tmpFile = Path(archName).with_suffix('.tmp')
+
+        with ZipFile(archName, 'r') as srcZip, ZipFile(tmpFile, 'w', compression=cType) as pkgZip:
+            copyMembersRaw(srcZip, pkgZip, [info for name, info in index.items() if name not in dropNames])
+
+            for fileIn, arcFile in writeList:
+                fileType, fileLevel = getCompression(fileIn, policy) if policy is not None else (cType, None)
+                entry = writeMember(pkgZip, fileIn, arcFile, fileType, fileLevel)
+                if entry is not None:
+                    members[arcFile] = entry
+
+        os.replace(tmpFile, archName)
+
+    elif writeList:
+        with ZipFile(archName, 'a', compression=cType) as pkgZip:
+            for fileIn, arcFile in writeList:
+                fileType, fileLevel = getCompression(fileIn, policy) if policy is not None else (cType, None)
+                entry = writeMember(pkgZip, fileIn, arcFile, fileType, fileLevel)
+                if entry is not None:
+                    members[arcFile] = entry
+
+    for name in remove:
+        print(f'File: {name} removed from archive, source file missing.')
+    for item in changes['replace']:
+        print(f'File: {item[0]} changed, replaced in archive as {item[1]}.')
+    for item in changes['skip']:
+        print(f'File: {item[0]} already in archive as {item[1]}, unchanged.')
+
+    return members, changes
+
+
+def finishPkg(archName, members, **info):
+    """Write manifest for archive, check archive central directory (or index) against it, and print result. Returns True if OK."""
+
+    # Write manifest, and check archive central directory against it.
+    manifest = writeManifest(archName, members, **info)
+    problems = verifyArch(archName, manifest = manifest)
+
+    if not problems:
+        # zipList.append(archName)
+        print(f'Written {archName} OK')
+        fSize = convert_bytes(Path(archName).stat().st_size)
+        print(f"{round(fSize[0],2)} {fSize[1]}")
+        if (fSize[1] == 'GB') or (fSize[1] == 'TB'):
+            print("***LARGE FILE")
+        return True
+    else:
+        # failList.append(archName)
+        print(f'*** Archive {archName} failed')
+        print(*problems, sep='\n')
+        return False
+
+
+def getPartName(archName, n):
+    """Name for part n of split archive, <archive stem>_partNN.zip (or .tar.zst)."""
+    return Path(archName).with_name(f"{getArchStem(archName)}_part{n:02d}{pkgFormats[getArchFormat(archName)]}")
+
+
+def getArchParts(archName):
+    """
+    Get archive file(s) for archName.
+
+    Returns list of parts (<archive stem>_partNN.zip, or .tar.zst) if archive was split, otherwise [archName].
+
+    """
+    parts = sorted(Path(archName).parent.glob(f"{getArchStem(archName)}_part[0-9][0-9]{pkgFormats[getArchFormat(archName)]}"))
+    if parts:
+        return [item.as_posix() for item in parts]
+
+    return [Path(archName).as_posix()]
+
+
+def getPkgIndex(archName):
+    """Archive members {name: info}, with info.file_size and info.CRC, from zip central directory, or manifest (archive index) for tar.zst."""
+    if getArchFormat(archName) == 'tar.zst':
+        return {name:SimpleNamespace(filename = name, file_size = entry['size'], compress_size = None, CRC = entry['CRC'])
+                for name, entry in readManifest(archName)['members'].items()}
+
+    with ZipFile(archName, 'r') as pkgZip:
+        return {info.filename:info for info in pkgZip.infolist()}
+
+
+def listPkg(archName):
+    """
+    List archive members from zip central directory only (no decompression), or archive index for tar.zst, for archive or split archive parts.
+
+    Returns
+    -------
+    dict
+        {part: [[filename, file_size, compress_size, CRC], ...]}, or {part: None} for missing or unreadable archives.
+
+    """
+    members = {}
+    for part in getArchParts(archName):
+        try:
+            members[part] = [[info.filename, info.file_size, info.compress_size, info.CRC] for info in getPkgIndex(part).values()]
+        except (OSError, TypeError, zipfile.BadZipFile):
+            members[part] = None
+
+    return members
+
+
+def removePkg(archName):
+    """Remove existing archive and/or parts, and manifests, before rebuild."""
+    for item in set(getArchParts(archName) + [Path(archName).as_posix()]):
+        for fileIn in [Path(item), getManifestFile(item)]:
+            if fileIn.is_file():
+                fileIn.unlink()
+
+
+def buildPkgParts(archName, fileList, pkgDir, maxSize, cType = zipfile.ZIP_LZMA, policy = compressPolicy):
+    """
+    Build series of independent archives from fileList, each less than maxSize (MB).
+
+    Files are sorted by path, so files from each dir (e.g. energy chunk) are grouped, and split on file boundaries.
+    Compressed size for the next file is estimated from the compression ratio so far, and a new part is started if this would exceed maxSize.
+    Each part is a self-contained zip archive, <archive stem>_partNN.zip, with its own manifest.
+
+    If the total (uncompressed) size is less than maxSize, a single archive archName is written, as per buildPkg().
+    Note a single file larger than maxSize cannot be split, and will be written to a part on its own.
+
+    Returns
+    -------
+    bool
+        True if all parts written OK.
+
+    """
+    maxBytes = maxSize * 2**20
+    removePkg(archName)
+
+    if sum(os.path.getsize(item) for item in fileList if os.path.isfile(item)) <= maxBytes:
+        return buildPkg(archName, fileList, pkgDir, cType = cType, policy = policy)
+
+    fileList = sorted(fileList, key = lambda item: (Path(item).parent.as_posix(), Path(item).name))
+
+    parts = []
+    tests = []
+    sizeIn = 0
+    sizeOut = 0
+    pkgZip = None
+
+    for fileIn in fileList:
+        est = (os.path.getsize(fileIn) if os.path.isfile(fileIn) else 0) * ((sizeOut/sizeIn) if sizeIn else 1)
+
+        # Start new part
+        if (pkgZip is None) or (members and (pkgZip.fp.tell() + est > maxBytes)):
+            if pkgZip is not None:
+                pkgZip.close()
+                tests.append(finishPkg(parts[-1], members))
+
+            parts.append(getPartName(archName, len(parts) + 1))
+            pkgZip = ZipFile(parts[-1], 'w', compression=cType)
+            members = {}
+
+        if policy is not None:
+            fileType, fileLevel = getCompression(fileIn, policy)
+        else:
+            fileType, fileLevel = cType, None
+
+        arcFile = getArcName(fileIn, pkgDir)
+        start = pkgZip.fp.tell()
+        entry = writeMember(pkgZip, fileIn, arcFile, fileType, fileLevel)
+        if entry is not None:
+            members[arcFile] = entry
+            sizeIn += entry['size']
+            sizeOut += pkgZip.fp.tell() - start
+
+    if pkgZip is not None:
+        pkgZip.close()
+        tests.append(finishPkg(parts[-1], members))
+
+    for item in parts:
+        if item.stat().st_size > maxBytes:
+            print(f"***Part {item} larger than {maxSize} MB (single file > maxSize).")
+
+    print(f"Written {len(parts)} parts for {archName}, max size {maxSize} MB.")
+
+    return all(tests)
+
+
+def buildPkg(archName, fileList, pkgDir, archMode = 'w', cType = zipfile.ZIP_LZMA, policy = compressPolicy, maxSize = None):
     """Build pkg zip from fileList
 
     Parameters
@@ -179,9 +959,23 @@ def buildPkg(archName, fileList, pkgDir, archMode = 'w', cType = zipfile.ZIP_LZM
 
     archMode : char, optional, default = 'w'
         Set to 'w'rite or 'a'ppend to existing archive.
+        For 'a', files already in the archive are skipped if unchanged, or replaced if changed, see updatePkg().
 
     cType : int, default = zipfile.ZIP_LZMA (=14)
-        Compression level.
+        Compression type, used for all files if policy = None.
+
+    policy : dict, optional, default = compressPolicy
+        Compression per file suffix, {suffix: [method, level]}, with methods as per compressTypes, and 'default' for other suffixes.
+        Set to None to use cType for all files.
+
+    maxSize : int, optional, default = None
+        If set, split into independent archives < maxSize (MB), see buildPkgParts().
+        For 'a' mode with a split archive, files are added to the last part.
+
+    Files are streamed into the archive with SHA-256 computed inline, and a sidecar manifest is written (see writeManifest()).
+    The archive is then checked against the manifest from the central directory only, see verifyArch().
+
+    For archName with .tar.zst suffix, a tar.zst archive is written instead, see buildPkgTar() and updatePkgTar(). In this case cType and policy are not used.
 
     TODO:
     - Check if arch exists for 'w' case?
@@ -189,68 +983,572 @@ def buildPkg(archName, fileList, pkgDir, archMode = 'w', cType = zipfile.ZIP_LZM
     - Summary for files & dirs, and verbosity level.
 
     """
-    # Set variable for file additions
-    dupList = []
+
+    # Write tar.zst archive
+    if getArchFormat(archName) == 'tar.zst':
+        if archMode == 'a':
+            return updatePkgTar(getArchParts(archName)[-1], fileList, pkgDir)
+
+        return buildPkgTar(archName, fileList, pkgDir, maxSize = maxSize)
+
+    # Write split archive
+    if (maxSize is not None) and (archMode == 'w'):
+        return buildPkgParts(archName, fileList, pkgDir, maxSize, cType = cType, policy = policy)
+
+    # For existing split archive, append to last part.
+    if archMode == 'a':
+        archName = getArchParts(archName)[-1]
+
+    # Manifest entries
+    members = {}
+
+    # Add/update files in existing archive.
+    if (archMode == 'a') and Path(archName).is_file():
+        manifest = readManifest(archName)
+        if manifest is not None:
+            members = manifest['members']
+
+        # Entries for existing files without manifest (archives built before manifests were added)
+        with ZipFile(archName, 'r') as pkgZip:
+            for info in pkgZip.infolist():
+                if (info.filename not in members) and not info.is_dir():
+                    members[info.filename] = {'size':info.file_size, 'CRC':info.CRC, 'sha256':None, 'mtime':None, 'compressType':info.compress_type}
+
+        members, changes = updatePkg(archName, fileList, pkgDir, cType = cType, policy = policy, members = members)
 
     # Create archive & write files
-    with ZipFile(archName, archMode, compression=cType) as pkgZip:
-        for fileIn in fileList:
-            dupPath = None
-
-            # Test & set relative paths for file in archive - may fail in some cases if path root is different.
-            try:
-                arcFile = Path(fileIn).relative_to(pkgDir)
-            except ValueError:
-                arcFile = Path(fileIn).name  # In this case just take file name, will go in archive root
-
-            # Add file to existing arch, check file exists first.
-            if archMode == 'a':
-                # Check all files in arch, names only.
-                for fileName in pkgZip.namelist():
-                    # if Path(fileName).name == Path(fileIn).name:  # May want to use Path(fileIn).relative_to(pkgDir) here for consistency and to allow subdirs with same files?
-                    # if Path(fileIn).relative_to(pkgDir) == Path(fileName):
-                    if arcFile == Path(fileName):
-                        dupPath = fileName
-                        dupList.append([fileIn, fileName])
-                #
-                # if (fileIn[1:] in pkgZip.namelist()):  # FILE MISSING initial / in .namelist(). This only works if full paths preserved/identical
-                if dupPath is not None:
-                    print(f'File: {fileIn} already in archive as {fileName}.')
+    else:
+        with ZipFile(archName, 'w', compression=cType) as pkgZip:
+            for fileIn in fileList:
+                # Set compression by file type
+                if policy is not None:
+                    fileType, fileLevel = getCompression(fileIn, policy)
                 else:
-                    pkgZip.write(fileIn, arcname = arcFile)
+                    fileType, fileLevel = cType, None
 
-            else:
                 # Write file, set also arcname to fix relative paths
-                pkgZip.write(fileIn, arcname = arcFile)
-
-        # Check file is OK
-        if (pkgZip.testzip() is None) and (not dupList):
-            # zipList.append(archName)
-            print(f'Written {archName} OK')
-            fSize = convert_bytes(Path(archName).stat().st_size)
-            print(f"{round(fSize[0],2)} {fSize[1]}")
-            if (fSize[1] == 'GB') or (fSize[1] == 'TB'):
-                print("***LARGE FILE")
-            return True
-        elif dupList:
-            print(f'Skipped duplicate files (new, in arch):')
-            print(*dupList, sep='\n')
-            return False
+                arcFile = getArcName(fileIn, pkgDir)
+                entry = writeMember(pkgZip, fileIn, arcFile, fileType, fileLevel)
+                if entry is not None:
+                    members[arcFile] = entry
+
+    return finishPkg(archName, members)
+
+
+def tarHeader(fileIn, arcname):
+    """Tar (PAX format) header block(s) for file, returns (header, file size)."""
+    st = os.stat(fileIn)
+    tinfo = tarfile.TarInfo(arcname)
+    tinfo.size = st.st_size
+    tinfo.mtime = st.st_mtime
+    tinfo.mode = st.st_mode & 0o7777
+
+    return tinfo.tobuf(format = tarfile.PAX_FORMAT), st.st_size
+
+
+def openTar(archName, offset = 0, level = zstdLevel):
+    """
+    Open tar.zst archive for writing, as a series of independent zstd frames (multi-threaded compression).
+
+    If offset is set, the existing archive is truncated at offset (end of archive frame, see closeTar()), and new frames are appended.
+
+    Returns
+    -------
+    dict
+        Writer state {'fout', 'writer', 'frame', 'pos', 'frameIn'}: file, zstd stream writer, current frame offset (compressed), position in current frame and bytes in previous frames (uncompressed).
+
+    """
+    if zstd is None:
+        raise ImportError("zstandard is required for tar.zst archives.")
+
+    fout = open(archName, 'r+b' if offset else 'wb')
+    fout.truncate(offset)
+    fout.seek(offset)
+
+    return {'fout':fout,
+            'writer':zstd.ZstdCompressor(level = level, threads = -1).stream_writer(fout, closefd = False),
+            'frame':offset,
+            'pos':0,
+            'frameIn':0
+            }
+
+
+def closeTar(tar):
+    """Finish tar.zst archive: close current frame, and write end of archive blocks as a separate frame. Returns offset of end of archive frame."""
+    tar['writer'].flush(zstd.FLUSH_FRAME)
+    eof = tar['fout'].tell()
+    tar['writer'].write(b'\0' * 2 * tarfile.BLOCKSIZE)
+    tar['writer'].flush(zstd.FLUSH_FRAME)
+    tar['writer'].close()
+    tar['fout'].close()
+
+    return eof
+
+
+def writeTarMember(tar, fileIn, arcname, frameSize = 2**22, blockSize = 2**20):
+    """
+    Stream file into open tar.zst archive (see openTar()), with CRC and SHA-256 computed inline.
+
+    A new zstd frame is started once the current frame exceeds frameSize (uncompressed), so members can be read by seeking to the frame offset, see readMemberTar().
+
+    Returns
+    -------
+    dict
+        Manifest entry, as per writeMember(), plus 'frame' (frame offset in archive) and 'offset' (data offset in uncompressed frame).
+
+    """
+    if tar['pos'] >= frameSize:
+        tar['writer'].flush(zstd.FLUSH_FRAME)
+        tar['frameIn'] += tar['pos']
+        tar['frame'] = tar['fout'].tell()
+        tar['pos'] = 0
+
+    header, size = tarHeader(fileIn, arcname)
+    tar['writer'].write(header)
+
+    h = hashlib.sha256()
+    crc = 0
+    nBytes = 0
+    with open(fileIn, 'rb') as f:
+        while nBytes < size:
+            block = f.read(min(blockSize, size - nBytes))
+            if not block:
+                break
+            tar['writer'].write(block)
+            h.update(block)
+            crc = zlib.crc32(block, crc)
+            nBytes += len(block)
+
+    if nBytes != size:
+        raise OSError(f"File {fileIn} changed while writing to archive.")
+
+    pad = (-size) % tarfile.BLOCKSIZE
+    tar['writer'].write(b'\0' * pad)
+
+    entry = {'size':size,
+             'CRC':crc,
+             'sha256':h.hexdigest(),
+             'mtime':os.path.getmtime(fileIn),
+             'compressType':'zstd',
+             'source':Path(fileIn).as_posix(),
+             'frame':tar['frame'],
+             'offset':tar['pos'] + len(header)
+             }
+
+    tar['pos'] += len(header) + size + pad
+
+    return entry
+
+
+def readFrames(archName, frame, offset, size, blockSize = 2**20):
+    """Read size bytes at offset in uncompressed stream, starting from zstd frame at frame (archive offset)."""
+    data = []
+    with open(archName, 'rb') as f:
+        f.seek(frame)
+        with zstd.ZstdDecompressor().stream_reader(f, read_across_frames = True) as reader:
+            remaining = offset
+            while remaining > 0:
+                block = reader.read(min(blockSize, remaining))
+                if not block:
+                    raise EOFError(f"Truncated archive {archName}")
+                remaining -= len(block)
+
+            remaining = size
+            while remaining > 0:
+                block = reader.read(min(blockSize, remaining))
+                if not block:
+                    raise EOFError(f"Truncated archive {archName}")
+                data.append(block)
+                remaining -= len(block)
+
+    return b''.join(data)
+
+
+def readMemberTar(archName, name, manifest = None):
+    """
+    Read single member from tar.zst archive, using the archive index (manifest).
+
+    Only the frame(s) containing the member are decompressed.
+
+    """
+    if manifest is None:
+        manifest = readManifest(archName)
+
+    entry = manifest['members'][name]
+
+    return readFrames(archName, entry['frame'], entry['offset'], entry['size'])
+
+
+def verifyArchTar(archName, manifest = None, full = False, blockSize = 2**20):
+    """
+    Verify tar.zst archive against manifest, as per verifyArch().
+
+    By default only the index is checked (frame offsets against archive size, and end of archive frame), otherwise the full archive is decompressed and members are checked (size, CRC & SHA-256).
+
+    """
+    if manifest is None:
+        manifest = readManifest(archName)
+
+    if manifest is None:
+        return [[Path(archName).name, 'no manifest (archive index)']]
+
+    problems = []
+    try:
+        archSize = os.path.getsize(archName)
+        for name, entry in manifest['members'].items():
+            if entry['frame'] >= archSize:
+                problems.append([name, 'truncated'])
+
+        if readFrames(archName, manifest['eof'], 0, 2 * tarfile.BLOCKSIZE) != b'\0' * 2 * tarfile.BLOCKSIZE:
+            problems.append([Path(archName).name, 'missing end of archive'])
+
+        if full:
+            found = set()
+            with open(archName, 'rb') as f, zstd.ZstdDecompressor().stream_reader(f, read_across_frames = True) as reader:
+                with tarfile.open(fileobj = reader, mode = 'r|') as tarIn:
+                    for tinfo in tarIn:
+                        if not tinfo.isfile():
+                            continue
+
+                        found.add(tinfo.name)
+                        h = hashlib.sha256()
+                        crc = 0
+                        memberIn = tarIn.extractfile(tinfo)
+                        for block in iter(lambda: memberIn.read(blockSize), b''):
+                            h.update(block)
+                            crc = zlib.crc32(block, crc)
+
+                        entry = manifest['members'].get(tinfo.name)
+                        if entry is None:
+                            problems.append([tinfo.name, 'not in manifest'])
+                        elif (tinfo.size != entry['size']) or (crc != entry['CRC']):
+                            problems.append([tinfo.name, 'size/CRC mismatch'])
+                        elif entry.get('sha256') not in (None, h.hexdigest()):
+                            problems.append([tinfo.name, 'sha256 mismatch'])
+
+            for name in set(manifest['members']) - found:
+                problems.append([name, 'missing'])
+
+    except (OSError, EOFError, tarfile.TarError, zstd.ZstdError) as e:
+        problems.append([Path(archName).name, f"{type(e).__name__}: {e}"])
+
+    return problems
+
+
+def buildPkgTar(archName, fileList, pkgDir, maxSize = None, level = zstdLevel, frameSize = 2**22):
+    """
+    Build tar.zst archive from fileList.
+
+    Tar is streamed through multi-threaded zstd compression, as a series of independent frames (~frameSize uncompressed, on file boundaries), so the archive is a standard .tar.zst (e.g. `tar --zstd -xf`).
+    Frame offsets per member are recorded in the manifest (archive index), for random member access, see readMemberTar().
+    Compression policy is not used for this format, all files are compressed with zstd at level.
+
+    For maxSize (MB), large datasets are split into independent archives, <archive stem>_partNN.tar.zst, as per buildPkgParts().
+
+    Returns
+    -------
+    bool
+        True if all parts written OK.
+
+    """
+    removePkg(archName)
+
+    # Files only, dirs are created on extraction.
+    fileList = [item for item in fileList if os.path.isfile(item)]
+
+    maxBytes = maxSize * 2**20 if maxSize is not None else None
+    split = (maxBytes is not None) and (sum(os.path.getsize(item) for item in fileList) > maxBytes)
+    if split:
+        fileList = sorted(fileList, key = lambda item: (Path(item).parent.as_posix(), Path(item).name))
+        frameSize = min(frameSize, int(maxBytes/16))  # Smaller frames for part size estimates
+
+    parts = []
+    tests = []
+    tar = None
+    sizeIn = 0
+    sizeOut = 0
+
+    for fileIn in fileList:
+        # Estimate part size from compression ratio of completed frames, including previous parts.
+        if split and (tar is not None) and members:
+            ratio = (sizeOut + tar['fout'].tell())/(sizeIn + tar['frameIn']) if (sizeIn + tar['frameIn']) else 1
+            est = tar['fout'].tell() + (tar['pos'] + os.path.getsize(fileIn)) * ratio
+
+        # Start new part
+        if (tar is None) or (split and members and (est > maxBytes)):
+            if tar is not None:
+                sizeIn += tar['frameIn'] + tar['pos']
+                tests.append(finishPkg(parts[-1], members, eof = closeTar(tar), format = 'tar.zst'))
+                sizeOut += parts[-1].stat().st_size
+
+            parts.append(getPartName(archName, len(parts) + 1) if split else Path(archName))
+            tar = openTar(parts[-1], level = level)
+            members = {}
+
+        arcFile = getArcName(fileIn, pkgDir)
+        members[arcFile] = writeTarMember(tar, fileIn, arcFile, frameSize = frameSize)
+
+    # Empty archive case
+    if tar is None:
+        parts.append(Path(archName))
+        tar = openTar(parts[-1], level = level)
+        members = {}
+
+    tests.append(finishPkg(parts[-1], members, eof = closeTar(tar), format = 'tar.zst'))
+
+    if split:
+        print(f"Written {len(parts)} parts for {archName}, max size {maxSize} MB.")
+
+    return all(tests)
+
+
+def updatePkgTar(archName, fileList, pkgDir, level = zstdLevel, frameSize = 2**22):
+    """
+    Append or update files in existing tar.zst archive, as per updatePkg().
+
+    New files are appended as new frames (the end of archive frame is overwritten), identical files are skipped, and the archive is rebuilt if any files changed.
+
+    """
+    manifest = readManifest(archName)
+    if (manifest is None) or not Path(archName).is_file():
+        return buildPkgTar(archName, fileList, pkgDir, level = level, frameSize = frameSize)
+
+    members = manifest['members']
+    fileList = [item for item in fileList if os.path.isfile(item)]
+    changes = diffPkg(getPkgIndex(archName), fileList, pkgDir, members)
+
+    for item in changes['skip']:
+        print(f'File: {item[0]} already in archive as {item[1]}, unchanged.')
+
+    if changes['replace']:
+        for item in changes['replace']:
+            print(f'File: {item[0]} changed, rebuilding archive.')
+
+        currentFiles = [entry['source'] for name, entry in members.items() if 'source' in entry]
+        currentFiles.extend(item[0] for item in changes['add'] if item[0] not in currentFiles)
+
+        return buildPkgTar(archName, currentFiles, pkgDir, level = level, frameSize = frameSize)
+
+    if not changes['add']:
+        return True
+
+    tar = openTar(archName, offset = manifest['eof'], level = level)
+    for fileIn, arcFile in changes['add']:
+        members[arcFile] = writeTarMember(tar, fileIn, arcFile, frameSize = frameSize)
+
+    return finishPkg(archName, members, eof = closeTar(tar), format = 'tar.zst')
+
+
+def getPkgFileList(archName, pkgDir):
+    """Get source file list for archive (all parts) from manifest(s), returns None if manifest is missing."""
+    fileList = []
+    for item in getArchParts(archName):
+        manifest = readManifest(item)
+        if manifest is None:
+            return None
+
+        fileList.extend(entry.get('source', Path(pkgDir, name).as_posix()) for name, entry in manifest['members'].items())
+
+    return fileList
+
+
+def refreshPkg(archName, fileList, pkgDir, cType = zipfile.ZIP_LZMA, policy = compressPolicy, maxSize = None):
+    """
+    Refresh existing archive from current files, using archive manifest(s).
+
+    Current inputs are the job fileList, plus any other files already in the archive (e.g. added by _repo.updateArch()) that are still present.
+    These are compared with the manifest & archive members (size, mtime, then CRC), and:
+
+    - Unchanged archives are left as is.
+    - Single archives are updated in place with updatePkg(), with unchanged members copied without recompression, and members with missing source files removed.
+    - Split archives, and tar.zst archives, are rebuilt.
+    - Archives without manifests are rebuilt.
+
+    Returns
+    -------
+    test : bool
+        True if archive is OK.
+
+    status : str
+        'unchanged', 'updated', 'rebuilt' or 'built'.
+
+    """
+    parts = getArchParts(archName)
+
+    if not all(Path(item).is_file() and getManifestFile(item).is_file() for item in parts):
+        print(f"No archive or manifest for {archName}, building archive.")
+        return buildPkg(archName, fileList, pkgDir, cType = cType, policy = policy, maxSize = maxSize), 'built'
+
+    members = {}
+    index = {}
+    for item in parts:
+        members.update(readManifest(item)['members'])
+        index.update(getPkgIndex(item))
+
+    # Current inputs, add existing members from other sources if still present.
+    # Members without a source path (older manifests) are kept as is.
+    currentFiles = list(fileList)
+    arcNames = {getArcName(fileIn, pkgDir) for fileIn in fileList}
+    remove = []
+    for name, entry in members.items():
+        if (name in arcNames) or ('source' not in entry):
+            continue
+
+        if os.path.isfile(entry['source']):
+            currentFiles.append(entry['source'])
         else:
-            # failList.append(archName)
-            print(f'*** Archive {archName} failed')
-            return False
+            remove.append(name)
+
+    changes = diffPkg(index, currentFiles, pkgDir, members)
+    print(f"Refresh {archName}: {len(changes['add'])} new, {len(changes['replace'])} changed, {len(remove)} removed, {len(changes['skip'])} unchanged files.")
+
+    if not (changes['add'] or changes['replace'] or remove):
+        return True, 'unchanged'
+
+    if (len(parts) > 1) or (Path(parts[0]).name != Path(archName).name) or (getArchFormat(archName) == 'tar.zst'):
+        return buildPkg(archName, currentFiles, pkgDir, cType = cType, policy = policy, maxSize = maxSize), 'rebuilt'
+
+    members, changes = updatePkg(archName, currentFiles, pkgDir, cType = cType, policy = policy, members = members, remove = remove)
+
+    return finishPkg(archName, members), 'updated'
+
+
+def buildPkgJob(job):
+    """
+    Build single archive with buildPkg(), with output captured for consolidated logging.
+
+    Parameters
+    ----------
+    job : list
+        [archName, fileList, pkgDir, policy, maxSize, refresh], as passed to buildPkg(), or refreshPkg() if refresh = True.
+
+    Returns
+    -------
+    dict
+        Archive stats and log, {'archName', 'OK', 'status', 'parts', 'files', 'srcSize', 'archSize', 'ratio', 'time', 'fileList', 'log'}.
+        fileList is the final archive file list (from manifests), for updating pkgFileList.
+
+    """
+    archName, fileList, pkgDir, policy, maxSize, refresh = job
+
+    out = io.StringIO()
+    start = time.time()
+    with contextlib.redirect_stdout(out):
+        try:
+            if refresh:
+                test, status = refreshPkg(archName, fileList, pkgDir, policy = policy, maxSize = maxSize)
+            else:
+                test = buildPkg(archName, fileList, pkgDir, policy = policy, maxSize = maxSize)
+                status = 'built'
+        except Exception as e:
+            print(f'*** Archive {archName} failed: {type(e).__name__}: {e}')
+            test = False
+            status = 'failed'
+
+    srcSize = sum(os.path.getsize(item) for item in fileList if os.path.isfile(item))
+    parts = getArchParts(archName)
+    archSize = sum(os.path.getsize(item) for item in parts if os.path.isfile(item))
+
+    return {'archName':Path(archName).as_posix(),
+            'OK':test,
+            'status':status,
+            'parts':parts,
+            'files':len(fileList),
+            'srcSize':srcSize,
+            'archSize':archSize,
+            'ratio':round(archSize/srcSize, 3) if srcSize else None,
+            'time':round(time.time() - start, 1),
+            'fileList':getPkgFileList(archName, pkgDir),
+            'log':out.getvalue()
+            }
+
+
+def buildPkgPool(jobs, workers = None):
+    """
+    Build archives in parallel with a process pool, one archive per process.
+
+    Jobs are submitted largest first for load balancing. Output for each archive is printed as a single block on completion, so the log is not interleaved.
+
+    Parameters
+    ----------
+    jobs : list
+        List of [archName, fileList, pkgDir, policy, maxSize, refresh] per archive.
+
+    workers : int, optional, default = None
+        Number of processes. If None, use all cores.
+
+    Returns
+    -------
+    list
+        Stats dict per archive, see buildPkgJob().
+
+    """
+    if workers is None:
+        workers = os.cpu_count()
+
+    workers = max(1, min(workers, len(jobs)))
+    jobs = sorted(jobs, key = lambda job: sum(os.path.getsize(item) for item in job[1] if os.path.isfile(item)), reverse = True)
+
+    print(f"Building {len(jobs)} archives with {workers} processes\n")
+
+    stats = []
+    if workers == 1:
+        results = map(buildPkgJob, jobs)
+    else:
+        pool = ProcessPoolExecutor(max_workers = workers)
+        results = (future.result() for future in as_completed([pool.submit(buildPkgJob, job) for job in jobs]))
+
+    for result in results:
+        stats.append(result)
+        print(f"[{len(stats)}/{len(jobs)}] {result['archName']} ({result['status']}): {result['files']} files, {result['srcSize']} -> {result['archSize']} bytes, {result['time']}s")
+        print(result['log'])
+        sys.stdout.flush()
+
+    if workers > 1:
+        pool.shutdown()
+
+    return stats
+
+
+def writePkgStats(statsFile, stats):
+    """Write per-archive stats (without logs) to JSON file, and print summary."""
+
+    statsOut = [{k:v for k,v in item.items() if k != 'log'} for item in stats]
+    with open(statsFile, 'w') as f:
+        json.dump(statsOut, f, indent=2)
+
+    srcSize = sum(item['srcSize'] for item in stats)
+    archSize = sum(item['archSize'] for item in stats)
+    print(f"\n***Archive summary: {sum(item['OK'] for item in stats)} OK, {sum(not item['OK'] for item in stats)} failed.")
+    print(', '.join(f"{status} {sum(item['status'] == status for item in stats)}" for status in sorted({item['status'] for item in stats})))
+    print(f"Total {srcSize} -> {archSize} bytes, build time {round(sum(item['time'] for item in stats), 1)}s (sum over archives).")
+    print(f"Stats written to {statsFile}")
+
+    return statsOut
 
 
 # Additional code for checking archives.
-def checkArch(archName):
-    """Test archive & return info if OK"""
+def checkArch(archName, full = False):
+    """
+    Test archive & return info if OK.
+
+    Checks against manifest if present, from central directory only, see verifyArch(). Set full = True to decompress and check all members.
+    For tar.zst archives, member info and names are from the archive index, see getPkgIndex().
+
+    """
 
     infoList = None
     nameList = None
 
-    with ZipFile(archName, 'r') as checkZip:
-        if checkZip.testzip() is None:
+    if verifyArch(archName, full = full):
+        return infoList, nameList
+
+    if getArchFormat(archName) == 'tar.zst':
+        index = getPkgIndex(archName)
+        infoList = list(index.values())
+        nameList = list(index)
+    else:
+        with ZipFile(archName, 'r') as checkZip:
             infoList = checkZip.infolist()  # Get info & file list
             nameList = checkZip.namelist()
 
@@ -259,6 +1557,11 @@ def checkArch(archName):
 
 # Code for CLI call from Fabric
 # Args: pkgDir, dryRun, archName, jobSchema, jRoot
+# Optional arg workers=N sets number of processes for full dir case (default all cores), and can be passed in any position.
+# Optional arg policy=<JSON file> sets compression policy, {suffix: [method, level]}, otherwise compressPolicy is used.
+# Optional arg maxSize=N (MB) splits archives into independent parts < maxSize.
+# Optional arg refresh=True updates existing archives from manifests, rather than rebuilding, see refreshPkg().
+# Optional arg format=zip or format=tar.zst sets archive format for full dir case, for single job case this is set by archName suffix.
 # If jRoot is not passed, pkg a directory, otherwise pkg single job as defined.
 # If jRoot is a file, then add this to archive, otherwise search for files based on jRoot.
 # For jRoot case jobSchema is not used, but currently setting method by len(sys.argv), so required.
@@ -269,6 +1572,34 @@ def checkArch(archName):
 #        Otherwise rePat = f".*{jRoot}.*" for basic substring match.
 if __name__ == "__main__":
 
+    # Optional keyword args
+    workers = None
+    policy = compressPolicy
+    maxSize = None
+    refresh = False
+    pkgFormat = 'zip'
+    formats = {}
+    for arg in sys.argv[1:]:
+        if arg.startswith('workers='):
+            workers = int(arg.split('=')[1])
+            sys.argv.remove(arg)
+        elif arg.startswith('policy='):
+            policy = readPolicy(arg.split('=', 1)[1])
+            sys.argv.remove(arg)
+        elif arg.startswith('maxSize='):
+            maxSize = float(arg.split('=')[1])
+            sys.argv.remove(arg)
+        elif arg.startswith('refresh='):
+            refresh = (arg.split('=')[1] == 'True')
+            sys.argv.remove(arg)
+        elif arg.startswith('format='):
+            pkgFormat = arg.split('=')[1]
+            sys.argv.remove(arg)
+        elif arg.startswith('formats='):
+            with open(arg.split('=', 1)[1], 'r') as f:
+                formats = json.load(f)  # Per notebook formats, {notebook stem: format}
+            sys.argv.remove(arg)
+
     # Passed args - this is root dir containing notebooks + ePS output subdirs.
     pkgDir = Path(sys.argv[1])
     jobSchema = sys.argv[4]
@@ -284,6 +1615,7 @@ if __name__ == "__main__":
         # Print header lines for job, will be in log file.
         print("\n***Writing archives")
         print(f"nbProcDir: {pkgDir}")
+        print(f"Format: {pkgFormat}{f', per notebook {formats}' if formats else ''}, compression policy: {policy}")
         print(datetime.datetime.now().strftime("%Y-%m-%d %H:%M") + '\n')
 
     # print(sys.argv)
@@ -306,17 +1638,17 @@ if __name__ == "__main__":
         elif Path(jRoot).is_dir():
             print(f'Skipping dir: {jRoot}')
         else:
-            # If a pattern is passed, create file list for pkg
-            # NOTE: currently set to ignore zip and ipynb files for later inclusion via single-file calls.
-            # Also skips files of type .zNN, which are multipart zip files.
-            # rePat = f".*{jRoot}.*$(?<!zip)(?<!z[0-9][0-9])(?<!ipynb)(?<!sh)(?<!sh~)"
-            rePat = f".*{jRoot}(?!-).*$(?<!zip)(?<!z[0-9][0-9])(?<!ipynb)(?<!sh)(?<!sh~)"  # 25/07/20: added (?!-) to ignore excited state cases with orbXX-XX
-            fileList = getFilesPkg(pkgDir, rePat = rePat)
+            # If a pattern is passed, create file list for pkg, see pkgRePat() for file exclusions.
+            rePat = pkgRePat(jRoot)
+            fileList = indexFilesPkg(pkgDir, [jRoot])[jRoot]
             # fileList
 
         # Write zip
         if not dryRun:
-            buildPkg(archName, fileList, pkgDir, archMode = archMode)
+            if refresh and (archMode == 'w'):
+                refreshPkg(archName, fileList, pkgDir, policy = policy, maxSize = maxSize)
+            else:
+                buildPkg(archName, fileList, pkgDir, archMode = archMode, policy = policy, maxSize = maxSize)
         else:
             print('\n***Pkg dry run')
             # print(f"Job: {item}")
@@ -329,40 +1661,33 @@ if __name__ == "__main__":
     else:
         archDir = Path(sys.argv[3])
 
-        # Create notebook file list for pkg
-        rePat = ".ipynb$"
-        nbFileList = getFilesPkg(pkgDir, globPat = r"/**/*", rePat = rePat)
+        # Scan pkgDir once, and create notebook file list for pkg
+        scanList = scanFilesPkg(pkgDir)
+        nbFileList = [item for item in scanList if re.search(".ipynb$", item)]
 
         if dryRun:
             print("\n***Notebook file list:")
             print(*nbFileList, sep='\n')
 
-        zipList = []
-        failList = []
+        # Index files by job root for all notebooks, from single scan.
+        # jRoot = item.stem.rsplit(sep='_', maxsplit=2)
+        jRoots = {item:setJobRoot(item, jobSchema) for item in nbFileList}
+        pkgIndex = indexFilesPkg(pkgDir, jRoots.values(), fileList = scanList)
+
+        pkgJobs = []
         for item in nbFileList:  # Local file list
 
             # Job keys
+            jRoot = jRoots[item]
             item = Path(item)
-            # jRoot = item.stem.rsplit(sep='_', maxsplit=2)
-            jRoot = setJobRoot(item, jobSchema)
-            archName = Path(archDir, item.stem + '.zip')
-
-            # Create file list for pkg
-            # rePat = f".*{jRoot}.*"
-            # rePat = f".*{jRoot}.*$(?<!zip)(?<!ipynb)"  # Use this for file end exclusion, rather than glob, from https://stackoverflow.com/a/10055688
-            # Also skips files of type .zNN, which are multipart zip files.
-            # rePat = f".*{jRoot}.*$(?<!zip)(?<!z[0-9][0-9])(?<!ipynb)(?<!sh)(?<!sh~)"
-            rePat = f".*{jRoot}(?!-).*$(?<!zip)(?<!z[0-9][0-9])(?<!ipynb)(?<!sh)(?<!sh~)"  # 25/07/20: added (?!-) to ignore excited state cases with orbXX-XX
-            fileList = getFilesPkg(pkgDir, rePat = rePat)
-
-            # Write zip
-            if not dryRun:
-                test = buildPkg(archName, fileList, pkgDir, archMode = archMode)
+            archName = Path(archDir, item.stem + pkgFormats[formats.get(item.stem, pkgFormat)])
 
-                if test:
-                    zipList.append(archName)
-                else:
-                    failList.append(archName)
+            # File list for pkg
+            rePat = pkgRePat(jRoot)
+            fileList = pkgIndex[jRoot]
+
+            if not dryRun:
+                pkgJobs.append([archName, fileList, pkgDir, policy, maxSize, refresh])
 
             else:
                 print('\n***Pkg dry run')
@@ -372,9 +1697,16 @@ if __name__ == "__main__":
                 print(f"rePat: {rePat}")
                 print(*fileList, sep='\n')
 
+        # Write zips
+        if not dryRun:
+            stats = buildPkgPool(pkgJobs, workers = workers)
+            zipList = [item['archName'] for item in stats if item['OK']]
+            failList = [item['archName'] for item in stats if not item['OK']]
 
+            writePkgStats(Path(archDir, f"{pkgDir.name}_pkgStats.json"), stats)
+
+            if failList:
+                print(f"\n***Failed archives:")
+                print(*failList, sep='\n')
 
-        if not dryRun:
             print(f'\nArchives completed at {datetime.datetime.now().strftime("%Y-%m-%d %H:%M")}\n')
-            # TODO: Additional print/pass/write results here?
-            # Currently included print() statements from buildPkg()
@@ -0,0 +1,45 @@
+"""
+epsman
+
+Local python script for bulk archive listings.
+
+Can be called from Fabric for remote run case, only requires standard libs (plus pkgFiles.py, in the same dir).
+
+Reads the zip central directory only for each archive (no decompression), and prints the member lists as JSON on a single (final) line,
+{archName: {part: [[filename, file_size, compress_size, CRC], ...]}}. Split archives (<archive stem>_partNN.zip or .tar.zst) are grouped by archive name. For tar.zst archives, members are listed from the archive index (manifest).
+
+18/10/26    v1
+
+"""
+
+import sys
+import re
+import json
+from pathlib import Path
+
+from pkgFiles import listPkg, pkgFormats
+
+
+def listArchives(pathList):
+    """
+    List members for all archives in pathList.
+
+    Items may be archive files, or dirs, in which case all archives in the dir (non-recursive) are listed.
+
+    """
+    archList = []
+    for item in pathList:
+        if Path(item).is_dir():
+            archFiles = [fileIn for suffix in pkgFormats.values() for fileIn in Path(item).glob('*' + suffix)]
+            archList.extend(sorted({re.sub(r'_part\d\d(\.zip|\.tar\.zst)$', r'\1', fileIn.as_posix()) for fileIn in archFiles}))
+        else:
+            archList.append(Path(item).as_posix())
+
+    return {archName:listPkg(archName) for archName in archList}
+
+
+# Code for CLI call from Fabric
+# Args: archive files and/or dirs.
+if __name__ == "__main__":
+
+    print(json.dumps(listArchives(sys.argv[1:])))
@@ -3,7 +3,8 @@
 # Nohup wrapper for jobs packaging for remote run with Fabric
 # 03/01/20
 #
-# Passed ags {Path(self.hostDefn[self.host]['repoScpPath'], self.scpDefnRepo['pkg']).as_posix()} {self.hostDefn[self.host]['nbProcDir'].as_posix()} {dryRun} {self.hostDefn[self.host]['pkgDir'].as_posix()} {self.nbDetails['proc']['archLog']}
+# Passed ags {Path(self.hostDefn[self.host]['repoScpPath'], self.scpDefnRepo['pkg']).as_posix()} {self.hostDefn[self.host]['nbProcDir'].as_posix()} {dryRun} {self.hostDefn[self.host]['pkgDir'].as_posix()} {self.hostDefn[self.host]['jobSchema']} {self.nbDetails['proc']['archLog']}
+# 18/10/26: optional trailing args (7th onwards) are passed to pkgFiles.py, e.g. workers=N policy=<file> maxSize=N refresh=True/False format=zip/tar.zst formats=<file>.
 
 echo Starting pkg run with nohup
 
@@ -12,4 +13,4 @@ echo Starting pkg run with nohup
 
 # stdoutTxt=$2/archLog_nohup.log
 stdoutTxt=$6
-nohup python $1 $2 $3 $4 $5 > $stdoutTxt &
+nohup python "$1" "$2" "$3" "$4" "$5" "${@:7}" > "$stdoutTxt" 2>&1 &
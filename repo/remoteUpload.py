@@ -7,6 +7,13 @@ Can be called from Fabric for remote run case, only requires standard libs + loc
 
 Currently duplicates some functions in _repo.py, in stripped-down form.
 
+18/10/26    Files already on the repo (matching MD5) are skipped, and changed files replaced, see repoUpload.syncFile(). Dry run reports the comparison per file.
+            Added setArchParts() for split archives (independent <archive stem>_partNN.zip files, see pkgFiles.buildPkgParts()).
+            splitArchFiles() (zip -s) is now only used for older single archives over the size limit.
+            setArchParts() also handles tar.zst archives, with archive index files.
+            Uploads for all jobs now run with concurrent upload scheduler (optional arg workers=N), with progress saved to <jsonProcFile>.progress.
+            uploadRepoFiles() now streams files to the deposition bucket with retries, see repoUpload.py (requires repoUpload.py in the same dir).
+
 20/01/20    Testing for Zenodo uploads.  Issue with files >100Mb... drops out with errors, but not messages.
 
 09/01/20    v1
@@ -21,6 +28,8 @@ import requests
 import os
 import glob
 
+from repoUpload import getBucketURL, getBucketFiles, compareFile, uploadFiles, scheduleUploads
+
 #from epsman.repo.pkgFiles import convert_bytes
 # Basic bytes to KB/Mb... conversion, from https://stackoverflow.com/questions/2104080/how-to-check-file-size-in-python
 def convert_bytes(num):
@@ -56,6 +65,40 @@ def readNBdetailsJSON(jsonProcFile):
         return None
 
 
+def setArchParts(nbDetails, key, verbose = True):
+    """
+    Set repoFiles for split archives.
+
+    If archive was built as independent parts, <archive stem>_partNN.zip (see pkgFiles.buildPkgParts()), replace archName in repoFiles with the parts.
+    For tar.zst archives, <archive stem>_partNN.tar.zst, the archive index files (<part stem>_manifest.json) are also set.
+    Returns True if parts were found.
+
+    """
+    arch = Path(nbDetails[key]['archName'])
+    suffix = '.tar.zst' if arch.name.endswith('.tar.zst') else '.zip'
+    stem = arch.name[:-len(suffix)] if arch.name.endswith(suffix) else arch.stem
+    parts = sorted(item.as_posix() for item in arch.parent.glob(f"{stem}_part[0-9][0-9]{suffix}"))
+
+    if not parts:
+        return False
+
+    uploads = list(parts)
+    if suffix == '.tar.zst':
+        uploads.extend(item[:-len(suffix)] + '_manifest.json' for item in parts)
+
+    dropList = [arch.as_posix(), Path(arch.parent, stem + '_manifest.json').as_posix()]
+    updatedList = [item for item in nbDetails[key]['repoFiles'] if (item not in dropList) and (item not in uploads)]
+    updatedList.extend(uploads)
+
+    nbDetails[key]['repoFiles'] = updatedList
+    nbDetails[key]['archParts'] = parts
+
+    if verbose:
+        print(f"Updated repoFiles list with {len(parts)} archive parts.")
+
+    return True
+
+
 def splitArchFiles(nbDetails, key, dryRun = True, chunk = 90, verbose = True):
     """
     Basic routine to split existing archive files into chunks for upload.
@@ -64,10 +107,15 @@ def splitArchFiles(nbDetails, key, dryRun = True, chunk = 90, verbose = True):
     See, e.g., https://serverfault.com/questions/760337/how-to-zip-files-with-a-size-limit/760341
 
     TODO: replace with better logic...?  Package files for E sets to avoid large archives? Use Tar?
+    NOW: new archives are split at build time, see setArchParts(). This is only required for older single archives.
 
     """
 
     arch = Path(nbDetails[key]['archName'])
+    if arch.suffix != '.zip':
+        print(f"***Skipping split for non-zip archive {arch}, rebuild with maxSize set (see pkgFiles.buildPkgTar()).")
+        return None
+
     archSize = convert_bytes(os.stat(arch).st_size)
 
     if ('MB' in archSize[1]) and (archSize[0] > chunk):
@@ -106,40 +154,27 @@ def splitArchFiles(nbDetails, key, dryRun = True, chunk = 90, verbose = True):
 def uploadRepoFiles(nbDetails, key, ACCESS_TOKEN, dryRun = True):
     """Upload files to repo (from local machine)
 
+    Files are streamed to the deposition bucket with retries, see repoUpload.uploadFile().
+    Files already in the deposition with matching MD5 are skipped, and files that differ are replaced, see repoUpload.syncFile().
     See _repo.uploadRepoFiles() for local version.
 
-    """
-
-    url = f"https://zenodo.org/api/deposit/depositions/{nbDetails[key]['repoInfo']['id']}/files?access_token={ACCESS_TOKEN}"
-
-    outputs = []
-    for fileIn in nbDetails[key]['repoFiles']:
-        data = {'name': Path(fileIn).name}
-        files = {'file': open(fileIn, 'rb')}
+    For dryRun, returns comparison with existing deposition files, as per repoUpload.compareFile(), without uploading.
 
-        if not dryRun:
-            r = requests.post(url, data=data, files=files)
+    """
 
-            if r.ok:
-                print(f"File upload OK: {fileIn}")
-            elif r.json()['status'] == 400:
-                print(f"File already on server: : {fileIn}")
-            else:
-                print(f"File upload failed: {fileIn}")
-                # print(r.json())
+    bucketURL = getBucketURL(nbDetails[key]['repoInfo'], ACCESS_TOKEN)
 
-            outputs.append([r.ok, r.json()])
+    if dryRun:
+        print("Dry run only...")
+        print(f"Deposition: {nbDetails[key]['repoInfo']['id']}")
+        repoFiles = getBucketFiles(bucketURL, token = ACCESS_TOKEN)
+        comps = [compareFile(fileIn, repoFiles = repoFiles) for fileIn in nbDetails[key]['repoFiles'] if os.path.isfile(fileIn)]
+        for comp in comps:
+            print(f"{comp['file']} ({comp['size']} bytes): {comp['action']}")
 
-        else:
-            print("Dry run only...")
-            print(f"URL: {url}")
-            print(f"data: {data}")
-            print(f"File: {fileIn}")
-            outputs.append([url, data, files])
+        return comps
 
-    # nbDetails[key]['repoFilesUpload'] = outputs
-    # return nbDetails
-    return outputs
+    return uploadFiles(bucketURL, nbDetails[key]['repoFiles'], token = ACCESS_TOKEN)
 
 def writeNBdetailsJSON(jsonProcFile, nbDetails):
     """Write nbDetails dictionary to JSON file.
@@ -158,9 +193,10 @@ def writeNBdetailsJSON(jsonProcFile, nbDetails):
 # If running as main, take passed args and run functions.
 # TODO: add log file per job writing here?
 if __name__ == "__main__":
-    # Passed args
+    # Passed args, optional workers=N sets number of concurrent transfers.
     jsonProcFile = sys.argv[1]
     ACCESS_TOKEN = sys.argv[2]
+    workers = int(sys.argv[3].split('=')[1]) if len(sys.argv) > 3 else 4
     verbose = True
     dryRun = False
 
@@ -172,14 +208,28 @@ if __name__ == "__main__":
     if verbose:
         pprint.pprint(nbDetails)
 
-    # Upload files & log result.
+    # Set files for upload.
+    jobs = {}
     for key in nbDetails:
         if key!='proc' and nbDetails[key]['pkg'] and nbDetails[key]['archFilesOK']:
-            splitArchFiles(nbDetails, key, dryRun = dryRun, verbose = verbose)
-            nbDetails[key]['repoFilesUpload'] = uploadRepoFiles(nbDetails, key, ACCESS_TOKEN, dryRun=dryRun)
+            if not setArchParts(nbDetails, key, verbose = verbose):
+                splitArchFiles(nbDetails, key, dryRun = dryRun, verbose = verbose)
+
+            if dryRun:
+                nbDetails[key]['repoFilesUpload'] = uploadRepoFiles(nbDetails, key, ACCESS_TOKEN, dryRun=dryRun)
+            else:
+                jobs[key] = [getBucketURL(nbDetails[key]['repoInfo'], ACCESS_TOKEN), nbDetails[key]['repoFiles']]
         else:
             print(f"***Skipping item {key} upload")
 
+    # Upload files for all jobs with scheduler & log result.
+    # Progress is written to jsonProcFile.progress, and completed files are skipped on rerun.
+    if jobs:
+        progress = scheduleUploads(jobs, token = ACCESS_TOKEN, workers = workers, progressFile = jsonProcFile + '.progress', verbose = verbose)
+
+        for key in jobs:
+            nbDetails[key]['repoFilesUpload'] = list(progress[key].values())
+
     # Write to new JSON file
     if not dryRun:
         print(f"\nWriting log file {jsonProcFile + '.upload'}")
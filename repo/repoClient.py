@@ -0,0 +1,303 @@
+"""
+epsman
+
+Repo API client, currently for Zenodo.
+
+Only requires standard libs + requests.
+
+RepoClient wraps a pooled requests.Session (one TLS connection pool for all calls), with the access token set once, automatic pagination for deposition searches, and a short-lived cache for GET responses.
+Cached responses are cleared on any write request (POST, PUT, DELETE).
+
+The base URL can be set for testing against a local stub server.
+
+A local deposition index (all depositions for the account, keyed by id, normalised title and DOI) can be used to find existing records without a search request per item, see updateIndex() and findDeposition().
+The index is refreshed incrementally (depositions modified since the last refresh), and optionally saved to file.
+
+18/10/26    Added newVersion() and deleteFile() for versioning.
+            Added deposition index.
+            v1
+
+"""
+
+import time
+import json
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Zenodo API
+depositURL = 'https://zenodo.org/api/deposit/depositions'
+
+
+def normTitle(title):
+    """Normalised title for index: lower case, whitespace collapsed, and any 'ePSproc:' prefix removed."""
+    title = ' '.join(str(title).lower().split())
+    if title.startswith('epsproc:'):
+        title = title[len('epsproc:'):].strip()
+
+    return title
+
+
+def getDOIs(item):
+    """DOIs for deposition, published and/or reserved."""
+    dois = [item.get('doi'), item.get('metadata', {}).get('prereserve_doi', {}).get('doi')]
+    return {doi for doi in dois if doi}
+
+
+class RepoClient():
+    """
+    Client for repo API calls, with pooled session, pagination and response cache.
+
+    Parameters
+    ----------
+    token : str
+        Repo access token, passed as access_token param for all requests.
+
+    baseURL : str, optional, default = depositURL
+        API URL for depositions.
+
+    cacheTime : float, optional, default = 60
+        Lifetime (s) for cached GET responses. Set to 0 to disable cache.
+
+    poolSize : int, optional, default = 10
+        Connection pool size.
+
+    timeout : float, optional, default = 60
+        Request timeout (s).
+
+    indexFile : str or Path, optional, default = None
+        File for deposition index, see updateIndex().
+
+    """
+
+    def __init__(self, token, baseURL = depositURL, cacheTime = 60, poolSize = 10, timeout = 60, indexFile = None):
+        self.token = token
+        self.baseURL = baseURL.rstrip('/')
+        self.cacheTime = cacheTime
+        self.timeout = timeout
+        self.cache = {}
+
+        self.indexFile = indexFile
+        self.index = None
+        self.indexTime = None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = poolSize, pool_maxsize = poolSize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, params = None, **kwargs):
+        """Request with token set, GET responses are cached for cacheTime, other methods clear the cache. Returns requests.Response."""
+        params = dict(params or {})
+        params['access_token'] = self.token
+
+        if method == 'GET':
+            cacheKey = (url, json.dumps(params, sort_keys = True, default = str))
+            if (cacheKey in self.cache) and (time.monotonic() - self.cache[cacheKey][0] < self.cacheTime):
+                return self.cache[cacheKey][1]
+
+        else:
+            self.cache = {}
+
+        r = self.session.request(method, url, params = params, timeout = kwargs.pop('timeout', self.timeout), **kwargs)
+
+        if (method == 'GET') and r.ok and self.cacheTime:
+            self.cache[cacheKey] = (time.monotonic(), r)
+
+        return r
+
+    def clearCache(self):
+        self.cache = {}
+
+    def search(self, searchString = '', size = 100, maxPages = None, **params):
+        """
+        Search depositions, with pagination. Returns list of all results.
+
+        Pages are followed via the response Link header (rel="next") until there is none, so results are complete if the server caps the page size.
+        If the server doesn't set Link headers, pages are requested until an empty page is returned.
+
+        Additional params are passed to the API, e.g. sort, status.
+        Raises requests.HTTPError for failed requests, e.g. server error (500) for invalid search string.
+
+        """
+        results = []
+        url = self.baseURL
+        pageParams = {'q':searchString, 'page':1, 'size':size, **params}
+        page = 1
+        while (maxPages is None) or (page <= maxPages):
+            r = self.request('GET', url, params = pageParams)
+            r.raise_for_status()
+
+            items = r.json()
+            results.extend(items)
+
+            if 'next' in r.links:
+                # Next URL includes query params
+                url = r.links['next']['url']
+                pageParams = None
+            elif ('Link' in r.headers) or (pageParams is None) or not items:
+                break
+            else:
+                pageParams['page'] += 1
+
+            page += 1
+
+        return results
+
+    def getDeposition(self, id):
+        return self.request('GET', f"{self.baseURL}/{id}")
+
+    def createDeposition(self, data):
+        return self.request('POST', self.baseURL, data = json.dumps(data), headers = {"Content-Type": "application/json"})
+
+    def updateDeposition(self, id, data):
+        return self.request('PUT', f"{self.baseURL}/{id}", data = json.dumps(data), headers = {"Content-Type": "application/json"})
+
+    def deleteDeposition(self, id):
+        r = self.request('DELETE', f"{self.baseURL}/{id}")
+        if r.ok:
+            self.removeIndex(id)
+
+        return r
+
+    def publishDeposition(self, id):
+        return self.request('POST', f"{self.baseURL}/{id}/actions/publish")
+
+    def newVersion(self, id):
+        """Create new version of published deposition. Returns requests.Response for the new draft (from links['latest_draft']), or for the failed newversion request."""
+        r = self.request('POST', f"{self.baseURL}/{id}/actions/newversion")
+        if not r.ok:
+            return r
+
+        return self.request('GET', r.json()['links']['latest_draft'])
+
+    def deleteFile(self, id, fileId):
+        """Delete file from deposition (unpublished only), by file id (as per deposition['files'])."""
+        return self.request('DELETE', f"{self.baseURL}/{id}/files/{fileId}")
+
+    def getBucketURL(self, repoInfo):
+        """Get bucket URL for deposition, from repoInfo or from repo if missing."""
+        if 'bucket' in repoInfo.get('links', {}):
+            return repoInfo['links']['bucket']
+
+        r = self.getDeposition(repoInfo['id'])
+        r.raise_for_status()
+
+        return r.json()['links']['bucket']
+
+    def setIndexKeys(self):
+        """Set index lookups by normalised title and DOI. For duplicate titles, the most recently modified deposition is used."""
+        self.titleIndex = {}
+        self.doiIndex = {}
+        for id, item in sorted(self.index['items'].items(), key = lambda kv: kv[1].get('modified', '')):
+            self.titleIndex[normTitle(item['title'])] = id
+            for doi in getDOIs(item):
+                self.doiIndex[doi] = id
+
+    def addIndex(self, item):
+        """Add or update deposition in index, e.g. after creation."""
+        if self.index is None:
+            self.index = {'updated':None, 'items':{}}
+
+        self.index['items'][str(item['id'])] = item
+        self.setIndexKeys()
+
+    def removeIndex(self, id):
+        """Remove deposition from index, e.g. if deleted."""
+        if (self.index is not None) and (self.index['items'].pop(str(id), None) is not None):
+            self.setIndexKeys()
+
+    def updateIndex(self, full = False, maxAge = 60):
+        """
+        Update local index of all depositions.
+
+        On first call the index is read from indexFile if set. Depositions modified since the last update are then fetched (search on modified date, all pages), or all depositions if full = True or no index exists.
+        If the incremental search fails, a full update is run.
+        A full update replaces the index, so depositions deleted outside this client are removed. Incremental updates can't detect deletions, see findDeposition(verify = True).
+
+        Parameters
+        ----------
+        full : bool, optional, default = False
+            Rebuild index from all depositions.
+
+        maxAge : float, optional, default = 60
+            Skip update if index was updated less than maxAge (s) ago, so this can be called per item.
+
+        Returns
+        -------
+        dict
+            Index, {'updated', 'items':{id: deposition}}.
+
+        """
+        if (not full) and (self.indexTime is not None) and (time.monotonic() - self.indexTime < maxAge):
+            return self.index
+
+        if (self.index is None) and (self.indexFile is not None) and Path(self.indexFile).is_file():
+            with open(self.indexFile, 'r') as f:
+                self.index = json.load(f)
+
+        if (self.index is None) or (self.index['updated'] is None):
+            full = True
+
+        items = None
+        if not full:
+            try:
+                items = self.search(f'modified:["{self.index["updated"]}" TO *]')
+            except requests.HTTPError as e:
+                print(f"***Incremental index update failed ({e}), running full update.")
+
+        if items is None:
+            items = self.search('')
+            self.index = {'updated':None, 'items':{}}
+
+        for item in items:
+            self.index['items'][str(item['id'])] = item
+
+        # Set update time from server timestamps
+        modified = [item['modified'] for item in self.index['items'].values() if item.get('modified')]
+        self.index['updated'] = max(modified) if modified else None
+
+        self.setIndexKeys()
+        self.indexTime = time.monotonic()
+
+        if self.indexFile is not None:
+            with open(self.indexFile, 'w') as f:
+                json.dump(self.index, f)
+
+        print(f"Repo index updated: {len(items)} depositions fetched, {len(self.index['items'])} in index.")
+
+        return self.index
+
+    def findDeposition(self, title = None, doi = None, verify = False):
+        """
+        Find deposition in index by DOI or (normalised) title, returns deposition or None. Run updateIndex() first.
+
+        If verify = True, the deposition is fetched from the repo (current links, bucket and state) and the index entry updated.
+        Depositions not found on the repo (404) are removed from the index, and None is returned.
+        Raises requests.HTTPError for other failed requests.
+
+        """
+        if self.index is None:
+            self.updateIndex()
+
+        id = self.doiIndex.get(doi) if doi else None
+        if (id is None) and (title is not None):
+            id = self.titleIndex.get(normTitle(title))
+
+        if id is None:
+            return None
+
+        if not verify:
+            return self.index['items'][id]
+
+        r = self.getDeposition(id)
+        if r.status_code in (404, 410):
+            print(f"***Deposition {id} not found on repo, removed from index.")
+            self.removeIndex(id)
+            return None
+
+        r.raise_for_status()
+        self.addIndex(r.json())
+
+        return r.json()
@@ -0,0 +1,549 @@
+"""
+epsman
+
+Upload engine for repo files, streaming PUTs to Zenodo deposition bucket.
+
+Can be used locally (_repo.uploadRepoFiles()) or on remote (remoteUpload.py), only requires standard libs + requests.
+
+Files are streamed to the bucket URL (repoInfo['links']['bucket']) in fixed-size chunks, with bytes sent and MD5 tracked inline.
+Failed transfers (connection errors, 5xx and 429 responses, or checksum mismatch) are retried with backoff. Bucket PUTs overwrite the file, so retries restart the transfer.
+This replaces the legacy multipart form POST to the deposition files endpoint, which builds the full body and may time out for large archives.
+
+For testing, any bucket URL (e.g. local stub server) can be passed to uploadFile()/uploadFiles().
+
+Multiple datasets can be uploaded with scheduleUploads(), which runs a bounded number of concurrent transfers, with request rate limiting (token bucket) and progress saved to file, so interrupted runs can be resumed.
+
+Files already in the deposition are checked by MD5 before upload (see syncFile()): files with matching checksums are skipped, and files that differ are replaced.
+
+19/10/26    Upload progress results now include bucketURL and file mtime, and are only used to skip files for the same bucket and unchanged file, see isUploaded(). Added clearProgress().
+
+18/10/26    Added checksum comparison with existing deposition files, syncFile(), files already on the repo are skipped.
+            Added concurrent upload scheduler, scheduleUploads(), with rate limiting and persistent progress.
+            v1
+
+"""
+
+import os
+import time
+import json
+import random
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+# Zenodo API
+depositURL = 'https://zenodo.org/api/deposit/depositions'
+
+# Retry for these status codes
+retryStatus = [429, 500, 502, 503, 504]
+
+# Options passed from uploadFile() kwargs to getBucketFiles()
+listKwargs = ['retries', 'backoff', 'maxWait', 'timeout']
+
+# MD5 cache, {(file, size, mtime): md5}
+md5Cache = {}
+
+# Default API rate limit (requests/s) and burst size, Zenodo allows 100 requests/min.
+apiRate = 100/60
+apiBurst = 5
+
+
+class TokenBucket():
+    """
+    Token bucket rate limiter, thread safe.
+
+    Tokens are added at rate (per second) up to burst, and acquire() waits for a token.
+
+    """
+
+    def __init__(self, rate = apiRate, burst = apiBurst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class UploadStream():
+    """
+    File-like wrapper for streaming file in fixed-size chunks, with bytes sent and MD5 tracked.
+
+    Length is set from file size, so requests sets Content-Length (no chunked transfer encoding, as required by Zenodo bucket API).
+    Optional progress callback is called per chunk, as progress(fileIn, sent, total).
+
+    """
+
+    def __init__(self, f, fileIn, chunkSize = 2**22, progress = None):
+        self.f = f
+        self.fileIn = fileIn
+        self.chunkSize = chunkSize
+        self.progress = progress
+        self.total = os.fstat(f.fileno()).st_size
+        self.sent = 0
+        self.md5 = hashlib.md5()
+
+    def __len__(self):
+        return self.total
+
+    def read(self, size = -1):
+        # Always read chunkSize, http.client sends whatever is returned.
+        block = self.f.read(self.chunkSize)
+        self.md5.update(block)
+        self.sent += len(block)
+
+        if self.progress is not None:
+            self.progress(self.fileIn, self.sent, self.total)
+
+        return block
+
+
+def retryWait(attempt, backoff = 1, maxWait = 300, r = None):
+    """Wait (s) before retry, backoff x 2**attempt plus random jitter up to backoff, max maxWait. For 429 responses Retry-After is used if set."""
+    if (r is not None) and (r.status_code == 429) and r.headers.get('Retry-After', '').isdigit():
+        return min(int(r.headers['Retry-After']), maxWait)
+
+    return min(backoff * 2**attempt + random.uniform(0, backoff), maxWait)
+
+
+def getBucketURL(repoInfo, token, session = None):
+    """Get bucket URL for deposition, from repoInfo or from repo if missing."""
+    if 'bucket' in repoInfo.get('links', {}):
+        return repoInfo['links']['bucket']
+
+    session = session or requests
+    r = session.get(f"{depositURL}/{repoInfo['id']}", params = {'access_token':token})
+    r.raise_for_status()
+
+    return r.json()['links']['bucket']
+
+
+def uploadFile(bucketURL, fileIn, token = None, name = None, session = None, chunkSize = 2**22, retries = 3, backoff = 1, maxWait = 300, timeout = 60, progress = None, limiter = None):
+    """
+    Upload single file to bucket with streaming PUT, retry on failure.
+
+    Parameters
+    ----------
+    bucketURL : str
+        Deposition bucket URL, see getBucketURL().
+
+    fileIn : str or Path
+        File to upload.
+
+    token : str, optional, default = None
+        Repo access token, passed as access_token param.
+
+    name : str, optional, default = None
+        Name on repo, defaults to file name.
+
+    session : requests.Session, optional, default = None
+        Session for connection pooling.
+
+    chunkSize : int, optional, default = 4MB
+        Read size for streaming.
+
+    retries : int, optional, default = 3
+        Number of retries for failed transfers, with exponential backoff, wait backoff x 2**attempt (s, plus random jitter up to backoff, max maxWait) between attempts.
+        For 429 responses, Retry-After is used if set.
+
+    timeout : float, optional, default = 60
+        Connect/read timeout (s), per request. Note this is not a total transfer time limit.
+
+    progress : function, optional, default = None
+        Callback progress(fileIn, sent, total), called per chunk.
+
+    limiter : TokenBucket, optional, default = None
+        Rate limiter, a token is acquired before each request.
+
+    Returns
+    -------
+    dict
+        {'file', 'name', 'ok', 'status', 'size', 'bytesSent', 'attempts', 'time', 'md5', 'response'}.
+        bytesSent includes any failed attempts, response is the repo JSON for the last attempt (or error message).
+
+    """
+    session = session or requests.Session()
+    name = name or Path(fileIn).name
+    params = {'access_token':token} if token is not None else None
+
+    result = {'file':Path(fileIn).as_posix(), 'name':name, 'ok':False, 'status':None, 'size':os.path.getsize(fileIn),
+              'bytesSent':0, 'attempts':0, 'time':None, 'md5':None, 'response':None}
+    start = time.time()
+
+    for attempt in range(retries + 1):
+        result['attempts'] += 1
+        wait = retryWait(attempt, backoff, maxWait)
+
+        if limiter is not None:
+            limiter.acquire()
+
+        with open(fileIn, 'rb') as f:
+            stream = UploadStream(f, fileIn, chunkSize = chunkSize, progress = progress)
+            try:
+                r = session.put(f"{bucketURL}/{name}", data = stream, params = params,
+                                headers = {'Content-Type':'application/octet-stream'}, timeout = timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                r = None
+                result['response'] = f"{type(e).__name__}: {e}"
+
+            result['bytesSent'] += stream.sent
+
+        if r is not None:
+            result['status'] = r.status_code
+            try:
+                result['response'] = r.json()
+            except ValueError:
+                result['response'] = r.text
+
+            if r.ok:
+                # Check size & checksum (Zenodo returns 'md5:<hash>'), retry if mismatched.
+                result['md5'] = stream.md5.hexdigest()
+                checksum = result['response'].get('checksum') if isinstance(result['response'], dict) else None
+                if (stream.sent == result['size']) and (checksum in (None, f"md5:{result['md5']}")):
+                    result['ok'] = True
+                    break
+
+                result['response'] = f"Checksum mismatch: sent {stream.sent} bytes, md5:{result['md5']}, repo {checksum}"
+
+            elif r.status_code not in retryStatus:
+                break
+
+            else:
+                wait = retryWait(attempt, backoff, maxWait, r)
+
+        if attempt < retries:
+            print(f"Upload failed for {name} ({result['status']}), retrying in {round(wait, 1)}s.")
+            time.sleep(wait)
+
+    result['time'] = round(time.time() - start, 1)
+
+    return result
+
+
+def fileMD5(fileIn, chunkSize = 2**22):
+    """MD5 hex digest for file, read in chunks. Results are cached by file, size and modification time, so repeat comparisons don't re-read the file."""
+    stat = os.stat(fileIn)
+    cacheKey = (Path(fileIn).resolve().as_posix(), stat.st_size, stat.st_mtime_ns)
+
+    if cacheKey not in md5Cache:
+        md5 = hashlib.md5()
+        with open(fileIn, 'rb') as f:
+            for block in iter(lambda: f.read(chunkSize), b''):
+                md5.update(block)
+
+        md5Cache[cacheKey] = md5.hexdigest()
+
+    return md5Cache[cacheKey]
+
+
+def getBucketFiles(bucketURL, token = None, session = None, limiter = None, retries = 3, backoff = 1, maxWait = 300, timeout = 60):
+    """
+    Get existing files in deposition bucket.
+
+    Failed requests (connection errors, 5xx and 429 responses) are retried with backoff, as per uploadFile().
+    Raises requests.HTTPError (or ConnectionError/Timeout) if the request still fails.
+
+    Returns
+    -------
+    dict
+        {name: {'md5', 'size'}}, MD5 as hex digest (bucket returns 'md5:<hash>').
+
+    """
+    session = session or requests
+    params = {'access_token':token} if token is not None else None
+
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+
+        try:
+            r = session.get(bucketURL, params = params, timeout = timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            r = None
+
+        if (r is not None) and (r.ok or (r.status_code not in retryStatus) or (attempt == retries)):
+            break
+
+        wait = retryWait(attempt, backoff, maxWait, r)
+        print(f"Bucket listing failed ({r.status_code if r is not None else 'connection error'}), retrying in {round(wait, 1)}s.")
+        time.sleep(wait)
+
+    r.raise_for_status()
+
+    return {item['key']: {'md5':item['checksum'].split(':')[-1] if item.get('checksum') else None, 'size':item.get('size')}
+            for item in r.json().get('contents', [])}
+
+
+def compareFile(fileIn, repoFiles = None, name = None):
+    """
+    Compare local file with existing deposition files (as returned by getBucketFiles()) by MD5.
+
+    Returns dict {'file', 'name', 'size', 'md5', 'repoMD5', 'action'}, with action 'skip' (MD5 match), 'replace' (file differs) or 'upload' (new file).
+    MD5 is only computed if the file exists on the repo.
+
+    """
+    name = name or Path(fileIn).name
+    repoFile = (repoFiles or {}).get(name)
+    comp = {'file':Path(fileIn).as_posix(), 'name':name, 'size':os.path.getsize(fileIn), 'md5':None, 'repoMD5':None, 'action':'upload'}
+
+    if repoFile is not None:
+        comp['md5'] = fileMD5(fileIn)
+        comp['repoMD5'] = repoFile['md5']
+        match = (comp['md5'] == repoFile['md5']) and (repoFile['size'] in (None, comp['size']))
+        comp['action'] = 'skip' if match else 'replace'
+
+    return comp
+
+
+def syncFile(bucketURL, fileIn, repoFiles = None, token = None, name = None, **kwargs):
+    """
+    Upload file to bucket if not already on repo, by MD5 comparison with existing files, see compareFile().
+
+    Parameters
+    ----------
+    repoFiles : dict, optional, default = None
+        Existing files in bucket, as returned by getBucketFiles(). If None, file is uploaded without checking.
+
+    Other params as per uploadFile().
+
+    Returns
+    -------
+    dict
+        Result as per uploadFile(), plus 'action' ('skip', 'replace' or 'upload') and 'repoMD5' (existing checksum, or None).
+        For skipped files 'ok' is True and 'attempts' is 0.
+
+    """
+    comp = compareFile(fileIn, repoFiles = repoFiles, name = name)
+
+    if comp['action'] == 'skip':
+        return {'file':comp['file'], 'name':comp['name'], 'ok':True, 'status':None, 'size':comp['size'],
+                'bytesSent':0, 'attempts':0, 'time':0, 'md5':comp['md5'], 'response':None, 'action':'skip', 'repoMD5':comp['repoMD5']}
+
+    result = uploadFile(bucketURL, fileIn, token = token, name = comp['name'], **kwargs)
+    result['action'] = comp['action']
+    result['repoMD5'] = comp['repoMD5']
+
+    return result
+
+
+def listFailed(fileIn, error):
+    """Result for file not uploaded because the bucket listing failed, as per syncFile()."""
+    return {'file':Path(fileIn).as_posix(), 'name':Path(fileIn).name, 'ok':False, 'status':None, 'size':os.path.getsize(fileIn),
+            'bytesSent':0, 'attempts':0, 'time':0, 'md5':None, 'response':f"Bucket listing failed: {error}", 'action':None, 'repoMD5':None}
+
+
+def uploadFiles(bucketURL, fileList, token = None, session = None, verbose = True, checkExisting = True, **kwargs):
+    """
+    Upload list of files to bucket, see uploadFile() for options.
+
+    If checkExisting = True, files already in the bucket with matching MD5 are skipped, and files that differ are replaced, see syncFile().
+    If the bucket listing fails (after retries), no files are uploaded and the error is set in the results.
+
+    Returns list of results per file, as per syncFile().
+
+    """
+    session = session or requests.Session()
+    listError = None
+    repoFiles = None
+    if checkExisting:
+        try:
+            repoFiles = getBucketFiles(bucketURL, token = token, session = session, **{k:v for k, v in kwargs.items() if k in listKwargs})
+        except requests.RequestException as e:
+            listError = f"{type(e).__name__}: {e}"
+
+    results = []
+    for fileIn in fileList:
+        if listError is not None:
+            result = listFailed(fileIn, listError)
+        else:
+            result = syncFile(bucketURL, fileIn, repoFiles = repoFiles, token = token, session = session, **kwargs)
+
+        if result['action'] == 'skip':
+            print(f"File already on repo (MD5 match), skipping: {fileIn}")
+        elif result['ok']:
+            print(f"File upload OK: {fileIn} ({result['bytesSent']} bytes, {result['time']}s)")
+        else:
+            print(f"File upload failed: {fileIn}, status {result['status']}")
+            if verbose:
+                print(result['response'])
+
+        results.append(result)
+
+    return results
+
+
+def readProgress(progressFile):
+    """Read upload progress file, {key: {file: result}}, returns empty dict if missing."""
+    if (progressFile is None) or not Path(progressFile).is_file():
+        return {}
+
+    with open(progressFile, 'r') as f:
+        return json.load(f)
+
+
+def writeProgress(progressFile, progress):
+    """Write upload progress file, via temporary file so an interrupted write doesn't corrupt existing progress."""
+    tmpFile = Path(progressFile).with_suffix('.tmp')
+    with open(tmpFile, 'w') as f:
+        json.dump(progress, f, indent=1)
+
+    os.replace(tmpFile, progressFile)
+
+
+def clearProgress(progressFile, key):
+    """Remove progress results for dataset key from upload progress file (if present), so all files are checked and uploaded on the next run. Returns number of results removed."""
+    progress = readProgress(progressFile)
+    removed = progress.pop(str(key), {})
+    if removed:
+        writeProgress(progressFile, progress)
+
+    return len(removed)
+
+
+def isUploaded(done, bucketURL, fileIn):
+    """
+    Check progress result for file, True if the file was uploaded OK to bucketURL and is unchanged since (same size and modification time).
+
+    Results from a different bucket (e.g. a new version draft, see _repo.newRepoVersion()), or for a rebuilt file, are not matched.
+    """
+    if not done or not done['ok']:
+        return False
+
+    stat = os.stat(fileIn)
+    return (done.get('bucketURL') == bucketURL) and (done['size'] == stat.st_size) and (done.get('mtime_ns') == stat.st_mtime_ns)
+
+
+def scheduleUploads(jobs, token = None, workers = 4, rate = apiRate, burst = apiBurst, progressFile = None, verbose = True, checkExisting = True, **kwargs):
+    """
+    Upload files for multiple datasets with concurrent transfers, rate limiting and persistent progress.
+
+    Parameters
+    ----------
+    jobs : dict
+        Uploads per dataset, {key: [bucketURL, fileList]}.
+
+    token : str, optional, default = None
+        Repo access token.
+
+    workers : int, optional, default = 4
+        Maximum number of concurrent transfers (across all datasets).
+
+    rate, burst : float, int, optional, default = apiRate, apiBurst
+        Request rate limit (requests/s) and burst size, shared by all transfers (see TokenBucket).
+
+    progressFile : str or Path, optional, default = None
+        JSON file for upload progress, {key: {file: result}}, updated after each file.
+        If the file exists, files already uploaded OK to the same bucket (with unchanged size and modification time) are skipped, so an interrupted run can be resumed, see isUploaded().
+
+    checkExisting : bool, optional, default = True
+        Check files against existing deposition files (one bucket request per dataset), and skip files with matching MD5, see syncFile().
+        Bucket listings and MD5s are run by the worker threads, listings are retried as per uploadFile().
+        If the listing for a dataset still fails, the error is recorded for its files (not uploaded), and other datasets continue.
+
+    **kwargs
+        Passed to uploadFile(), e.g. retries, backoff, chunkSize.
+
+    Returns
+    -------
+    dict
+        Results per dataset and file, {key: {file: result}}, as per syncFile().
+
+    """
+    progress = readProgress(progressFile)
+    limiter = TokenBucket(rate = rate, burst = burst)
+    lock = threading.Lock()
+    local = threading.local()
+
+    # Set file list, skip files already uploaded.
+    tasks = []
+    for key, (bucketURL, fileList) in jobs.items():
+        key = str(key)  # For JSON
+        progress.setdefault(key, {})
+
+        for fileIn in fileList:
+            if isUploaded(progress[key].get(Path(fileIn).as_posix()), bucketURL, fileIn):
+                if verbose:
+                    print(f"Skipping {fileIn}, already uploaded.")
+                continue
+
+            tasks.append([key, bucketURL, fileIn])
+
+    # Largest files first, to keep all workers busy at the end of the run.
+    tasks.sort(key = lambda task: os.path.getsize(task[2]), reverse = True)
+    totalBytes = sum(os.path.getsize(task[2]) for task in tasks)
+    print(f"***Uploading {len(tasks)} files ({round(totalBytes/2**20, 1)} MB) for {len(jobs)} datasets, {workers} workers.")
+
+    # Bucket listings, one per dataset, set by the first worker to need it.
+    repoFiles = {}
+    listLocks = {str(key): threading.Lock() for key in jobs}
+
+    def getRepoFiles(key, bucketURL):
+        with listLocks[key]:
+            if key not in repoFiles:
+                try:
+                    repoFiles[key] = getBucketFiles(bucketURL, token = token, session = local.session, limiter = limiter,
+                                                    **{k:v for k, v in kwargs.items() if k in listKwargs})
+                except requests.RequestException as e:
+                    repoFiles[key] = f"{type(e).__name__}: {e}"
+
+        return repoFiles[key]
+
+    def runTask(task):
+        # One session (connection pool) per worker thread.
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+
+        key, bucketURL, fileIn = task
+        mtime = os.stat(fileIn).st_mtime_ns  # Set before upload, so a file changed during upload isn't skipped on resume.
+        existing = getRepoFiles(key, bucketURL) if checkExisting else None
+        if isinstance(existing, str):
+            result = listFailed(fileIn, existing)
+        else:
+            result = syncFile(bucketURL, fileIn, repoFiles = existing, token = token, session = local.session, limiter = limiter, **kwargs)
+
+        result.update({'bucketURL':bucketURL, 'mtime_ns':mtime})
+        return key, result
+
+    start = time.time()
+    sentBytes = 0
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        futures = [pool.submit(runTask, task) for task in tasks]
+
+        for n, future in enumerate(as_completed(futures)):
+            key, result = future.result()
+
+            with lock:
+                progress[key][result['file']] = result
+                if progressFile is not None:
+                    writeProgress(progressFile, progress)
+
+            sentBytes += result['size'] if result['ok'] and (result['action'] != 'skip') else 0
+            status = ('skipped, MD5 match' if result['action'] == 'skip' else 'OK') if result['ok'] else f"failed, status {result['status']}"
+            print(f"[{n+1}/{len(tasks)}] {result['file']}: {status}, {result['attempts']} attempts, {result['time']}s")
+            if verbose and not result['ok']:
+                print(result['response'])
+
+    elapsed = time.time() - start
+    nFailed = sum(1 for key in progress for result in progress[key].values() if not result['ok'])
+    print(f"\n***Uploads completed: {round(sentBytes/2**20, 1)} MB in {round(elapsed, 1)}s ({round(sentBytes/2**20/elapsed, 2) if elapsed else 0} MB/s), {nFailed} failed.")
+
+    return progress
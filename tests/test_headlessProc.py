@@ -0,0 +1,60 @@
+"""
+Tests for proc/headlessProc.py template code extraction.
+
+Code extracted from every bundled template must compile, with and without IPython available.
+
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, Path(__file__).parents[1].joinpath('proc').as_posix())
+import headlessProc
+
+templates = sorted(Path(__file__).parents[1].joinpath('templates').glob('*.ipynb'))
+
+
+@pytest.mark.parametrize('template', templates, ids = [item.name for item in templates])
+def test_templateCompiles(template):
+    compile(headlessProc.getTemplateCode(template), template.as_posix(), 'exec')
+
+
+@pytest.mark.parametrize('template', templates, ids = [item.name for item in templates])
+def test_templateCompilesNoIPython(template, monkeypatch):
+    monkeypatch.setattr(headlessProc, 'TransformerManager', None)
+    compile(headlessProc.getTemplateCode(template), template.as_posix(), 'exec')
+
+
+def test_transformLine():
+    assert headlessProc.transformLine('    host = !hostname') == "    host = get_ipython().getoutput('hostname')"
+    assert headlessProc.transformLine('x = %pwd') == "x = get_ipython().run_line_magic('pwd', '')"
+    assert headlessProc.transformLine('!ls -l') == "get_ipython().system('ls -l')"
+    assert headlessProc.transformLine('%matplotlib inline') == "get_ipython().run_line_magic('matplotlib', 'inline')"
+    assert headlessProc.transformLine('a != b') == 'a != b'
+
+
+def test_shellShim():
+    ns = {}
+    exec(headlessProc.getTemplateCode(templates[0]).split('\n\n\n')[0] + "\nout = get_ipython().getoutput('echo hi')\n", ns)
+    assert ns['out'] == ['hi']
+
+
+def test_runHeadlessImportError(tmp_path, monkeypatch, capsys):
+    # Missing worker module aborts before the pool is started.
+    monkeypatch.setattr(headlessProc, 'workerModules', ['matplotlib', 'notAModule_epsman'])
+    tmp_path.joinpath('params.txt').write_text("DATAFILE='job.out'\n")
+
+    assert headlessProc.runHeadless(tmp_path, 1, 'params.txt', templates[0]) == []
+    assert 'notAModule_epsman' in capsys.readouterr().out
+
+
+def test_initWorkerError(monkeypatch):
+    # Init errors are reported by runJob, not raised in the initializer.
+    monkeypatch.setattr(headlessProc, 'workerModules', ['notAModule_epsman'])
+    monkeypatch.setattr(headlessProc, 'initError', None)
+    headlessProc.initWorker()
+
+    n, params, status, runTime, figs = headlessProc.runJob([0, {'DATAFILE':'job.out'}, '', 'template.ipynb', 'png'])
+    assert status.startswith('failed: worker init: ModuleNotFoundError')
@@ -0,0 +1,62 @@
+"""
+Tests for proc/nbSlim.py, slim and restore round trip.
+
+"""
+
+import sys
+import base64
+from pathlib import Path
+
+import pytest
+
+nbformat = pytest.importorskip('nbformat')
+
+sys.path.insert(0, Path(__file__).parents[1].joinpath('proc').as_posix())
+import nbSlim
+
+
+@pytest.fixture
+def notebook(tmp_path):
+    # Output with multiple image types and existing markdown, plus single image output.
+    png = base64.b64encode(bytes(range(256))*100).decode()
+    svg = '<svg xmlns="http://www.w3.org/2000/svg">' + ' '*30000 + '</svg>'
+    nb = nbformat.v4.new_notebook()
+    nb.cells = [nbformat.v4.new_code_cell('plot()', outputs = [
+                    nbformat.v4.new_output('display_data', data = {'image/png':png, 'image/svg+xml':svg, 'text/markdown':'**Figure 1**', 'text/plain':'<Figure>'}),
+                    nbformat.v4.new_output('display_data', data = {'image/png':png, 'text/plain':'<Figure>'})])]
+
+    fileIn = tmp_path/'test.ipynb'
+    nbformat.write(nb, fileIn.as_posix())
+    return fileIn
+
+
+def test_slimRestore(notebook):
+    original = nbformat.read(notebook.as_posix(), as_version = 4)
+
+    assert nbSlim.slimNotebook(notebook, minSize = 1000)[3] == 3
+    slim = nbformat.read(notebook.as_posix(), as_version = 4)
+    output = slim.cells[0].outputs[0]
+    assert [fig['mime'] for fig in output.metadata['epsman']['figs']] == ['image/png', 'image/svg+xml']
+    assert output.data['text/markdown'].startswith('**Figure 1**')
+    assert output.data['text/markdown'].count('](_nbfigs/') == 2
+    assert 'image/png' not in output.data
+
+    assert nbSlim.restoreNotebook(notebook)[1] == 3
+    restored = nbformat.read(notebook.as_posix(), as_version = 4)
+    for out, outOrig in zip(restored.cells[0].outputs, original.cells[0].outputs):
+        assert out.data == outOrig.data
+        assert 'epsman' not in out.metadata
+
+
+def test_restoreSingleFigInfo(notebook):
+    # Metadata from earlier version, single {'figStore', 'mime'} per output.
+    nbSlim.slimNotebook(notebook, minSize = 1000)
+    nb = nbformat.read(notebook.as_posix(), as_version = 4)
+    output = nb.cells[0].outputs[1]
+    output.metadata['epsman'] = output.metadata['epsman']['figs'][0]
+    nbformat.write(nb, notebook.as_posix())
+
+    nbSlim.restoreNotebook(notebook)
+    restored = nbformat.read(notebook.as_posix(), as_version = 4)
+    assert 'image/png' in restored.cells[0].outputs[1].data
+    assert 'text/markdown' not in restored.cells[0].outputs[1].data
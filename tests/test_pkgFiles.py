@@ -0,0 +1,134 @@
+"""
+Tests for repo/pkgFiles.py, file lists and archive updates on temp dirs.
+
+"""
+
+import sys
+import json
+import hashlib
+import zipfile
+import subprocess
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, Path(__file__).parents[1].joinpath('repo').as_posix())
+import pkgFiles
+
+
+@pytest.fixture
+def pkgDir(tmp_path):
+    # Job dir with moved files for job, a stray file for the job (not in manifest), and files for another job.
+    jobDir = tmp_path/'mol'/'orb1'
+    jobDir.mkdir(parents = True)
+    for name in ['job_A.out', 'job_B.out', 'job_stray.out', 'other_A.out']:
+        jobDir.joinpath(name).write_text(name)
+
+    manifest = {'job':'job', 'jobDir':'/remote/mol/orb1', 'files':[{'name':'job_A.out', 'size':9}, {'name':'job_B.out', 'size':9}, {'name':'job_C.out', 'size':9}]}
+    jobDir.joinpath('job_manifest.json').write_text(json.dumps(manifest))
+
+    # Archive manifest, ignored
+    tmp_path.joinpath('arch_manifest.json').write_text(json.dumps({'archive':'arch.zip', 'members':{}}))
+    return tmp_path
+
+
+def test_manifestFilesPkg(pkgDir):
+    jobDir = (pkgDir/'mol'/'orb1').as_posix()
+    fileList = pkgFiles.manifestFilesPkg(pkgFiles.scanFilesPkg(pkgDir))
+
+    names = sorted(Path(item).name for item in fileList if Path(item).parent.as_posix() == jobDir)
+    assert names == ['job_A.out', 'job_B.out', 'job_manifest.json', 'other_A.out']
+    assert (pkgDir/'arch_manifest.json').as_posix() in fileList
+
+
+def test_indexFilesPkgManifest(pkgDir):
+    withManifest = pkgFiles.indexFilesPkg(pkgDir, ['orb1'])['orb1']
+    scanOnly = pkgFiles.indexFilesPkg(pkgDir, ['orb1'], useManifest = False)['orb1']
+
+    assert not any('job_stray' in item for item in withManifest)
+    assert any('job_stray' in item for item in scanOnly)
+
+
+def test_cliFormats(tmp_path):
+    # Full dir dry run, archive names set per notebook from formats file.
+    pkgDir = tmp_path/'nbProc'
+    pkgDir.mkdir()
+    for name in ['mol_A_1.0-2.0eV_orb1', 'mol_B_1.0-2.0eV_orb1']:
+        pkgDir.joinpath(name + '.ipynb').write_text('{}')
+
+    formatsFile = tmp_path/'formats.json'
+    formatsFile.write_text(json.dumps({'mol_B_1.0-2.0eV_orb1':'tar.zst'}))
+
+    result = subprocess.run([sys.executable, Path(pkgFiles.__file__).as_posix(), pkgDir.as_posix(), 'True', (tmp_path/'pkg').as_posix(), '2016', f"formats={formatsFile.as_posix()}"],
+                            capture_output = True, text = True, check = True)
+
+    archNames = sorted(Path(line.split('Arch: ')[1]).name for line in result.stdout.splitlines() if line.startswith('Arch: '))
+    assert archNames == ['mol_A_1.0-2.0eV_orb1.zip', 'mol_B_1.0-2.0eV_orb1.tar.zst']
+
+
+@pytest.mark.parametrize('pkgFormat', ['zip', 'tar.zst'])
+def test_checkArch(tmp_path, pkgFormat):
+    if pkgFormat == 'tar.zst':
+        pytest.importorskip('zstandard')
+
+    srcDir = tmp_path/'src'
+    srcDir.mkdir()
+    fileList = []
+    for n in range(3):
+        fileIn = srcDir/f"file{n}.dat"
+        fileIn.write_bytes(bytes([n])*1000)
+        fileList.append(fileIn.as_posix())
+
+    archName = tmp_path/('arch' + pkgFiles.pkgFormats[pkgFormat])
+    pkgFiles.buildPkg(archName, fileList, srcDir)
+
+    infoList, nameList = pkgFiles.checkArch(archName, full = True)
+    assert sorted(nameList) == ['file0.dat', 'file1.dat', 'file2.dat']
+    assert [info.file_size for info in infoList] == [1000]*3
+
+
+@pytest.fixture
+def srcFiles(tmp_path):
+    srcDir = tmp_path/'src'
+    srcDir.mkdir()
+    for n in range(3):
+        srcDir.joinpath(f"file{n}.out").write_bytes(bytes([n])*5000)
+
+    return srcDir
+
+
+def checkArchive(archName, srcDir):
+    """Check archive with testzip(), and manifest SHA-256 against source files."""
+    with zipfile.ZipFile(archName) as pkgZip:
+        assert pkgZip.testzip() is None
+        names = sorted(pkgZip.namelist())
+
+    members = pkgFiles.readManifest(archName)['members']
+    assert sorted(members) == names
+    for name, entry in members.items():
+        assert entry['sha256'] == hashlib.sha256(srcDir.joinpath(name).read_bytes()).hexdigest()
+
+    return names
+
+
+@pytest.mark.parametrize('rawCopy', [True, False])
+def test_updatePkg(tmp_path, srcFiles, monkeypatch, rawCopy):
+    if not rawCopy:
+        # zipfile internals missing, members are recompressed.
+        monkeypatch.delattr(zipfile, '_strip_extra', raising = False)
+
+    archName = tmp_path/'arch.zip'
+    fileList = sorted(srcFiles.glob('*.out'))
+    assert pkgFiles.buildPkg(archName, fileList[:2], srcFiles)
+
+    # Skip unchanged
+    members, changes = pkgFiles.updatePkg(archName, fileList[:2], srcFiles, members = pkgFiles.readManifest(archName)['members'])
+    assert len(changes['skip']) == 2 and not changes['replace'] and not changes['add']
+
+    # Replace changed file (other members copied), and append new file
+    fileList[0].write_bytes(b'changed'*1000)
+    assert pkgFiles.buildPkg(archName, fileList, srcFiles, archMode = 'a')
+    assert checkArchive(archName, srcFiles) == ['file0.out', 'file1.out', 'file2.out']
+
+    with zipfile.ZipFile(archName) as pkgZip:
+        assert pkgZip.read('file0.out') == b'changed'*1000
@@ -0,0 +1,43 @@
+"""
+Tests for repo/pkgRemoteNohup.sh argument forwarding.
+
+All trailing options (workers, policy, maxSize, refresh, format, formats) must reach pkgFiles.py.
+
+"""
+
+import sys
+import time
+import subprocess
+from pathlib import Path
+
+import pytest
+
+wrapper = Path(__file__).parents[1].joinpath('repo', 'pkgRemoteNohup.sh')
+
+
+def runWrapper(tmp_path, opts):
+    """Run wrapper with stub script which writes its args to the log file, returns args."""
+    stub = tmp_path/'stub.py'
+    stub.write_text("import sys, json\nprint(json.dumps(sys.argv[1:]))\n")
+    log = tmp_path/'log.txt'
+
+    subprocess.run(['bash', wrapper.as_posix(), stub.as_posix(), 'nbProcDir', 'False', 'pkgDir', 'schema', log.as_posix(), *opts], check = True)
+
+    for n in range(50):
+        if log.is_file() and log.read_text().strip():
+            break
+        time.sleep(0.1)
+
+    return log.read_text().strip().splitlines()[-1]
+
+
+@pytest.mark.skipif(sys.platform.startswith('win'), reason = 'bash wrapper')
+def test_allOptionsForwarded(tmp_path):
+    opts = ['workers=4', 'policy=policy.json', 'maxSize=90', 'refresh=True', 'format=tar.zst', 'formats=formats.json']
+    assert runWrapper(tmp_path, opts) == '["nbProcDir", "False", "pkgDir", "schema", ' + ', '.join(f'"{item}"' for item in opts) + ']'
+
+
+@pytest.mark.skipif(sys.platform.startswith('win'), reason = 'bash wrapper')
+def test_optionsWithoutWorkers(tmp_path):
+    opts = ['maxSize=90', 'refresh=False', 'format=zip']
+    assert runWrapper(tmp_path, opts) == '["nbProcDir", "False", "pkgDir", "schema", ' + ', '.join(f'"{item}"' for item in opts) + ']'
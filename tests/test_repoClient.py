@@ -0,0 +1,125 @@
+"""
+Tests for repo/repoClient.py, against a local stub HTTP server (depositions API).
+
+"""
+
+import sys
+import json
+import threading
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, Path(__file__).parents[1].joinpath('repo').as_posix())
+from repoClient import RepoClient
+
+
+class StubDepositions(BaseHTTPRequestHandler):
+    """Stub depositions list, page size capped at server.maxSize, with Link headers if server.links = True, and single deposition by id."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        # Single deposition
+        if not url.path.endswith('/depositions'):
+            self.server.requests.append(self.path)
+            id = int(url.path.split('/')[-1])
+            items = [item for item in self.server.items if item['id'] == id]
+            body = json.dumps(items[0] if items else {'status':404}).encode()
+            self.send_response(200 if items else 404)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        page = int(query.get('page', ['1'])[0])
+        size = min(int(query.get('size', ['10'])[0]), self.server.maxSize)
+        self.server.requests.append(self.path)
+
+        items = self.server.items[(page - 1)*size:page*size]
+        body = json.dumps(items).encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.server.links:
+            links = [f'<http://127.0.0.1:{self.server.server_port}{url.path}?page={page}&size={size}>; rel="self"']
+            if page*size < len(self.server.items):
+                links.append(f'<http://127.0.0.1:{self.server.server_port}{url.path}?page={page + 1}&size={size}>; rel="next"')
+            self.send_header('Link', ', '.join(links))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def api():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubDepositions)
+    server.items = [{'id':n, 'title':f"ePSproc: item {n}", 'modified':f"2020-01-{n+1:02d}"} for n in range(25)]
+    server.maxSize = 10
+    server.links = True
+    server.requests = []
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+
+    server.url = f"http://127.0.0.1:{server.server_port}/api/deposit/depositions"
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_searchLinks(api):
+    # Page size capped by server below requested size, all pages followed via Link header.
+    client = RepoClient('test', baseURL = api.url)
+    items = client.search('', size = 100)
+
+    assert [item['id'] for item in items] == list(range(25))
+    assert len(api.requests) == 3
+
+
+def test_searchNoLinks(api):
+    api.links = False
+    client = RepoClient('test', baseURL = api.url)
+    items = client.search('', size = 100)
+
+    assert [item['id'] for item in items] == list(range(25))
+
+
+def test_index(api, tmp_path):
+    client = RepoClient('test', baseURL = api.url, indexFile = tmp_path/'index.json', cacheTime = 0)
+    client.updateIndex()
+
+    assert client.findDeposition(title = 'Item  3')['id'] == 3
+    assert client.findDeposition(title = 'missing') is None
+    assert (tmp_path/'index.json').is_file()
+
+
+def test_indexVerify(api):
+    client = RepoClient('test', baseURL = api.url, cacheTime = 0)
+    client.updateIndex()
+
+    # Current record from repo
+    api.items[3]['state'] = 'done'
+    assert client.findDeposition(title = 'item 3', verify = True)['state'] == 'done'
+
+    # Deleted outside client, removed from index on verify
+    del api.items[3]
+    assert client.findDeposition(title = 'item 3', verify = True) is None
+    assert '3' not in client.index['items']
+
+
+def test_indexFullPrune(api):
+    client = RepoClient('test', baseURL = api.url, cacheTime = 0)
+    client.updateIndex()
+
+    del api.items[5]
+    client.updateIndex(full = True)
+    assert client.findDeposition(title = 'item 5') is None
+    assert len(client.index['items']) == 24
@@ -0,0 +1,194 @@
+"""
+Tests for repo/repoUpload.py, against a local stub HTTP server (deposition bucket).
+
+"""
+
+import os
+import sys
+import json
+import hashlib
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, Path(__file__).parents[1].joinpath('repo').as_posix())
+import repoUpload
+
+
+class StubBucket(BaseHTTPRequestHandler):
+    """
+    Stub bucket, PUT stores file and returns checksum, GET lists files.
+
+    Set server.failures to a list of status codes to return for the next requests, and server.badChecksum = True to return a wrong checksum.
+
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append(['GET', self.path])
+        if self.server.failures:
+            return self.reply(self.server.failures.pop(0), {'message':'stub error'})
+
+        self.reply(200, {'contents':[{'key':name, 'size':len(data), 'checksum':'md5:' + hashlib.md5(data).hexdigest()}
+                                     for name, data in self.server.files.items()]})
+
+    def do_PUT(self):
+        name = self.path.split('?')[0].split('/')[-1]
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append(['PUT', self.path])
+
+        if self.server.failures:
+            return self.reply(self.server.failures.pop(0), {'message':'stub error'})
+
+        self.server.files[name] = data
+        md5 = hashlib.md5(b'bad' if self.server.badChecksum else data).hexdigest()
+        self.reply(201, {'key':name, 'size':len(data), 'checksum':f"md5:{md5}"})
+
+
+def startBucket():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubBucket)
+    server.files = {}
+    server.failures = []
+    server.badChecksum = False
+    server.requests = []
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+
+    server.url = f"http://127.0.0.1:{server.server_port}/files/bucket-id"
+    return server
+
+
+def stopBucket(server):
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def bucket():
+    server = startBucket()
+    yield server
+    stopBucket(server)
+
+
+@pytest.fixture
+def bucket2():
+    server = startBucket()
+    yield server
+    stopBucket(server)
+
+
+@pytest.fixture
+def dataFile(tmp_path):
+    fileIn = tmp_path/'data.zip'
+    fileIn.write_bytes(bytes(range(256))*1000)
+    return fileIn
+
+
+def test_uploadOK(bucket, dataFile):
+    result = repoUpload.uploadFile(bucket.url, dataFile, token = 'test', chunkSize = 2**12)
+
+    assert result['ok']
+    assert result['status'] == 201
+    assert result['attempts'] == 1
+    assert result['bytesSent'] == dataFile.stat().st_size
+    assert result['md5'] == hashlib.md5(dataFile.read_bytes()).hexdigest()
+    assert bucket.files['data.zip'] == dataFile.read_bytes()
+    assert 'access_token=test' in bucket.requests[0][1]
+
+
+def test_uploadRetry503(bucket, dataFile):
+    bucket.failures = [503]
+    result = repoUpload.uploadFile(bucket.url, dataFile, retries = 2, backoff = 0.01)
+
+    assert result['ok']
+    assert result['attempts'] == 2
+    assert result['bytesSent'] == 2*dataFile.stat().st_size
+    assert bucket.files['data.zip'] == dataFile.read_bytes()
+
+
+def test_uploadNoRetry400(bucket, dataFile):
+    bucket.failures = [400]
+    result = repoUpload.uploadFile(bucket.url, dataFile, retries = 2, backoff = 0.01)
+
+    assert not result['ok']
+    assert result['status'] == 400
+    assert result['attempts'] == 1
+
+
+def test_uploadChecksumMismatch(bucket, dataFile):
+    bucket.badChecksum = True
+    result = repoUpload.uploadFile(bucket.url, dataFile, retries = 1, backoff = 0.01)
+
+    assert not result['ok']
+    assert result['attempts'] == 2
+    assert 'Checksum mismatch' in result['response']
+
+
+def test_uploadFilesSkip(bucket, dataFile, tmp_path):
+    newFile = tmp_path/'new.txt'
+    newFile.write_bytes(b'new')
+    bucket.files['data.zip'] = dataFile.read_bytes()
+
+    results = repoUpload.uploadFiles(bucket.url, [dataFile, newFile])
+
+    assert [result['action'] for result in results] == ['skip', 'upload']
+    assert all(result['ok'] for result in results)
+    assert [method for method, path in bucket.requests] == ['GET', 'PUT']
+
+
+def test_bucketListingRetry(bucket, dataFile):
+    bucket.files['data.zip'] = b'old'
+    bucket.failures = [429, 503]
+    repoFiles = repoUpload.getBucketFiles(bucket.url, retries = 2, backoff = 0.01)
+
+    assert 'data.zip' in repoFiles
+    assert [method for method, path in bucket.requests] == ['GET', 'GET', 'GET']
+
+
+def test_scheduleListingFailure(bucket, bucket2, dataFile, tmp_path):
+    # Listing fails for one dataset, other dataset is uploaded and progress is saved.
+    bucket.failures = [500, 500]
+    progressFile = tmp_path/'progress.json'
+    progress = repoUpload.scheduleUploads({1:[bucket.url, [dataFile]], 2:[bucket2.url, [dataFile]]}, workers = 2, progressFile = progressFile,
+                                          retries = 1, backoff = 0.01)
+
+    assert not progress['1'][dataFile.as_posix()]['ok']
+    assert 'Bucket listing failed' in progress['1'][dataFile.as_posix()]['response']
+    assert progress['2'][dataFile.as_posix()]['ok']
+    assert bucket2.files['data.zip'] == dataFile.read_bytes()
+    assert 'data.zip' not in bucket.files
+    assert progressFile.is_file()
+
+
+def test_scheduleResume(bucket, bucket2, dataFile, tmp_path):
+    # Rerun skips files uploaded to the same bucket, but uploads for a new bucket or a rebuilt file.
+    progressFile = tmp_path/'progress.json'
+    repoUpload.scheduleUploads({1:[bucket.url, [dataFile]]}, progressFile = progressFile, checkExisting = False)
+    repoUpload.scheduleUploads({1:[bucket.url, [dataFile]]}, progressFile = progressFile, checkExisting = False)
+    assert [method for method, path in bucket.requests] == ['PUT']
+
+    repoUpload.scheduleUploads({1:[bucket2.url, [dataFile]]}, progressFile = progressFile, checkExisting = False)
+    assert bucket2.files['data.zip'] == dataFile.read_bytes()
+
+    # Same size, new content and mtime.
+    stat = dataFile.stat()
+    dataFile.write_bytes(bytes(reversed(range(256)))*1000)
+    os.utime(dataFile, ns = (stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    progress = repoUpload.scheduleUploads({1:[bucket2.url, [dataFile]]}, progressFile = progressFile, checkExisting = False)
+    assert bucket2.files['data.zip'] == dataFile.read_bytes()
+    assert progress['1'][dataFile.as_posix()]['mtime_ns'] == dataFile.stat().st_mtime_ns
+
+    assert repoUpload.clearProgress(progressFile, 1) == 1
+    assert repoUpload.readProgress(progressFile) == {}
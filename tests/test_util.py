@@ -0,0 +1,79 @@
+"""
+Tests for _util.getFiles(), with a stub connection running remote commands locally.
+
+"""
+
+import io
+import sys
+import subprocess
+import importlib.util
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+# Load module directly, package import requires full deps.
+spec = importlib.util.spec_from_file_location('epsmanUtil', Path(__file__).parents[1].joinpath('_util.py'))
+util = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(util)
+
+
+class StubChannel():
+    """Stub SSH channel, runs command locally and returns stdout from recv()."""
+    def exec_command(self, cmd):
+        self.out = io.BytesIO(subprocess.run(cmd, shell = True, capture_output = True).stdout)
+
+    def recv(self, n):
+        return self.out.read(n)
+
+    def close(self):
+        pass
+
+
+class StubConnection():
+    """Stub Fabric connection, run() executes locally, compressed pulls only (no SFTP)."""
+    def __init__(self):
+        transport = SimpleNamespace(open_session = StubChannel)
+        self.client = SimpleNamespace(get_transport = lambda: transport)
+
+    def open(self):
+        pass
+
+    def run(self, cmd, warn = False, hide = False):
+        result = subprocess.run(cmd, shell = True, capture_output = True, text = True)
+        return SimpleNamespace(stdout = result.stdout, ok = (result.returncode == 0))
+
+
+@pytest.fixture
+def job():
+    return SimpleNamespace(c = StubConnection())
+
+
+def test_getFilesDuplicateTarget(job, tmp_path):
+    remote = [tmp_path/'a'/'nb.ipynb', tmp_path/'b'/'nb.ipynb']
+    for n, item in enumerate(remote):
+        item.parent.mkdir()
+        item.write_text(f"notebook {n}")
+
+    localDir = tmp_path/'local'
+    results = util.getFiles(job, remote, localDir = localDir, overwrite = True, verbose = False)
+
+    assert results[remote[0].as_posix()] == 'pulled'
+    assert results[remote[1].as_posix()].startswith('failed: duplicate local target')
+    assert localDir.joinpath('nb.ipynb').read_text() == 'notebook 0'
+    assert not list(localDir.glob('*.part*'))
+
+
+def test_getFilesSetupFailure(job, tmp_path):
+    # Local dir can't be created for one file, other files are still pulled.
+    remote = [tmp_path/'nb1.ipynb', tmp_path/'nb2.ipynb']
+    for item in remote:
+        item.write_text(item.name)
+
+    tmp_path.joinpath('blocked').write_text('file, not dir')
+    localList = [tmp_path/'blocked'/'nb1.ipynb', tmp_path/'local'/'nb2.ipynb']
+    results = util.getFiles(job, remote, localList = localList, overwrite = True, verbose = False)
+
+    assert results[remote[0].as_posix()].startswith('failed:')
+    assert results[remote[1].as_posix()] == 'pulled'
+    assert localList[1].read_text() == 'nb2.ipynb'